@@ -0,0 +1,114 @@
+from threading import Event, Lock, Thread
+from time import time
+from typing import Callable, List, Tuple
+
+import maps
+
+
+class DoubleBuffer:
+    # A handoff between one producing and one consuming thread. The producer writes into the back slot
+    # and the consumer swaps it out for an empty one, so neither ever sees the other half way through, and
+    # the lock is only held for the swap. combine folds each write into the back slot, by default a
+    # write replaces whatever was there.
+
+    def __init__(self, empty: Callable = lambda: None, combine: Callable = lambda back, value: value):
+        self.empty = empty
+        self.combine = combine
+        self.lock = Lock()
+        self.back = empty()
+
+    def write(self, value):
+        with self.lock:
+            self.back = self.combine(self.back, value)
+
+    def swap(self):
+        with self.lock:
+            front, self.back = self.back, self.empty()
+        return front
+
+
+def extend(back: list, value: list) -> list:
+    back.extend(value)
+    return back
+
+
+class StepperSnapshot:
+    # Everything a renderer needs to start drawing a stepper's map, taken once it has been built.
+
+    def __init__(self, buffers: maps.MapBuffers, plate_types: List[int], plate_num: int):
+        self.buffers: maps.MapBuffers = buffers
+        self.plate_types: List[int] = plate_types
+        self.plate_num: int = plate_num
+
+
+class BackgroundStepper:
+    # Builds a PlateMapStepperInfo and steps it to the end on a worker thread, so a render loop never waits
+    # on generation. The renderer polls: snapshot() hands over the map's buffers once, when it is built,
+    # then claims() and labels() hand over the (point, plate) and (triangle, plate) pairs finished since
+    # the last call. The stepper itself belongs to the worker and is never touched from outside.
+    # A thread rather than a process, the stepper is too big to send back and forth and the heavy parts
+    # are numpy calls. interval slows the steps down to watch the plates grow, cancel() stops the worker
+    # after the step it is on, though building the map can't be interrupted.
+
+    def __init__(self, create: Callable[[], 'maps.PlateMapStepperInfo'], interval: float = 0.0):
+        self.create = create
+        self.interval = interval
+        self.progress: float = 0.0
+        self.error: BaseException = None
+
+        self.snapshots = DoubleBuffer()
+        self.claimed = DoubleBuffer(list, extend)
+        self.labelled = DoubleBuffer(list, extend)
+        self.cancelled = Event()
+        self.finished = Event()
+        self.thread = Thread(target=self.run, name='map-generation', daemon=True)
+
+    def start(self) -> 'BackgroundStepper':
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            stepper = self.create()
+            if self.cancelled.is_set():
+                return
+            self.snapshots.write(StepperSnapshot(stepper.export_buffers(), [plate.type for plate in stepper.plate_data],
+                                                 stepper.plate_num))
+            while not stepper.growth.done and not self.cancelled.is_set():
+                started = time()
+                self.claimed.write(stepper.step())
+                self.progress = stepper.progress
+                self.cancelled.wait(self.interval - (time() - started))
+            if not self.cancelled.is_set():
+                stepper.step()
+                self.labelled.write([(triangle.vertices, plate) for triangle, plate in stepper.triangles])
+                self.progress = 1.0
+        except BaseException as error:
+            self.error = error
+        finally:
+            self.finished.set()
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError("map generation failed") from self.error
+
+    def snapshot(self) -> StepperSnapshot:
+        self.check()
+        return self.snapshots.swap()
+
+    def claims(self) -> List[Tuple[int, int]]:
+        self.check()
+        return self.claimed.swap()
+
+    def labels(self) -> List[Tuple[Tuple[int, int, int], int]]:
+        self.check()
+        return self.labelled.swap()
+
+    @property
+    def done(self) -> bool:
+        return self.finished.is_set()
+
+    def cancel(self, wait: bool = False):
+        self.cancelled.set()
+        if wait:
+            self.thread.join()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import instrument
+import maps
+import parallel
+import point
+import triangulation
+from streams import RandomStream
+
+# Headless timings of the map pipeline, stage by stage. Nothing here needs arcade or a window.
+#   python benchmark.py --sizes 16 64 256 --output results.json
+#   python benchmark.py --baseline results.json
+DEFAULT_SIZES = (16, 32, 64, 128, 256)
+FULL_SIZES = (16, 32, 64, 128, 256, 512, 1000)
+PLATE_NUM = 24
+SEED = 1
+
+DISTRIBUTIONS: Dict[str, Callable[[int, RandomStream], np.ndarray]] = {
+    'uniform': lambda side, stream: point.create_random_coords(side * side, stream),
+    'grid': lambda side, stream: point.create_grid_coords(side, side, stream),
+    'perlin': lambda side, stream: point.create_perlin1D_coords(side * side, stream),
+    'poisson': lambda side, stream: point.create_poisson_coords(point.poisson_radius(side * side), stream, edges=True),
+}
+ORDERS = {'snake': triangulation.SNAKE, 'hilbert': triangulation.HILBERT, 'morton': triangulation.MORTON,
+          'brio': triangulation.BRIO}
+
+
+def measure(function: Callable, repeats: int, memory: bool):
+    # Best of repeats for time, then one extra run under tracemalloc for the peak, since tracing slows
+    # down everything it watches.
+    seconds = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = perf_counter()
+        result = function()
+        seconds = min(seconds, perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run_pipeline(distribution: str, side: int, repeats: int, memory: bool, workers: int = 1,
+                 order: int = triangulation.SNAKE, reorder: int = None) -> List[dict]:
+    stream = RandomStream(SEED)
+    stages = []
+
+    def record(stage: str, function: Callable, count: int = None):
+        # Without a count, the stage's throughput is over the items it returns.
+        seconds, peak, result = measure(function, repeats, memory)
+        count = len(result) if count is None else count
+        stages.append({'stage': stage, 'distribution': distribution, 'size': side, 'n': count,
+                       'seconds': seconds, 'throughput': count / seconds if seconds > 0 else None,
+                       'peak_bytes': peak})
+        return result
+
+    # Poisson sampling only aims for side * side points, so the points made are counted instead.
+    coords = record('points', lambda: DISTRIBUTIONS[distribution](side, stream.substream('points')))
+    if workers == 1:
+        base = record('triangulation', lambda: triangulation.Triangulation(coords, order=order), len(coords))
+    else:
+        base = record('triangulation', lambda: parallel.ParallelTriangulation(coords, workers, order), len(coords))
+    if reorder is not None:
+        # Renumbering an already renumbered triangulation changes nothing, so repeats are fair.
+        record('reorder', lambda: base.reorder(reorder), len(coords))
+    point_map = record('point_map', lambda: maps.PointMap(base), len(coords))
+
+    def grow_plates():
+        growth = maps.PlateGrowth(point_map, maps.seed_plates(point_map, PLATE_NUM, 0.5, stream))
+        growth.grow()
+        return maps.grown_plate_map(growth, SEED)
+
+    plate_map = record('plate_growth', grow_plates, len(coords))
+    record('buffer_data', plate_map.get_buffer_data, len(base.mesh))
+    record('export_buffers', plate_map.export_buffers, len(base.mesh))
+
+    if distribution == 'grid':
+        record('create_plate_map', lambda: maps.create_plate_map(side, side, PLATE_NUM, 0.5, SEED, workers),
+               side * side)
+    return stages
+
+
+def scaling_exponents(results: List[dict]) -> Dict[str, float]:
+    # The slope of log(time) against log(n) for each stage and distribution, 1.0 is linear scaling.
+    series: Dict[str, List[dict]] = {}
+    for result in results:
+        series.setdefault(f"{result['stage']}/{result['distribution']}", []).append(result)
+    exponents = {}
+    for key, entries in series.items():
+        entries = [entry for entry in entries if entry['seconds'] > 0]
+        if len({entry['n'] for entry in entries}) >= 2:
+            slope, _ = np.polyfit(np.log([entry['n'] for entry in entries]),
+                                  np.log([entry['seconds'] for entry in entries]), 1)
+            exponents[key] = float(slope)
+    return exponents
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[dict]:
+    previous = {(entry['stage'], entry['distribution'], entry['size']): entry for entry in baseline['results']}
+    comparisons = []
+    for result in results:
+        old = previous.get((result['stage'], result['distribution'], result['size']))
+        if old is None or not old['seconds']:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        comparisons.append({'stage': result['stage'], 'distribution': result['distribution'],
+                            'size': result['size'], 'ratio': ratio, 'regression': ratio > 1 + tolerance})
+    return comparisons
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the map generation pipeline without a window.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="map sides to run, each map has side*side points")
+    parser.add_argument('--full', action='store_true', help=f"run every size in {FULL_SIZES}")
+    parser.add_argument('--distributions', nargs='+', choices=tuple(DISTRIBUTIONS), default=tuple(DISTRIBUTIONS))
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1, help="processes used to triangulate, 0 for every core")
+    parser.add_argument('--order', choices=tuple(ORDERS), default='snake', help="the order points are inserted in")
+    parser.add_argument('--reorder', choices=('hilbert', 'morton'),
+                        help="renumber the finished triangulation along this curve")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak memory runs")
+    parser.add_argument('--output', help="write the results as json to this file")
+    parser.add_argument('--trace', help="record every stage and write a chrome trace to this file, slows the run")
+    parser.add_argument('--baseline', help="compare against a json file written by --output")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="how much slower than the baseline a stage can be before it counts as a regression")
+    options = parser.parse_args(args)
+
+    results = []
+    with instrument.Recorder() if options.trace else nullcontext() as recorder:
+        for side in FULL_SIZES if options.full else options.sizes:
+            for distribution in options.distributions:
+                for result in run_pipeline(distribution, side, options.repeats, not options.no_memory,
+                                           options.workers or None, ORDERS[options.order],
+                                           ORDERS.get(options.reorder)):
+                    results.append(result)
+                    peak = '' if result['peak_bytes'] is None else f"{result['peak_bytes'] / 2**20:10.2f} MiB"
+                    print(f"{result['stage']:>16} {distribution:>8} {side:>5} {result['seconds']:10.4f} s "
+                          f"{result['throughput'] or 0:14.0f} /s {peak}")
+    if recorder is not None:
+        recorder.write_chrome_trace(options.trace)
+
+    report = {'python': sys.version, 'platform': platform.platform(), 'numpy': np.__version__,
+              'workers': options.workers, 'order': options.order, 'reorder': options.reorder,
+              'results': results, 'scaling': scaling_exponents(results)}
+    for key, exponent in report['scaling'].items():
+        print(f"{key:>28} n^{exponent:.2f}")
+
+    regressions = []
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            report['comparison'] = compare(results, json.load(baseline_file), options.tolerance)
+        for entry in report['comparison']:
+            flag = "REGRESSION" if entry['regression'] else ""
+            print(f"{entry['stage']:>16} {entry['distribution']:>8} {entry['size']:>5} x{entry['ratio']:.2f} {flag}")
+        regressions = [entry for entry in report['comparison'] if entry['regression']]
+
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import json
+from contextlib import nullcontext
+from functools import wraps
+from threading import get_ident, local
+from time import perf_counter
+from typing import Callable, Dict, List
+
+# Named spans and counters for the generation pipeline. Nothing is recorded unless a Recorder is active,
+# and every hook checks that first, so instrumented code only pays a global lookup and a branch:
+#
+#   with instrument.Recorder() as recorder:
+#       maps.create_plate_map(100, 100, 24, seed=1)
+#   recorder.write_chrome_trace('map.json')  # open in chrome://tracing or ui.perfetto.dev
+#
+# Hot loops go further and check active() once, keeping an unrecorded path with no hooks at all.
+ACTIVE: 'Recorder' = None
+NULL_SPAN = nullcontext()
+
+
+class Span:
+    # Times one stage, nested spans on the same thread are recorded with their depth.
+
+    def __init__(self, recorder: 'Recorder', name: str, args: dict):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        self.recorder.depths.value = getattr(self.recorder.depths, 'value', 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        end = perf_counter()
+        recorder = self.recorder
+        recorder.depths.value -= 1
+        record = {'name': self.name, 'start': self.start - recorder.started, 'seconds': end - self.start,
+                  'thread': get_ident(), 'depth': recorder.depths.value, 'args': self.args}
+        recorder.spans.append(record)
+        if recorder.callback is not None:
+            recorder.callback(record)
+        return False
+
+
+class Recorder:
+    # Collects spans, counters and observed values while active. Counters are totals, observations keep
+    # their count, sum, min and max, like the cavity size of every point inserted. callback, if given, is
+    # called with every span as it finishes, from whichever thread ran it.
+
+    def __init__(self, callback: Callable[[dict], None] = None):
+        self.callback = callback
+        self.started = perf_counter()
+        self.spans: List[dict] = []
+        self.counters: Dict[str, float] = {}
+        self.observations: Dict[str, List[float]] = {}
+        self.depths = local()
+        self.previous: 'Recorder' = None
+
+    def __enter__(self) -> 'Recorder':
+        global ACTIVE
+        self.previous, ACTIVE = ACTIVE, self
+        return self
+
+    def __exit__(self, *exc_info):
+        global ACTIVE
+        ACTIVE = self.previous
+        return False
+
+    def span(self, name: str, **args) -> Span:
+        return Span(self, name, args)
+
+    def count(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        summary = self.observations.get(name)
+        if summary is None:
+            self.observations[name] = [1, value, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = min(summary[2], value)
+            summary[3] = max(summary[3], value)
+
+    def totals(self) -> Dict[str, float]:
+        # Seconds spent in each span name, nested spans count toward their parents as well.
+        totals = {}
+        for span in self.spans:
+            totals[span['name']] = totals.get(span['name'], 0.0) + span['seconds']
+        return totals
+
+    def to_json(self) -> dict:
+        return {'spans': self.spans, 'totals': self.totals(), 'counters': self.counters,
+                'observations': {name: {'count': count, 'sum': total, 'mean': total / count, 'min': low,
+                                        'max': high}
+                                 for name, (count, total, low, high) in self.observations.items()}}
+
+    def chrome_trace(self) -> dict:
+        # The Trace Event Format: a complete event for every span and the counters' totals at the end.
+        events = [{'name': span['name'], 'ph': 'X', 'ts': span['start'] * 1e6, 'dur': span['seconds'] * 1e6,
+                   'pid': 0, 'tid': span['thread'], 'args': span['args']} for span in self.spans]
+        end = max((span['start'] + span['seconds'] for span in self.spans), default=0.0)
+        events.extend({'name': name, 'ph': 'C', 'ts': end * 1e6, 'pid': 0, 'tid': 0, 'args': {'value': value}}
+                      for name, value in self.counters.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_json(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.to_json(), file, indent=1, default=str)
+
+    def write_chrome_trace(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file, default=str)
+
+
+def active() -> 'Recorder':
+    return ACTIVE
+
+
+def span(name: str, **args):
+    if ACTIVE is None:
+        return NULL_SPAN
+    return ACTIVE.span(name, **args)
+
+
+def count(name: str, value: float = 1):
+    if ACTIVE is not None:
+        ACTIVE.count(name, value)
+
+
+def observe(name: str, value: float):
+    if ACTIVE is not None:
+        ACTIVE.observe(name, value)
+
+
+def timed(name: str, counter: str = None):
+    # Wraps a function in a span, and adds the length of what it returns to counter if one is named.
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if ACTIVE is None:
+                return function(*args, **kwargs)
+            with ACTIVE.span(name):
+                result = function(*args, **kwargs)
+            if counter is not None:
+                ACTIVE.count(counter, len(result))
+            return result
+        return wrapper
+    return decorate
@@ -0,0 +1,182 @@
+from typing import List
+
+import numpy as np
+
+import instrument
+import maps
+import triangulation
+from mesh import TriangleMesh
+from spatial import MeshIndex
+
+# Levels of detail for a plate map. Level 0 is the map's own mesh, every level after it keeps about a
+# quarter of the vertices of the one before and is triangulated again from them. All levels index into
+# the map's full vertex buffer, so a renderer uploads the vertices and plate values once and only swaps
+# index buffers as the view zooms. Plates are drawn per triangle, not blended across it: every triangle's
+# index buffer entry ends on a vertex of its own plate, which is the vertex a flat shaded attribute is
+# taken from.
+#
+# Vertices are thinned on a grid that doubles its spacing every level, keeping one vertex of each kind,
+# on each plate, in each cell. The kinds are interior, plate boundary and map edge, so boundaries and
+# edges are thinned along their own lines instead of being eaten by the interior around them. Vertices
+# where three plates meet and the corners of the map's hull are always kept. Every edge of a Delaunay
+# triangulation is still an edge of the triangulation of any subset holding both its ends, so edges
+# between kept boundary vertices carry over to the coarser level unchanged.
+INTERIOR, BOUNDARY, EDGE = 0, 1, 2
+
+
+class LODLevel:
+    # One level: the original index of each of its vertices, its triangles in those indices and the plate
+    # of every triangle. error is the furthest, in map units, any vertex of the full map is from the vertex
+    # standing in for it on this level. point_map is only given for the full map's own level, which shares
+    # the map's index instead of building another.
+
+    def __init__(self, vertices: np.ndarray, mesh: TriangleMesh, point_plates: np.ndarray, error: float,
+                 rule: int = maps.MAJORITY, point_map: 'maps.PointMap' = None):
+        self.vertices: np.ndarray = vertices
+        self.point_map = point_map
+        self.mesh: TriangleMesh = mesh
+        self.error: float = error
+        self.point_plates: np.ndarray = point_plates
+        self.triangles: np.ndarray = vertices[mesh.triangles].astype(np.int32)
+        self.triangle_plates, self.boundary_triangles = maps.label_triangles(self.triangles, point_plates, rule)
+        self._index: MeshIndex = None
+
+    def __len__(self):
+        return len(self.triangles)
+
+    @property
+    def index(self) -> MeshIndex:
+        if self._index is None:
+            self._index = self.point_map.index if self.point_map is not None else MeshIndex(self.mesh)
+        return self._index
+
+    def index_buffer(self) -> np.ndarray:
+        # The level's triangles for the map's vertex buffer, like Triangulation.triangle_buffer, each turned
+        # so it ends on a vertex of the triangle's plate. Both the majority and the lowest plate are always on
+        # one of the triangle's vertices, and turning keeps the winding.
+        last = np.argmax(self.point_plates[self.triangles][:, ::-1] == self.triangle_plates[:, None], axis=1)
+        turns = (np.arange(3) - last[:, None]) % 3
+        return np.take_along_axis(self.triangles, turns, axis=1)
+
+    def line_buffer(self) -> np.ndarray:
+        return self.vertices[self.mesh.lines()].astype(np.int32)
+
+    def triangles_at(self, coords: np.ndarray) -> np.ndarray:
+        # The level's triangle under each position, or -1 off the map.
+        return self.index.locate_many(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+
+    def plates_at(self, coords: np.ndarray) -> np.ndarray:
+        # PlateMap.plates_at answered from the level's vertices alone.
+        nearest = self.index.nearest_vertices(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        vertices = np.where(nearest < 0, -1, self.vertices[np.maximum(nearest, 0)])
+        return np.where(vertices < 0, -1, self.point_plates[np.maximum(vertices, 0)])
+
+
+class LODHierarchy:
+    # The levels of a plate map from finest to coarsest.
+
+    def __init__(self, plate_map: 'maps.PlateMap', levels: List[LODLevel]):
+        self.plate_map = plate_map
+        self.levels: List[LODLevel] = levels
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, level: int) -> LODLevel:
+        return self.levels[level]
+
+    def select(self, pixels_per_unit: float, tolerance: float = 1.0) -> int:
+        # The coarsest level whose error covers no more than tolerance pixels at this zoom, pixels_per_unit
+        # being how many pixels one map unit spans on screen.
+        chosen = 0
+        for level, lod in enumerate(self.levels):
+            if lod.error * pixels_per_unit <= tolerance:
+                chosen = level
+        return chosen
+
+    def level_for(self, pixels_per_unit: float, tolerance: float = 1.0) -> LODLevel:
+        return self.levels[self.select(pixels_per_unit, tolerance)]
+
+
+def vertex_kinds(mesh: TriangleMesh, plates: np.ndarray):
+    # The kind of each vertex, and which vertices must be kept: those touching three or more plates and the
+    # corners of the hull, where it turns rather than running straight on.
+    num_coords = len(mesh.coords)
+    neighbors = mesh.vertex_neighbors()
+    rows, others = neighbors.rows(), neighbors.indices.astype(np.int64)
+    across = plates[others] != plates[rows]
+    kinds = np.where(np.bincount(rows[across], minlength=num_coords) > 0, BOUNDARY, INTERIOR)
+    plate_pairs = np.unique(rows[across] * (plates.max() + 2) + plates[others[across]] + 1)
+    pinned = np.bincount(plate_pairs // (plates.max() + 2), minlength=num_coords) >= 2
+
+    # Half-edges without a twin run around the hull, each vertex on it has one leaving and one arriving.
+    hull = np.flatnonzero(mesh.halfedges < 0)
+    starts = mesh.triangles[hull // 3, hull % 3].astype(np.int64)
+    ends = mesh.triangles[hull // 3, (hull % 3 + 1) % 3].astype(np.int64)
+    kinds[starts] = EDGE
+    previous = np.empty(num_coords, dtype=np.int64)
+    previous[ends] = starts
+    before, after = mesh.coords[previous[starts]], mesh.coords[ends]
+    incoming, outgoing = mesh.coords[starts] - before, after - mesh.coords[starts]
+    turn = np.abs(incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0])
+    scale = np.hypot(*incoming.T) * np.hypot(*outgoing.T)
+    pinned[starts[turn > 1e-9 * scale]] = True
+    return kinds, pinned
+
+
+def decimate(mesh: TriangleMesh, plates: np.ndarray, spacing: float):
+    # The vertices of mesh kept on a grid of the given spacing, as indices into it, along with the kept
+    # vertex standing in for each vertex of mesh, -1 for those in no triangle.
+    used = np.flatnonzero(mesh.vertex_neighbors().degrees() > 0)
+    kinds, pinned = vertex_kinds(mesh, plates)
+    coords = mesh.coords[used]
+    low = coords.min(axis=0)
+    cells = np.floor((coords - low) / spacing).astype(np.int64)
+    columns = cells[:, 0].max() + 1
+    num_plates = plates.max() + 2
+    keys = ((cells[:, 1] * columns + cells[:, 0]) * num_plates + plates[used] + 1) * 3 + kinds[used]
+    # The vertex nearest its cell's centre stands in for the rest of its key.
+    offsets = coords - (low + (cells + 0.5) * spacing)
+    order = np.lexsort(((offsets ** 2).sum(axis=1), keys))
+    starts = np.append(True, keys[order][1:] != keys[order][:-1])
+    firsts = order[starts]
+    stand_ins = np.full(len(mesh.coords), -1, dtype=np.int64)
+    stand_ins[used[order]] = used[firsts[np.cumsum(starts) - 1]]
+    stand_ins[used[pinned[used]]] = used[pinned[used]]
+    return np.union1d(used[firsts], used[pinned[used]]), stand_ins
+
+
+@instrument.timed('lod.build')
+def build_lod(plate_map: 'maps.PlateMap', min_triangles: int = 2000, max_levels: int = 16,
+              rule: int = maps.MAJORITY) -> LODHierarchy:
+    # Adds levels until one has no more than min_triangles triangles, or thinning stops making a
+    # difference because what is left is all boundaries and corners.
+    mesh = plate_map.map.triangulation.mesh
+    point_plates = np.asarray(plate_map.point_plates)
+    vertices = np.arange(len(mesh.coords), dtype=np.int64)
+    levels = [LODLevel(vertices, mesh, point_plates, 0.0, rule, plate_map.map)]
+
+    used = np.flatnonzero(mesh.vertex_neighbors().degrees() > 0)
+    # The vertex of the current level standing in for each used vertex of the full map.
+    stand_ins = used.copy()
+    extent = np.ptp(mesh.coords[used], axis=0) if len(used) else np.ones(2)
+    spacing = np.sqrt(extent.prod() / max(len(used), 1))
+    while len(levels) < max_levels and len(levels[-1]) > min_triangles:
+        spacing *= 2.0
+        level = levels[-1]
+        plates = np.where(level.vertices >= 0, point_plates[level.vertices], -1)
+        kept, level_stand_ins = decimate(level.mesh, plates, spacing)
+        kept = level.vertices[kept]
+        if len(kept) > 0.9 * len(level.vertices) or len(kept) < 3:
+            break
+        # Level vertices are original indices, so the stand-ins are mapped through them both ways.
+        local = np.full(len(mesh.coords), -1, dtype=np.int64)
+        local[level.vertices[level.vertices >= 0]] = np.flatnonzero(level.vertices >= 0)
+        stand_ins = level.vertices[level_stand_ins[local[stand_ins]]]
+        error = float(np.hypot(*(mesh.coords[used] - mesh.coords[stand_ins]).T).max(initial=0.0))
+        with instrument.span('lod.level', level=len(levels), vertices=len(kept)):
+            coarse = triangulation.Triangulation(mesh.coords[kept], order=triangulation.BRIO)
+        # Only the first len(kept) points are the level's own, the super triangle's come after them.
+        vertices = np.append(kept, np.full(len(coarse.mesh.coords) - len(kept), -1))
+        levels.append(LODLevel(vertices, coarse.mesh, point_plates, error, rule))
+    return LODHierarchy(plate_map, levels)
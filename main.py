@@ -13,6 +13,10 @@ class Window(arcade.Window):
         arcade.start_render()
         self.sample.draw()
 
+    def on_mouse_scroll(self, x: int, y: int, scroll_x: int, scroll_y: int):
+        if hasattr(self.sample, 'zoom_by'):
+            self.sample.zoom_by(1.25 ** scroll_y)
+
 
 def main():
     window = Window()
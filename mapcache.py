@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import struct
+from time import time
+from typing import Dict, Tuple
+
+import numpy as np
+
+import maps
+from mesh import TriangleMesh, CSRGraph
+from triangulation import Triangulation
+
+# A map file is a fixed header, a json description of the arrays and then the raw arrays, each starting on
+# a 64 byte boundary so they can be memory-mapped straight from the file:
+#   magic (8 bytes) | format version (uint32) | json length (uint32) | json | padding | arrays...
+# Offsets in the json are from the start of the first array. Files from another version are never read.
+MAGIC = b'DLNYMAP\0'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+ALIGNMENT = 64
+SUFFIX = '.map'
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_map_file(path: str, meta: dict, arrays: Dict[str, np.ndarray]):
+    # Written to a temporary file first and moved into place, so a reader never sees half a map.
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+        offset = align(offset + array.nbytes)
+    description = json.dumps({'meta': meta, 'arrays': layout}).encode()
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(description)))
+        file.write(description)
+        start = align(HEADER.size + len(description))
+        for name, array in arrays.items():
+            file.seek(start + layout[name]['offset'])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(start + offset)
+    os.replace(temporary, path)
+
+
+def read_map_file(path: str) -> Tuple[dict, Dict[str, np.ndarray]]:
+    # The arrays are copy-on-write memory maps: pages are read from disk when first touched, and edits to
+    # a loaded map stay in memory instead of changing the file.
+    # A truncated file is reported like any other broken one, as a ValueError.
+    with open(path, 'rb') as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a map file.")
+        magic, version, length = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a map file.")
+        if version != VERSION:
+            raise ValueError(f"{path} is a version {version} map file, only version {VERSION} can be read.")
+        text = file.read(length)
+        if len(text) < length:
+            raise ValueError(f"{path} ends inside its description.")
+        description = json.loads(text)
+        size = os.fstat(file.fileno()).st_size
+    start = align(HEADER.size + length)
+
+    arrays = {}
+    for name, layout in description['arrays'].items():
+        dtype, shape = np.dtype(layout['dtype']), tuple(layout['shape'])
+        if start + layout['offset'] + dtype.itemsize * int(np.prod(shape, dtype=np.int64)) > size:
+            raise ValueError(f"{path} ends inside its {name} array.")
+        if not np.prod(shape, dtype=np.int64):
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='c', offset=start + layout['offset'], shape=shape)
+    return description['meta'], arrays
+
+
+def point_map_arrays(point_map: maps.PointMap) -> Dict[str, np.ndarray]:
+    mesh = point_map.triangulation.mesh
+    return {'coords': mesh.coords, 'triangles': mesh.triangles, 'halfedges': mesh.halfedges,
+            'circumcircles': mesh.circumcircles, 'areas': mesh.areas,
+            'neighbor_offsets': point_map.neighbors.offsets, 'neighbor_indices': point_map.neighbors.indices,
+            'child_offsets': point_map.child_triangles.offsets, 'child_indices': point_map.child_triangles.indices}
+
+
+def plate_map_arrays(plate_map: maps.PlateMap) -> Dict[str, np.ndarray]:
+    # The plates' points and triangles are stored as compressed rows, one row a plate.
+    plates = plate_map.plates
+    points = CSRGraph.from_pairs(np.repeat(np.arange(len(plates)), [len(plate.point_indices) for plate in plates]),
+                                 np.concatenate([plate.point_indices for plate in plates] + [np.zeros(0, np.int64)]),
+                                 len(plates))
+    triangles = CSRGraph.from_pairs(
+        np.repeat(np.arange(len(plates)), [len(plate.triangle_indices) for plate in plates]),
+        np.concatenate([plate.triangle_indices for plate in plates] + [np.zeros(0, np.int64)]), len(plates))
+    arrays = point_map_arrays(plate_map.map)
+    arrays.update({'point_plates': plate_map.point_plates,
+                   'plate_types': np.array([plate.type for plate in plates], dtype=np.int8),
+                   'plate_areas': plate_map.stats.areas,
+                   'plate_point_offsets': points.offsets, 'plate_point_indices': points.indices,
+                   'plate_triangle_offsets': triangles.offsets, 'plate_triangle_indices': triangles.indices})
+    return arrays
+
+
+def save_point_map(path: str, point_map: maps.PointMap, meta: dict = None):
+    triangulation = point_map.triangulation
+    write_map_file(path, dict(meta or {}, kind='point_map', super_indices=list(triangulation.super_indices),
+                              engine=triangulation.engine), point_map_arrays(point_map))
+
+
+def save_plate_map(path: str, plate_map: maps.PlateMap, meta: dict = None):
+    triangulation = plate_map.map.triangulation
+    write_map_file(path, dict(meta or {}, kind='plate_map', seed=plate_map.seed,
+                              super_indices=list(triangulation.super_indices), engine=triangulation.engine),
+                   plate_map_arrays(plate_map))
+
+
+def build_point_map(meta: dict, arrays: Dict[str, np.ndarray]) -> maps.PointMap:
+    mesh = TriangleMesh.from_arrays(arrays['coords'], arrays['triangles'], arrays['halfedges'],
+                                    arrays['circumcircles'], arrays['areas'])
+    return maps.PointMap.from_graphs(Triangulation.from_mesh(mesh, meta['super_indices'], meta['engine']),
+                                     CSRGraph(arrays['neighbor_offsets'], arrays['neighbor_indices']),
+                                     CSRGraph(arrays['child_offsets'], arrays['child_indices']))
+
+
+def load_point_map(path: str) -> maps.PointMap:
+    return build_point_map(*read_map_file(path))
+
+
+def build_plate_map(meta: dict, arrays: Dict[str, np.ndarray]) -> maps.PlateMap:
+    point_map = build_point_map(meta, arrays)
+    points = CSRGraph(arrays['plate_point_offsets'], arrays['plate_point_indices'])
+    triangles = CSRGraph(arrays['plate_triangle_offsets'], arrays['plate_triangle_indices'])
+    plates = []
+    for index, (plate_type, area) in enumerate(zip(arrays['plate_types'].tolist(), arrays['plate_areas'].tolist())):
+        plate = maps.Plate.from_indices(point_map, points[index], plate_type, triangles[index])
+        plate.area = area
+        plates.append(plate)
+    return maps.PlateMap(point_map, tuple(plates), meta['seed'], arrays['point_plates'])
+
+
+def load_plate_map(path: str) -> maps.PlateMap:
+    meta, arrays = read_map_file(path)
+    if meta['kind'] != 'plate_map':
+        raise ValueError(f"{path} holds a {meta['kind']}, not a plate_map.")
+    return build_plate_map(meta, arrays)
+
+
+class MapCache:
+    # Generated maps kept on disk in one directory, keyed by what they were generated from. A map is
+    # written once and every later request for it is memory-mapped back, so even a huge map opens almost
+    # straight away. Files are dropped once they are older than max_age seconds since they were last used,
+    # or, oldest first, while the directory holds more than max_bytes.
+    # Maps without a plain number seed are random every time, or can't be told apart by their seed, so
+    # they are never cached.
+
+    def __init__(self, directory: str, max_bytes: int = None, max_age: float = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @staticmethod
+    def key(kind: str, **params) -> str:
+        description = json.dumps({'kind': kind, 'version': VERSION, 'params': params}, sort_keys=True)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    @staticmethod
+    def cacheable(seed) -> bool:
+        return isinstance(seed, (int, float))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def new_path(self, key: str) -> str:
+        # The directory is only made once there is a map to write to it.
+        os.makedirs(self.directory, exist_ok=True)
+        return self.path(key)
+
+    def load(self, key: str, loader):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            loaded = loader(path)
+        except (ValueError, KeyError, OSError):
+            # Left by another version or broken, so it is as good as missing.
+            self.remove(path)
+            return None
+        os.utime(path)
+        return loaded
+
+    def remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def point_map(self, map_width: int, map_height: int, seed=None, workers: int = 1) -> maps.PointMap:
+        if not self.cacheable(seed):
+            return maps.create_point_map(map_width, map_height, seed, workers)
+        params = dict(map_width=map_width, map_height=map_height, seed=seed)
+        key = self.key('point_map', **params)
+        point_map = self.load(key, load_point_map)
+        if point_map is None:
+            point_map = maps.create_point_map(map_width, map_height, seed, workers)
+            save_point_map(self.new_path(key), point_map, params)
+            self.evict()
+        return point_map
+
+    def plate_map(self, map_width: int, map_height: int, plate_num: int, plate_dist: float = None, seed=None,
+                  workers: int = 1) -> maps.PlateMap:
+        if not self.cacheable(seed):
+            return maps.create_plate_map(map_width, map_height, plate_num, plate_dist, seed, workers)
+        params = dict(map_width=map_width, map_height=map_height, plate_num=plate_num, plate_dist=plate_dist,
+                      seed=seed)
+        key = self.key('plate_map', **params)
+        plate_map = self.load(key, load_plate_map)
+        if plate_map is None:
+            plate_map = maps.create_plate_map(map_width, map_height, plate_num, plate_dist, seed, workers)
+            save_plate_map(self.new_path(key), plate_map, params)
+            self.evict()
+        return plate_map
+
+    def entries(self):
+        # (path, size, last used) for every cached map, least recently used first.
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        entries = self.entries()
+        if self.max_age is not None:
+            cutoff = time() - self.max_age
+            for entry in [entry for entry in entries if entry[2] < cutoff]:
+                self.remove(entry[0])
+                entries.remove(entry)
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                self.remove(path)
+                total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            self.remove(path)
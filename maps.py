@@ -1,219 +1,642 @@
-import random
-from time import time
-from typing import List, Dict, Set, Tuple
-from array import array
+from heapq import heapify, heappop, heappush
+from math import inf
+from typing import Dict, List, Set, Tuple
 
+import numpy as np
+
+import instrument
 import point
 import triangulation
+import parallel
 import perlin
+from mesh import CSRGraph, TriangleMesh, unique_inverse
+from spatial import MeshIndex
+from streams import as_stream
 
 LAND, SEA = 0, 1
+# How a triangle whose vertices are on different plates picks its plate: the plate holding most of its
+# vertices, falling back to the lowest when all three differ, or always the lowest.
+MAJORITY, LOWEST = 0, 1
+GROWTH_RATE = 0.001  # how much squared distance a land plate can cover per growth round, sea plates grow twice as fast.
 
 
 class MapPoint:
+    __slots__ = ('pos', 'index', 'map')
 
-    def __init__(self, pos: point.Point, index: int):
+    def __init__(self, pos: point.Point, index: int, point_map: 'PointMap' = None):
         self.pos = pos
         self.index = index
-        self.child_triangles: Set[int] = set()
-        self.neighbors: Set[int] = set()
+        self.map = point_map
+
+    # Both are views into the map's graphs, built when asked for.
+    @property
+    def child_triangles(self) -> Set[int]:
+        return set(self.map.child_triangles[self.index].tolist())
+
+    @property
+    def neighbors(self) -> Set[int]:
+        return set(self.map.neighbors[self.index].tolist())
 
 
 class PointMap:
 
     def __init__(self, base_triangulation: triangulation.Triangulation):
         self.triangulation: triangulation.Triangulation = base_triangulation
-        self.points: Tuple[MapPoint] = tuple()
+        self._points: Tuple[MapPoint] = None
+        self.neighbors: CSRGraph = None
+        self.child_triangles: CSRGraph = None
+        self._index: MeshIndex = None
 
         self.generate_map_points()
 
+    @classmethod
+    def from_graphs(cls, base_triangulation: triangulation.Triangulation, neighbors: CSRGraph,
+                    child_triangles: CSRGraph):
+        # A point map around graphs that were already built, like ones loaded from a map cache file.
+        point_map = cls.__new__(cls)
+        point_map.triangulation = base_triangulation
+        point_map._points = None
+        point_map.neighbors = neighbors
+        point_map.child_triangles = child_triangles
+        point_map._index = None
+        return point_map
+
+    @property
+    def points(self) -> Tuple[MapPoint]:
+        # Map points are made the first time they are asked for, most work only needs the graphs.
+        if self._points is None:
+            self._points = tuple(MapPoint(p, index, self) for index, p in enumerate(self.triangulation.points))
+        return self._points
+
+    @property
+    def index(self) -> MeshIndex:
+        # Built the first time a position is looked up, and again after the triangulation is edited.
+        if self._index is None:
+            self._index = MeshIndex(self.triangulation.mesh)
+        return self._index
+
+    @instrument.timed('maps.point_graph')
     def generate_map_points(self):
-        self.points = tuple(MapPoint(p, index) for index, p in enumerate(self.triangulation.points))
-        for index, triangle in enumerate(self.triangulation.triangles):
-            for vertex in triangle.vertices:
-                self.points[vertex].child_triangles.add(index)
-                others = list(triangle.vertices[:])
-                others.remove(vertex)
-                self.points[vertex].neighbors.update(others)
+        self._points = None
+        self.neighbors = self.triangulation.mesh.vertex_neighbors()
+        self.child_triangles = self.triangulation.mesh.vertex_triangles()
+
+    def update(self, edit: triangulation.TriangulationEdit):
+        # Picks up an incremental edit of the triangulation. New points get map points and only the graph
+        # rows of points on a destroyed, created or moved triangle are worked out again, from the rows
+        # their triangles had before the edit and the rows the edit filled.
+        if self._points is not None:
+            points = self.triangulation.points
+            self._points += tuple(MapPoint(points[index], index, self)
+                                  for index in range(len(self._points), len(points)))
+        mesh = self.triangulation.mesh
+        num_points, num_triangles = len(mesh.coords), len(mesh)
+        filled = np.union1d(edit.created, edit.moved[:, 1]).astype(np.int64)
+        changed = np.union1d(edit.destroyed.reshape(-1), mesh.triangles[filled].reshape(-1)).astype(np.int64)
+
+        # Old rows are renamed where they were moved and dropped where their point is no longer a corner.
+        old = self.child_triangles
+        rows, owners = old.gather(changed[changed < len(old)])
+        rows = rows.astype(np.int64)
+        if len(edit.moved):
+            order = np.argsort(edit.moved[:, 0])
+            sources, targets = edit.moved[order, 0], edit.moved[order, 1]
+            found = np.minimum(np.searchsorted(sources, rows), len(sources) - 1)
+            rows = np.where(sources[found] == rows, targets[found], rows)
+        valid = rows < num_triangles
+        rows, owners = rows[valid], owners[valid]
+        valid = (mesh.triangles[rows] == owners[:, None]).any(axis=1)
+        corners = mesh.triangles[filled].reshape(-1).astype(np.int64)
+        keys = np.unique(np.concatenate((owners[valid] * num_triangles + rows[valid],
+                                         corners * num_triangles + np.repeat(filled, 3))))
+        owners, rows = keys // num_triangles, keys % num_triangles
+        local = np.searchsorted(changed, owners)
+        self.child_triangles = old.replace_rows(changed, CSRGraph.from_pairs(local, rows, len(changed)), num_points)
+
+        # A point's neighbors are the other two corners of each of its triangles.
+        corners = mesh.triangles[rows].astype(np.int64)
+        others = corners[corners != owners[:, None]].reshape(-1, 2)
+        keys = np.unique(np.repeat(local, 2) * num_points + others.reshape(-1))
+        neighbors = CSRGraph.from_pairs(keys // num_points, keys % num_points, len(changed))
+        self.neighbors = self.neighbors.replace_rows(changed, neighbors, num_points)
+        self._index = None
+
+    def triangle_at(self, x: float, y: float) -> int:
+        return self.index.locate(x, y)
+
+    def triangles_at(self, coords: np.ndarray) -> np.ndarray:
+        return self.index.locate_many(coords)
+
+    def nearest_point(self, x: float, y: float) -> int:
+        return self.index.nearest_vertex(x, y)
+
+    def nearest_points(self, coords: np.ndarray) -> np.ndarray:
+        return self.index.nearest_vertices(coords)
+
+    def edge_costs(self) -> np.ndarray:
+        # The squared length of every neighbor edge, lined up with neighbors.indices.
+        coords = self.triangulation.mesh.coords
+        return ((coords[self.neighbors.rows()] - coords[self.neighbors.indices])**2).sum(axis=1)
 
 
 class Plate:
 
-    def __init__(self, points: Tuple[MapPoint], cont_type: int = LAND):
-        self.points: Tuple[MapPoint] = points
-        self.triangles: Tuple[triangulation.Triangle] = tuple()
-        self.area = 0
+    def __init__(self, points: Tuple[MapPoint], cont_type: int = LAND, triangle_indices: np.ndarray = None):
+        self._points: Tuple[MapPoint] = points
+        self._point_indices: np.ndarray = None
+        self.point_map: PointMap = None
+        self._triangles: Tuple[triangulation.Triangle] = None
+        self.triangle_indices: np.ndarray = (np.zeros(0, dtype=np.int32) if triangle_indices is None
+                                             else triangle_indices)
+        self._area: float = None
+        # Set by the PlateMap the plate belongs to, whose stats give the plate its area.
+        self.plate_map: 'PlateMap' = None
         self.type = cont_type
+        self._area_sums: Tuple[Tuple, np.ndarray] = None
+
+    @classmethod
+    def from_indices(cls, point_map: PointMap, point_indices: np.ndarray, cont_type: int = LAND,
+                     triangle_indices: np.ndarray = None):
+        # A plate that only holds its points' indices until the map points themselves are needed.
+        plate = cls(None, cont_type, triangle_indices)
+        plate._point_indices = point_indices
+        plate.point_map = point_map
+        return plate
+
+    @property
+    def points(self) -> Tuple[MapPoint]:
+        if self._points is None:
+            points = self.point_map.points
+            self._points = tuple(points[index] for index in self._point_indices.tolist())
+        return self._points
+
+    @property
+    def area(self) -> float:
+        # Worked out for every plate of the map at once the first time any of them is asked.
+        if self._area is None and self.plate_map is not None:
+            self.plate_map.stats
+        return self._area or 0
+
+    @area.setter
+    def area(self, area: float):
+        self._area = area
+
+    @property
+    def point_indices(self) -> np.ndarray:
+        if self._point_indices is None:
+            self._point_indices = np.array([map_point.index for map_point in self._points], dtype=np.int64)
+        return self._point_indices
+
+    @property
+    def triangles(self) -> Tuple[triangulation.Triangle]:
+        # Made from triangle_indices when first asked for, unless the plate was given Triangle objects.
+        if self._triangles is None:
+            if self.point_map is None or not len(self.triangle_indices):
+                return tuple()
+            triangles = self.point_map.triangulation.triangles
+            self._triangles = tuple(triangles[index] for index in self.triangle_indices.tolist())
+        return self._triangles
+
+    @triangles.setter
+    def triangles(self, triangles: Tuple[triangulation.Triangle]):
+        self._triangles = triangles
+
+    def area_sums(self) -> np.ndarray:
+        # Running totals of the triangles' areas, redone whenever the plate is given new triangles. They are
+        # read straight from the mesh while the plate only has indices.
+        if self._triangles is None and self.point_map is not None:
+            key, areas = self.triangle_indices, self.point_map.triangulation.mesh.areas[self.triangle_indices]
+        else:
+            key, areas = self.triangles, [triangle.area for triangle in self.triangles]
+        if self._area_sums is None or self._area_sums[0] is not key:
+            self._area_sums = key, np.cumsum(np.abs(areas))
+        return self._area_sums[1]
+
+    def pick_triangles_by_area(self, values: np.ndarray) -> np.ndarray:
+        # The index into triangles picked by each value in [0, 1], each triangle as likely as its share of
+        # the plate's area.
+        values = np.asarray(values, dtype=np.float64)
+        if (values > 1.0).any():
+            raise IndexError(f"{values.max()} is greater than 1.0 which is invalid.")
+        sums = self.area_sums()
+        if not len(sums):
+            raise IndexError("the plate has no triangles to pick from.")
+        return np.minimum(np.searchsorted(sums, values * sums[-1]), len(sums) - 1)
 
     def pick_triangle_by_area(self, value: float):
-        scaled_value = value*self.area
-        for triangle in self.triangles:
-            scaled_value -= triangle.area
-            if scaled_value <= 0:
-                return triangle
-        raise IndexError(f"{value} is greater than 1.0 which is invalid.")
+        return self.triangles[int(self.pick_triangles_by_area(np.array([value]))[0])]
 
 
 class PlateGenData:
 
-    def __init__(self, seed_point, plate_type: int, plate_index):
+    def __init__(self, seed_index: int, plate_type: int, plate_index):
         self.index = plate_index
 
-        self.seed_point = seed_point
-        self.points: Set[MapPoint] = {seed_point}
-        self.point_indices: Set[int] = {seed_point.index}
+        self.seed_index = seed_index
 
         self.type = plate_type
-
-        self.shell_points: Set[MapPoint] = {seed_point}
-        self.cost = 0
-
-    def add(self, new_point):
-        self.points.add(new_point)
-        self.shell_points.add(new_point)
+        self.rate = GROWTH_RATE + GROWTH_RATE * plate_type
+
+
+class PlateGrowth:
+    # Multi-source Dijkstra over the map: every plate floods out from its seed point and each point goes to
+    # whichever plate reaches it first. Crossing an edge takes its squared length over the plate's rate,
+    # in growth rounds, so the partition only depends on the map and the rates, never on how it's stepped.
+    # Which plate has each point is only kept in owners, the plates are made from it once growth is done.
+
+    def __init__(self, point_map: PointMap, plate_data: List[PlateGenData]):
+        self.point_map = point_map
+        self.plate_data = plate_data
+        self.owners: List[int] = [-1] * len(point_map.neighbors)
+        # The heap loop is scalar, so it reads the graph arrays as plain lists.
+        self.offsets: List[int] = point_map.neighbors.offsets.tolist()
+        self.neighbors: List[int] = point_map.neighbors.indices.tolist()
+        self.costs: List[float] = point_map.edge_costs().tolist()
+        self.rates: List[float] = [plate.rate for plate in plate_data]
+
+        self.frontier = [(0.0, plate.seed_index, plate.index) for plate in plate_data]
+        heapify(self.frontier)
+
+    @property
+    def done(self):
+        return not self.frontier
+
+    @instrument.timed('maps.plate_growth')
+    def grow(self, until: float = inf) -> List[Tuple[int, int]]:
+        frontier, owners, rates = self.frontier, self.owners, self.rates
+        offsets, neighbors, costs = self.offsets, self.neighbors, self.costs
+        claimed = []
+        while frontier and frontier[0][0] <= until:
+            time, index, plate = heappop(frontier)
+            if owners[index] >= 0:
+                continue
+            owners[index] = plate
+            claimed.append((index, plate))
+
+            rate = rates[plate]
+            for edge in range(offsets[index], offsets[index+1]):
+                neighbor = neighbors[edge]
+                if owners[neighbor] < 0:
+                    heappush(frontier, (time + costs[edge] / rate, neighbor, plate))
+        instrument.count('maps.points_claimed', len(claimed))
+        return claimed
+
+
+class MapBuffers:
+    # Contiguous typed arrays for the gpu, sharing one vertex per map point.
+
+    def __init__(self, positions: np.ndarray, plates: np.ndarray, triangles: np.ndarray, lines: np.ndarray):
+        self.positions: np.ndarray = positions
+        self.plates: np.ndarray = plates
+        self.triangles: np.ndarray = triangles
+        self.lines: np.ndarray = lines
+
+
+def dirty_ranges(indices: np.ndarray, max_gap: int = 64) -> List[Tuple[int, int]]:
+    # The [start, end) runs covering the changed rows of a buffer, for uploading only those. Runs closer
+    # than max_gap rows are merged, rewriting a few unchanged rows is cheaper than another upload.
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    if not len(indices):
+        return []
+    breaks = np.flatnonzero(np.diff(indices) > max_gap)
+    starts = np.append(indices[0], indices[breaks + 1])
+    ends = np.append(indices[breaks], indices[-1]) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+@instrument.timed('maps.label_triangles')
+def label_triangles(triangles: np.ndarray, point_plates: np.ndarray, rule: int = MAJORITY):
+    # The plate of every triangle from its vertices' plates, along with which triangles lie across a
+    # boundary, having vertices on more than one plate. Vertices without a plate don't get a vote, a
+    # triangle with none on a plate gets -1.
+    plates = np.asarray(point_plates)[triangles]
+    boundary = (plates != plates[:, :1]).any(axis=1)
+    unclaimed = np.iinfo(plates.dtype).max
+    lowest = np.where(plates < 0, unclaimed, plates).min(axis=1)
+    lowest = np.where(lowest == unclaimed, -1, lowest)
+    if rule == LOWEST:
+        return lowest, boundary
+    if rule != MAJORITY:
+        raise ValueError(f"{rule} is not a triangle labelling rule.")
+    a, b, c = plates.T
+    majority = np.where((a == b) | (a == c), a, np.where(b == c, b, -1))
+    return np.where(majority < 0, lowest, majority), boundary
+
+
+class PlateStats:
+    # Per plate totals and the boundaries between plates, see plate_stats. Boundary line i runs through the
+    # vertices boundary_lines[i] with plate boundary_plates[i, 0] on its right and boundary_plates[i, 1],
+    # the higher of the two, on its left. A closed line ends on the vertex it started from.
+
+    def __init__(self, areas: np.ndarray, perimeters: np.ndarray, centroids: np.ndarray, point_counts: np.ndarray,
+                 boundary_plates: np.ndarray, boundary_lines: CSRGraph):
+        self.areas: np.ndarray = areas
+        self.perimeters: np.ndarray = perimeters
+        self.centroids: np.ndarray = centroids
+        self.point_counts: np.ndarray = point_counts
+        self.boundary_plates: np.ndarray = boundary_plates
+        self.boundary_lines: CSRGraph = boundary_lines
+
+        self.pair_lines: Dict[Tuple[int, int], List[int]] = {}
+        for line, pair in enumerate(map(tuple, boundary_plates.tolist())):
+            self.pair_lines.setdefault(pair, []).append(line)
+
+    def lines_between(self, first: int, second: int) -> List[np.ndarray]:
+        # The vertices of every line between two plates, the lower plate on the right.
+        pair = (first, second) if first < second else (second, first)
+        return [self.boundary_lines[line] for line in self.pair_lines.get(pair, [])]
+
+
+@instrument.timed('maps.plate_stats')
+def plate_stats(mesh: TriangleMesh, point_plates: np.ndarray, triangle_plates: np.ndarray, num_plates: int) -> PlateStats:
+    # Everything in one pass over the labelled triangles and their half-edges. A half-edge whose twin is on
+    # another plate, or missing on the map's edge, counts toward its plate's perimeter, and the ones
+    # between two plates are chained into lines.
+    coords, triangles = mesh.coords, mesh.triangles
+    labelled = triangle_plates >= 0
+    plates = triangle_plates[labelled]
+    areas = np.abs(mesh.areas[labelled])
+    area_sums = np.bincount(plates, areas, num_plates)
+    weighted = coords[triangles[labelled]].mean(axis=1) * areas[:, None]
+    centroids = np.column_stack((np.bincount(plates, weighted[:, 0], num_plates),
+                                 np.bincount(plates, weighted[:, 1], num_plates)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids /= area_sums[:, None]
+    point_counts = np.bincount(point_plates[point_plates >= 0], minlength=num_plates)
+
+    halfedges = np.flatnonzero(np.repeat(labelled, 3))
+    own = triangle_plates[halfedges // 3]
+    twins = mesh.halfedges[halfedges]
+    other = np.where(twins < 0, -1, triangle_plates[twins // 3])
+    starts = triangles.reshape(-1)[halfedges].astype(np.int64)
+    ends = triangles[halfedges // 3, (halfedges % 3 + 1) % 3].astype(np.int64)
+    crossing = own != other
+    lengths = np.sqrt(((coords[ends[crossing]] - coords[starts[crossing]]) ** 2).sum(axis=1))
+    perimeters = np.bincount(own[crossing], lengths, num_plates)
+
+    # Triangles are clockwise, so each kept half-edge has its own (lower) plate on its right and every
+    # edge between the same two plates points the same way along the boundary.
+    between = crossing & (other > own)
+    own, other, starts, ends = own[between], other[between], starts[between], ends[between]
+    pairs = own * num_plates + other
+    num_points = len(coords)
+    start_keys, end_keys = pairs * num_points + starts, pairs * num_points + ends
+    order = np.argsort(start_keys, kind='stable')
+    sorted_starts, sorted_ends = start_keys[order], np.sort(end_keys)
+    first = np.searchsorted(sorted_starts, end_keys)
+    leaving = np.searchsorted(sorted_starts, end_keys, 'right') - first
+    arriving = np.searchsorted(sorted_ends, end_keys, 'right') - np.searchsorted(sorted_ends, end_keys)
+    # A line only carries on through a vertex with one way in and one way out, so where a plate pinches
+    # off, or three plates meet, lines end.
+    follows = np.where((leaving == 1) & (arriving == 1), order[np.minimum(first, len(order) - 1)], -1)
+    has_previous = np.zeros(len(follows), dtype=bool)
+    has_previous[follows[follows >= 0]] = True
+
+    follows_list, starts_list, ends_list = follows.tolist(), starts.tolist(), ends.tolist()
+    visited = [False] * len(follows_list)
+    line_pairs, rows, entries = [], [], []
+    # Open lines from their first edge, then whatever is left is closed loops.
+    for edge in np.concatenate((np.flatnonzero(~has_previous), np.flatnonzero(has_previous))).tolist():
+        if visited[edge]:
+            continue
+        line = len(line_pairs)
+        line_pairs.append((int(own[edge]), int(other[edge])))
+        rows.append(line)
+        entries.append(starts_list[edge])
+        while edge >= 0 and not visited[edge]:
+            visited[edge] = True
+            rows.append(line)
+            entries.append(ends_list[edge])
+            edge = follows_list[edge]
+
+    boundary_lines = CSRGraph.from_pairs(np.array(rows, dtype=np.int64), np.array(entries, dtype=np.int64),
+                                         len(line_pairs))
+    return PlateStats(area_sums, perimeters, centroids, point_counts,
+                      np.array(line_pairs, dtype=np.int64).reshape(-1, 2), boundary_lines)
 
 
 class PlateMap:
 
-    def __init__(self, point_map, plates):
+    def __init__(self, point_map, plates, seed=None, point_plates: np.ndarray = None,
+                 triangle_plates: np.ndarray = None, boundary_triangles: np.ndarray = None):
         self.map: PointMap = point_map
         self.plates: List[Plate] = plates
+        self.seed = seed
+        for plate in plates:
+            plate.plate_map = self
+
+        self.point_plates = point_plates
+        if point_plates is None:
+            self.point_plates = np.full(len(point_map.neighbors), -1, dtype=np.int32)
+            for index, plate in enumerate(plates):
+                self.point_plates[plate.point_indices] = index
+        self._triangle_plates: np.ndarray = triangle_plates
+        self._boundary_triangles: np.ndarray = boundary_triangles
+        self._stats: PlateStats = None
+
+    def label_triangles(self):
+        if self._triangle_plates is None:
+            self._triangle_plates, self._boundary_triangles = label_triangles(self.map.triangulation.mesh.triangles,
+                                                                              self.point_plates)
+
+    @property
+    def triangle_plates(self) -> np.ndarray:
+        # The plate of every triangle, by majority unless the map was made with another rule.
+        self.label_triangles()
+        return self._triangle_plates
+
+    @property
+    def boundary_triangles(self) -> np.ndarray:
+        # Whether each triangle has vertices on more than one plate.
+        self.label_triangles()
+        return self._boundary_triangles
+
+    @property
+    def stats(self) -> PlateStats:
+        # Worked out the first time it's needed, which is also when the plates get their areas, so reading
+        # a plate's area works it out as well.
+        if self._stats is None:
+            self._stats = plate_stats(self.map.triangulation.mesh, self.point_plates, self.triangle_plates,
+                                      len(self.plates))
+            for plate, area in zip(self.plates, self._stats.areas.tolist()):
+                plate.area = area
+        return self._stats
+
+    def pick_continents_by_area(self, values: np.ndarray) -> np.ndarray:
+        # The index of the plate picked by each value in [0, 1], each plate as likely as its share of the map.
+        values = np.asarray(values, dtype=np.float64)
+        if (values > 1.0).any():
+            raise IndexError(f"{values.max()} is greater than 1.0 which is invalid.")
+        sums = np.cumsum(self.stats.areas)
+        return np.minimum(np.searchsorted(sums, values * sums[-1]), len(sums) - 1)
 
     def pick_continent_by_area(self, value):
-        value *= 4  # 2 squared as the map goes from -1 to 1 on the x and y axis so this is always the area.
-        for plate in self.plates:
-            value -= plate.area
-            if value <= 0:
-                return plate
-        raise IndexError(f"{value} is greater than 1.0 which is invalid.")
+        return self.plates[int(self.pick_continents_by_area(np.array([value]))[0])]
+
+    def plates_at(self, coords: np.ndarray) -> np.ndarray:
+        # The plate of the map point nearest to each position, so every position on the map has one.
+        nearest = self.map.nearest_points(coords)
+        return np.where(nearest < 0, -1, self.point_plates[nearest])
+
+    def plate_at(self, x: float, y: float) -> int:
+        return int(self.plates_at(np.array([(x, y)]))[0])
 
     def get_buffer_data(self):
-        num_plates = len(self.plates)-1
-        visited_points = set()
-        new_points = []
-        index_convert: Dict[Tuple[int, int], int] = {}
-        for index, plate in enumerate(self.plates):
-            normal_index = index/num_plates
-            for triangle in plate.triangles:
-                for vertex in triangle.vertices:
-                    vertex_pos = self.map.triangulation.points[vertex]
-                    new_point = (vertex_pos.x, vertex_pos.y, normal_index)
-                    if new_point not in visited_points:
-                        visited_points.add(new_point)
-                        index_convert[(vertex, index)] = len(new_points)
-                        new_points.append(new_point)
-        vertices = []
-        for point_data in new_points:
-            vertices.extend(point_data)
-        indices = []
+        # Each plate gets its own copy of the vertices it uses so they can carry the plate's value.
+        mesh = self.map.triangulation.mesh
+        num_plates = max(len(self.plates)-1, 1)
+        triangles = []
         for index, plate in enumerate(self.plates):
-            for triangle in plate.triangles:
-                indices.extend((index_convert[vertex, index] for vertex in triangle.vertices))
-
-        return (array('f', vertices),
-                array('i', indices))
+            if len(plate.triangle_indices) or not plate.triangles:
+                plate_triangles = mesh.triangles[plate.triangle_indices]
+            else:
+                plate_triangles = np.array([triangle.vertices for triangle in plate.triangles], dtype=np.int32)
+            triangles.append(plate_triangles.astype(np.int64).reshape(-1, 3) + index * len(mesh.coords))
+
+        keys, indices = unique_inverse(np.concatenate(triangles).reshape(-1) if triangles else np.zeros(0, np.int64))
+        vertices = np.empty((len(keys), 3), dtype=np.float32)
+        vertices[:, :2] = mesh.coords[keys % len(mesh.coords)]
+        vertices[:, 2] = (keys // len(mesh.coords)) / num_plates
+        return vertices.reshape(-1), indices.astype(np.int32)
+
+    def export_buffers(self) -> MapBuffers:
+        # Plate values run from 0 to 1, points without a plate, like the super triangle's, get -1 as they do
+        # in PlateMapStepperInfo.export_buffers.
+        num_plates = max(len(self.plates)-1, 1)
+        triangulation = self.map.triangulation
+        plates = np.where(self.point_plates < 0, -1.0, self.point_plates / num_plates).astype(np.float32)
+        return MapBuffers(triangulation.vertex_buffer(), plates, triangulation.triangle_buffer(),
+                          triangulation.line_buffer())
+
+
+def seed_plates(point_map: PointMap, plate_num: int, plate_dist: float, stream) -> List[PlateGenData]:
+    # Every plate draws from its own substream so adding plates doesn't change the ones before them.
+    # Points outside of every triangle, like the super triangle's, can never be reached so can't be seeds.
+    candidates = np.flatnonzero(point_map.neighbors.degrees() > 0)
+    seed_indices = stream.substream('plate_seeds').generator.choice(candidates, plate_num, replace=False)
+    plate_data = []
+    for plate, seed_index in enumerate(seed_indices.tolist()):
+        type_check, plate_type = stream.substream('plate', plate).generator.random(), SEA
+        if type_check <= plate_dist:
+            plate_type = LAND
+        plate_data.append(PlateGenData(seed_index, plate_type, plate))
+    return plate_data
+
+
+@instrument.timed('maps.create_point_map')
+def create_point_map(map_width: int, map_height: int, seed=None, workers: int = 1, order: int = triangulation.SNAKE,
+                     reorder: int = None) -> PointMap:
+    # order is the order points are inserted in, reorder the space filling curve the finished triangulation
+    # is renumbered along, if any, see Triangulation.reorder.
+    coords = point.create_grid_coords(map_width, map_height, as_stream(seed).substream('points'))
+    if workers == 1:
+        base = triangulation.Triangulation(coords, order=order)
+    else:
+        base = parallel.ParallelTriangulation(coords, workers, order)
+    if reorder is not None:
+        base.reorder(reorder)
+    return PointMap(base)
+
+
+@instrument.timed('maps.create_plate_map')
+def create_plate_map(map_width: int, map_height: int, plate_num, plate_dist: float = None, seed=None,
+                     workers: int = 1, point_map: PointMap = None, rule: int = MAJORITY):
+    # point_map can be given if it was made by create_point_map with the same size and seed.
+    stream = as_stream(seed)
+    if point_map is None:
+        point_map = create_point_map(map_width, map_height, stream, workers)
 
+    if plate_dist is None:
+        plate_dist = stream.substream('plate_dist').generator.uniform(0.4, 0.65)
 
-def create_plate_map(map_width: int, map_height: int, plate_num, plate_dist: float = None, seed=None):
-    if seed is None:
-        seed = time()
+    plate_data = seed_plates(point_map, plate_num, plate_dist, stream)
 
-    point_map = PointMap(triangulation.Triangulation(point.create_grid_points(map_width, map_height, seed**2)))
-    available_points = set(point_map.points)
+    growth = PlateGrowth(point_map, plate_data)
+    growth.grow()
+    return grown_plate_map(growth, stream.seed, rule)
 
-    random.seed(seed)
 
-    if plate_dist is None:
-        plate_dist = random.uniform(0.4, 0.65)
+def grown_plate_map(growth: PlateGrowth, seed=None, rule: int = MAJORITY) -> 'PlateMap':
+    # The PlateMap of a finished growth, every plate with its points and the triangles labelled with it.
+    point_map, plate_data = growth.point_map, growth.plate_data
+    point_plates = np.array(growth.owners, dtype=np.int32)
+    triangle_plates, boundary = label_triangles(point_map.triangulation.mesh.triangles, point_plates, rule)
+    claimed, labelled = point_plates >= 0, triangle_plates >= 0
+    points = CSRGraph.from_pairs(point_plates[claimed], np.flatnonzero(claimed), len(plate_data))
+    triangles = CSRGraph.from_pairs(triangle_plates[labelled], np.flatnonzero(labelled), len(plate_data))
+    plates = tuple(Plate.from_indices(point_map, points[index].astype(np.int64), plate.type, triangles[index])
+                   for index, plate in enumerate(plate_data))
 
-    plate_data = []
-    for plate in range(plate_num):
-        type_check, plate_type = random.random(), SEA
-        if type_check <= plate_dist:
-            plate_type = LAND
-        seed_point = random.choice(tuple(available_points))
-        plate_data.append(PlateGenData(seed_point, plate_type, plate))
-        available_points.remove(seed_point)
-
-    print("start: ", time() % 10000)
-
-    while len(available_points)-3 > 0:
-        print(len(available_points)-3)
-        for plate in plate_data:
-            plate.cost += 0.001 + 0.001 * plate.type
-            if plate.cost > 0:
-                for map_point in plate.shell_points.copy():
-                    plate.shell_points.remove(map_point)
-                    for neighbor in map_point.neighbors:
-                        neighbor_point = point_map.points[neighbor]
-                        if neighbor_point not in plate.points and neighbor_point in available_points:
-                            cost = ((map_point.pos.x - neighbor_point.pos.x)**2 +
-                                    (map_point.pos.y - neighbor_point.pos.y)**2)
-                            plate.cost -= cost
-                            plate.shell_points.add(neighbor_point)
-                            plate.points.add(neighbor_point)
-                            available_points.remove(neighbor_point)
-    print("done: ", time() % 10000)
-
-    plates = []
-    for plate in plate_data:
-        plates.append(Plate(tuple(plate.points), plate.type))
-
-    return PlateMap(point_map, tuple(plates))
+    return PlateMap(point_map, plates, seed, point_plates, triangle_plates, boundary)
 
 
 class PlateMapStepperInfo:
 
-    def __init__(self, map_width: int, map_height: int, plate_num: int, plate_dist: float):
+    def __init__(self, map_width: int, map_height: int, plate_num: int, plate_dist: float = None, seed=None,
+                 point_map: PointMap = None, rule: int = MAJORITY):
+        self.stream = as_stream(seed)
+        self.seed = self.stream.seed
         self.plate_num = plate_num
         self.plate_dist = plate_dist
 
-        self.point_map = PointMap(triangulation.Triangulation(point.create_grid_points(map_width, map_height)))
-        self.available_points = set(self.point_map.points)
-        self.available_triangles = set(self.point_map.triangulation.triangles)
+        self.point_map = point_map or create_point_map(map_width, map_height, self.stream)
 
         if plate_dist is None:
-            plate_dist = random.uniform(0.3, 0.55)
+            plate_dist = self.stream.substream('plate_dist').generator.uniform(0.3, 0.55)
 
-        self.plate_data = []
-        for plate in range(plate_num):
-            type_check, plate_type = random.random(), SEA
-            if type_check <= plate_dist:
-                plate_type = LAND
-            seed_point = random.choice(tuple(self.available_points))
-            self.plate_data.append(PlateGenData(seed_point, plate_type, plate))
-            self.available_points.remove(seed_point)
+        self.plate_data = seed_plates(self.point_map, plate_num, plate_dist, self.stream)
+        self.growth = PlateGrowth(self.point_map, self.plate_data)
+        self.round = 0
+        # Only points inside of some triangle can ever be claimed.
+        self.claimed = 0
+        self.claimable = int((self.point_map.neighbors.degrees() > 0).sum())
 
+        self.rule = rule
         self.triangles = []
-
-    def step(self):
-        if len(self.available_points) - 3 > 0:
-            for plate in self.plate_data:
-                print(plate, plate.type, plate.cost)
-                plate.cost += 0.001 + 0.001 * plate.type
-                if plate.cost > 0:
-                    print("extending")
-                    cost_mod = 1
-                    if len(plate.shell_points) > 0:
-                        cost_mod = (6) / (len(plate.shell_points)**2)
-                    for map_point in plate.shell_points.copy():
-                        plate.shell_points.remove(map_point)
-                        for neighbor in map_point.neighbors:
-                            neighbor_point = self.point_map.points[neighbor]
-                            if neighbor_point not in plate.points and neighbor_point in self.available_points:
-                                cost = ((map_point.pos.x - neighbor_point.pos.x) ** 2 +
-                                        (map_point.pos.y - neighbor_point.pos.y) ** 2)
-                                plate.cost -= cost * cost_mod
-                                plate.shell_points.add(neighbor_point)
-                                plate.points.add(neighbor_point)
-                                plate.point_indices.add(neighbor)
-                                self.available_points.remove(neighbor_point)
-        elif not len(self.triangles):
-            for tri in self.point_map.triangulation.triangles:
-                for plate in self.plate_data:
-                    check = (vertex in plate.point_indices for vertex in tri.vertices)
-                    if any(check):
-                        self.triangles.append((tri, plate.index))
-
-
-
+        self.triangle_plates: np.ndarray = None
+        self.boundary_triangles: np.ndarray = None
+
+    @property
+    def progress(self) -> float:
+        return self.claimed / max(self.claimable, 1)
+
+    @property
+    def available_points(self) -> Set[MapPoint]:
+        # The points no plate has claimed yet, made from the owners only when asked for.
+        points = self.point_map.points
+        return {points[index] for index in np.flatnonzero(np.array(self.growth.owners) < 0).tolist()}
+
+    @property
+    def available_triangles(self) -> Set[triangulation.Triangle]:
+        # The triangles without a plate, which is all of them until the last step labels them.
+        triangles = self.point_map.triangulation.triangles
+        if self.triangle_plates is None:
+            return set(triangles)
+        return {triangles[index] for index in np.flatnonzero(self.triangle_plates < 0).tolist()}
+
+    def export_buffers(self) -> MapBuffers:
+        # The map as it stands, unclaimed points get a plate value of -1.
+        num_plates = max(self.plate_num-1, 1)
+        triangulation = self.point_map.triangulation
+        owners = np.array(self.growth.owners)
+        plates = np.where(owners < 0, -1.0, owners / num_plates).astype(np.float32)
+        return MapBuffers(triangulation.vertex_buffer(), plates, triangulation.triangle_buffer(),
+                          triangulation.line_buffer())
+
+    @instrument.timed('maps.stepper_step')
+    def step(self) -> List[Tuple[int, int]]:
+        # Each step is one growth round, returning the (point index, plate index) pairs claimed during it.
+        if not self.growth.done:
+            self.round += 1
+            instrument.count('maps.growth_rounds')
+            claimed = self.growth.grow(self.round)
+            self.claimed += len(claimed)
+            return claimed
+        elif self.triangle_plates is None:
+            # Once every point has a plate, each triangle gets exactly one.
+            self.triangle_plates, self.boundary_triangles = label_triangles(
+                self.point_map.triangulation.mesh.triangles, np.array(self.growth.owners, dtype=np.int32), self.rule)
+            triangles, plates = self.point_map.triangulation.triangles, self.triangle_plates.tolist()
+            self.triangles = [(triangles[index], plates[index])
+                              for index in np.flatnonzero(self.triangle_plates >= 0).tolist()]
+        return []
@@ -0,0 +1,328 @@
+import numpy as np
+
+from predicates import circumcircles, incircle_batch
+
+
+def calc_areas(coords: np.ndarray, triangles: np.ndarray):
+    a = coords[triangles[:, 0]]
+    b = coords[triangles[:, 1]] - a
+    c = coords[triangles[:, 2]] - a
+    return 0.5 * (b[:, 0] * c[:, 1] - c[:, 0] * b[:, 1])
+
+
+def calc_halfedges(triangles: np.ndarray, num_points: int):
+    # Half-edge 3t+i runs from triangles[t, i] to triangles[t, (i+1)%3]; its twin runs the other way.
+    starts = triangles.reshape(-1).astype(np.int64)
+    ends = np.roll(triangles, -1, axis=1).reshape(-1).astype(np.int64)
+    keys = starts * num_points + ends
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    twin_keys = ends * num_points + starts
+    found = np.searchsorted(sorted_keys, twin_keys)
+    found[found == len(sorted_keys)] = 0
+    matched = sorted_keys[found] == twin_keys if len(sorted_keys) else np.zeros(0, bool)
+    return np.where(matched, order[found], -1).astype(np.int32)
+
+
+def unique_inverse(values: np.ndarray):
+    # np.unique(values, return_inverse=True) through a single argsort, which is far quicker on large int arrays.
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    first = np.append(True, sorted_values[1:] != sorted_values[:-1]) if len(values) else np.zeros(0, dtype=bool)
+    inverse = np.empty(len(values), dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    return sorted_values[first], inverse
+
+
+class TriangleMesh:
+
+    def __init__(self, coords: np.ndarray, triangles: np.ndarray):
+        self.coords: np.ndarray = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.triangles: np.ndarray = np.ascontiguousarray(triangles, dtype=np.int32).reshape(-1, 3)
+        self.halfedges: np.ndarray = calc_halfedges(self.triangles, len(self.coords))
+        self.circumcircles: np.ndarray = circumcircles(self.coords, self.triangles)
+        self.areas: np.ndarray = calc_areas(self.coords, self.triangles)
+        self.buffers: dict = {}
+
+    @classmethod
+    def from_arrays(cls, coords: np.ndarray, triangles: np.ndarray, halfedges: np.ndarray,
+                    circumcircles: np.ndarray, areas: np.ndarray):
+        # A mesh over arrays that were already worked out, like ones memory-mapped from a map cache file.
+        mesh = cls.__new__(cls)
+        mesh.coords, mesh.triangles, mesh.halfedges = coords, triangles, halfedges
+        mesh.circumcircles, mesh.areas = circumcircles, areas
+        mesh.buffers = {}
+        return mesh
+
+    def __len__(self):
+        return len(self.triangles)
+
+    @property
+    def neighbors(self):
+        # The triangle across each edge, or -1 on the hull.
+        return np.where(self.halfedges < 0, -1, self.halfedges // 3).reshape(-1, 3)
+
+    def edges(self):
+        return np.column_stack((self.triangles.reshape(-1), np.roll(self.triangles, -1, axis=1).reshape(-1)))
+
+    def grow(self, name: str, count: int, fill=0):
+        # Edits grow and shrink the arrays a few rows at a time, so each is a view of the front of a larger
+        # buffer that doubles when it runs out and the rows after the view are spare. An array set from
+        # outside isn't a view of its buffer any more and gets a new one the next time it grows.
+        array = getattr(self, name)
+        buffer = self.buffers.get(name)
+        if buffer is None or array.base is not buffer or len(buffer) < count:
+            buffer = np.empty((max(count, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+            buffer[:len(array)] = array
+            self.buffers[name] = buffer
+        buffer[len(array):count] = fill
+        setattr(self, name, buffer[:count])
+
+    def add_coords(self, coords: np.ndarray):
+        start = len(self.coords)
+        self.grow('coords', start + len(coords))
+        self.coords[start:] = coords
+
+    def resize(self, count: int):
+        # Shrinking only shortens the views, the rows past the end stay in the buffers for the next edit.
+        if count > len(self.triangles):
+            self.grow('triangles', count)
+            self.grow('halfedges', 3*count, -1)
+            self.grow('circumcircles', count)
+            self.grow('areas', count)
+        else:
+            self.triangles = self.triangles[:count]
+            self.halfedges = self.halfedges[:3*count]
+            self.circumcircles = self.circumcircles[:count]
+            self.areas = self.areas[:count]
+
+    def set_rows(self, rows, triangles: np.ndarray):
+        self.triangles[rows] = triangles
+        self.circumcircles[rows] = circumcircles(self.coords, triangles)
+        self.areas[rows] = calc_areas(self.coords, triangles)
+
+    def unlink_rows(self, rows):
+        for row in rows:
+            for halfedge in range(3*row, 3*row+3):
+                twin = self.halfedges[halfedge]
+                if twin >= 0:
+                    self.halfedges[twin] = -1
+                self.halfedges[halfedge] = -1
+
+    def move_row(self, source: int, target: int):
+        self.triangles[target] = self.triangles[source]
+        self.circumcircles[target] = self.circumcircles[source]
+        self.areas[target] = self.areas[source]
+        for i in range(3):
+            twin = self.halfedges[3*source+i]
+            self.halfedges[3*target+i] = twin
+            if twin >= 0:
+                self.halfedges[twin] = 3*target+i
+
+    def is_delaunay(self) -> bool:
+        # No triangle's circumcircle may strictly contain the far vertex of a neighbor. Triangles are clockwise
+        # so each is handed to incircle reversed.
+        halfedges = np.flatnonzero(self.halfedges >= 0)
+        twins = self.halfedges[halfedges]
+        triangles = self.triangles[halfedges // 3]
+        far = self.triangles[twins // 3, (twins % 3 + 2) % 3]
+        coords = self.coords
+        inside = incircle_batch(coords[triangles[:, 2]], coords[triangles[:, 1]], coords[triangles[:, 0]], coords[far])
+        return not (inside > 0).any()
+
+    def lines(self) -> np.ndarray:
+        # Every edge once: hull half-edges plus one of each twinned pair.
+        keep = (self.halfedges < 0) | (np.arange(len(self.halfedges)) < self.halfedges)
+        return np.ascontiguousarray(self.edges()[keep], dtype=np.int32)
+
+    def vertex_triangles(self) -> 'CSRGraph':
+        return CSRGraph.from_pairs(self.triangles.reshape(-1), np.arange(self.triangles.size) // 3, len(self.coords))
+
+    def vertex_neighbors(self) -> 'CSRGraph':
+        # Every edge appears once in each direction, shared edges are collapsed with a sort over packed keys.
+        edges = self.edges().astype(np.int64)
+        keys = np.sort(np.concatenate((edges[:, 0] * len(self.coords) + edges[:, 1],
+                                       edges[:, 1] * len(self.coords) + edges[:, 0])))
+        keys = keys[np.append(True, keys[1:] != keys[:-1])]
+        return CSRGraph.from_pairs(keys // len(self.coords), keys % len(self.coords), len(self.coords))
+
+    def nbytes(self):
+        return (self.coords.nbytes + self.triangles.nbytes + self.halfedges.nbytes +
+                self.circumcircles.nbytes + self.areas.nbytes)
+
+
+class CSRGraph:
+    # Compressed sparse rows: the entries of row i are indices[offsets[i]:offsets[i+1]].
+
+    def __init__(self, offsets: np.ndarray, indices: np.ndarray):
+        self.offsets: np.ndarray = offsets
+        self.indices: np.ndarray = indices
+
+    @classmethod
+    def from_pairs(cls, rows: np.ndarray, entries: np.ndarray, num_rows: int):
+        order = np.argsort(rows, kind='stable')
+        offsets = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_rows), out=offsets[1:])
+        return cls(offsets, np.ascontiguousarray(entries[order], dtype=np.int32))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        return self.indices[self.offsets[row]:self.offsets[row+1]]
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def rows(self) -> np.ndarray:
+        # The row of every entry, lined up with indices.
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.degrees())
+
+    def gather(self, rows: np.ndarray):
+        # The entries of the given rows one after another, along with the row each came from.
+        degrees = self.degrees()[rows]
+        starts = np.repeat(self.offsets[rows] - np.cumsum(degrees) + degrees, degrees)
+        return self.indices[starts + np.arange(len(starts))], np.repeat(rows, degrees)
+
+    def replace_rows(self, rows: np.ndarray, graph: 'CSRGraph', num_rows: int = None) -> 'CSRGraph':
+        # A copy with the given rows, in increasing order, swapped for the rows of graph and any rows up to
+        # num_rows added empty. The other rows' entries are moved over in one pass and nothing is sorted.
+        num_rows = len(self) if num_rows is None else num_rows
+        kept = np.ones(num_rows, dtype=bool)
+        kept[rows] = False
+        degrees = np.zeros(num_rows, dtype=np.int64)
+        degrees[:len(self)] = self.degrees()
+        old_entries = np.repeat(kept[:len(self)], degrees[:len(self)])
+        degrees[rows] = graph.degrees()
+        offsets = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(degrees, out=offsets[1:])
+        indices = np.empty(offsets[-1], dtype=self.indices.dtype)
+        new_entries = np.repeat(kept, degrees)
+        indices[new_entries] = self.indices[old_entries]
+        indices[~new_entries] = graph.indices
+        return CSRGraph(offsets, indices)
+
+
+def clip_polygon(polygon: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    # Sutherland-Hodgman against each side of a box. Crossings are measured from the point on the inside
+    # of the side, so a far away point outside doesn't cost the result any precision.
+    for axis in (0, 1):
+        for bound, keep in ((low[axis], np.greater_equal), (high[axis], np.less_equal)):
+            if not len(polygon):
+                return polygon
+            inside = keep(polygon[:, axis], bound)
+            clipped = []
+            for start, end, start_in, end_in in zip(polygon, np.roll(polygon, -1, axis=0), inside, np.roll(inside, -1)):
+                if start_in:
+                    clipped.append(start)
+                if start_in != end_in:
+                    near, far = (start, end) if start_in else (end, start)
+                    crossing = near + (bound - near[axis]) / (far[axis] - near[axis]) * (far - near)
+                    crossing[axis] = bound
+                    clipped.append(crossing)
+            polygon = np.array(clipped, dtype=np.float64).reshape(-1, 2)
+    return polygon
+
+
+class VoronoiDiagram:
+    # The Voronoi dual of a mesh, clipped to a box. The cell of point i is the counter-clockwise polygon
+    # through vertices[cells[i]] and has area areas[i]. The first len(mesh) vertices are the triangles'
+    # circumcenters, the ones after are where the box cut cells off. Points in no triangle have no cell.
+
+    def __init__(self, vertices: np.ndarray, cells: CSRGraph, areas: np.ndarray):
+        self.vertices: np.ndarray = vertices
+        self.cells: CSRGraph = cells
+        self.areas: np.ndarray = areas
+
+    def cell(self, index: int) -> np.ndarray:
+        return self.vertices[self.cells[index]]
+
+
+def voronoi_diagram(mesh: TriangleMesh, low=(-1.0, -1.0), high=(1.0, 1.0)) -> VoronoiDiagram:
+    # Linear in the size of the mesh. The triangles around each point are put in order by walking the
+    # half-edges, with each point's chain ranked by pointer jumping so the walk is a few array passes.
+    low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    num_points, halfedges = len(mesh.coords), mesh.halfedges.astype(np.int64)
+    edges = np.arange(len(halfedges))
+    starts = mesh.triangles.reshape(-1).astype(np.int64)
+    previous = edges - edges % 3 + (edges % 3 + 2) % 3
+
+    # Triangles are clockwise, so going from a half-edge leaving a point to the twin of the half-edge
+    # coming back into it turns clockwise around the point. Chains start on the hull, where there is no
+    # twin to come from, and closed rings are cut open at their lowest half-edge.
+    following = np.where(halfedges[previous] < 0, -1, halfedges[previous])
+    on_hull = np.zeros(num_points, dtype=bool)
+    on_hull[starts[halfedges < 0]] = True
+    first = np.full(num_points, len(halfedges), dtype=np.int64)
+    np.minimum.at(first, starts, edges)
+    following[(following == first[starts]) & ~on_hull[starts]] = -1
+
+    # Steps from each half-edge to the end of its chain, the clockwise walk's end comes first
+    # counter-clockwise.
+    rank = (following >= 0).astype(np.int64)
+    pointer = following.copy()
+    while (pointer >= 0).any():
+        valid = pointer >= 0
+        rank = rank + np.where(valid, rank[np.maximum(pointer, 0)], 0)
+        pointer = np.where(valid, pointer[np.maximum(pointer, 0)], -1)
+    offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(np.bincount(starts, minlength=num_points), out=offsets[1:])
+    entries = np.empty(len(halfedges), dtype=np.int64)
+    entries[offsets[starts] + rank] = edges // 3
+    cells = CSRGraph(offsets, entries)
+
+    vertices = [mesh.circumcircles[:, :2]]
+    count = len(mesh.triangles)
+    corners = vertices[0]
+    outside = ((corners < low) | (corners > high)).any(axis=1)
+    clip = on_hull | (np.bincount(starts, outside[edges // 3], num_points) > 0)
+    rows = {}
+    # Hull cells run out to infinity, they are closed with points far out along the rays from the hull
+    # edges' circumcenters before clipping.
+    reach = 1e6 * (np.abs(high - low).max() + np.abs(mesh.coords[np.unique(starts)]).max(initial=0))
+    ends = mesh.triangles[edges // 3, (edges % 3 + 1) % 3].astype(np.int64)
+    hull = edges[halfedges < 0]
+    hull_leaving = np.full(num_points, -1, dtype=np.int64)
+    hull_leaving[starts[hull]] = hull
+    hull_arriving = np.full(num_points, -1, dtype=np.int64)
+    hull_arriving[ends[hull]] = hull
+    coords = mesh.coords
+    for point in np.flatnonzero(clip).tolist():
+        polygon = corners[cells[point]]
+        if on_hull[point]:
+            # Outside of the mesh is to the left of a hull edge.
+            rays = []
+            for edge in (hull_leaving[point], hull_arriving[point]):
+                direction = coords[ends[edge]] - coords[starts[edge]]
+                normal = np.array((-direction[1], direction[0])) / np.hypot(*direction)
+                rays.append(corners[edge // 3] + reach * normal)
+            polygon = np.concatenate((polygon, rays))
+        polygon = clip_polygon(polygon, low, high)
+        rows[point] = np.arange(count, count + len(polygon))
+        vertices.append(polygon)
+        count += len(polygon)
+
+    if rows:
+        degrees = cells.degrees()
+        for point, row in rows.items():
+            degrees[point] = len(row)
+        offsets = np.zeros(num_points + 1, dtype=np.int64)
+        np.cumsum(degrees, out=offsets[1:])
+        kept = np.repeat(~clip, cells.degrees())
+        entries = np.empty(offsets[-1], dtype=np.int64)
+        entries[np.repeat(~clip, degrees)] = cells.indices[kept]
+        for point, row in rows.items():
+            entries[offsets[point]:offsets[point+1]] = row
+        cells = CSRGraph(offsets, entries)
+
+    # The shoelace formula, each vertex paired with the next one around its cell.
+    vertices = np.concatenate(vertices)
+    polygon = vertices[cells.indices]
+    filled = cells.degrees() > 0
+    following = np.arange(1, len(cells.indices) + 1)
+    following[cells.offsets[1:][filled] - 1] = cells.offsets[:-1][filled]
+    following = polygon[following]
+    cross = polygon[:, 0] * following[:, 1] - following[:, 0] * polygon[:, 1]
+    areas = 0.5 * np.bincount(cells.rows(), cross, num_points)
+    return VoronoiDiagram(vertices, cells, areas)
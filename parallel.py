@@ -0,0 +1,194 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import List
+
+import numpy as np
+
+import instrument
+from point import Point, points_from_coords
+from mesh import TriangleMesh
+from predicates import incircle
+from spatial import PointGrid
+from triangulation import (SNAKE, Triangulation, DelaunayKernel, canonical_triangles, create_super_points,
+                           insertion_order, repeated_points)
+
+# Strips smaller than this are not worth a process of their own.
+MIN_STRIP_POINTS = 5000
+# How many (triangle, grid cell) pairs are expanded at once when checking circles are empty.
+CHUNK_PAIRS = 1 << 20
+
+
+def kernel_triangles(coords: np.ndarray, order: int = SNAKE):
+    # Triangulates coords, whose last three rows are the super triangle, inserting them in the given order,
+    # and returns the counter-clockwise triangles along with their cached circles and error bounds. Points
+    # repeating an earlier one are skipped.
+    count = len(coords) - 3
+    kernel = DelaunayKernel(coords[:, 0].tolist(), coords[:, 1].tolist())
+    kernel.add_triangle(count, count+2, count+1)
+    indices = np.flatnonzero(~repeated_points(coords[:count]))
+    for index in indices[insertion_order(points_from_coords(coords[indices]), order)].tolist():
+        kernel.insert(index)
+    alive = np.array(kernel.alive, dtype=bool)
+    return (np.array(kernel.vertices, dtype=np.int64).reshape(-1, 3)[alive],
+            np.array(kernel.circles, dtype=np.float64).reshape(-1, 5)[alive])
+
+
+def clear_of(circles: np.ndarray, gap: np.ndarray):
+    # Whether every point at least gap away from a circle's center is certainly outside of it, using the
+    # same error bounds as the kernel's in-circle test.
+    with np.errstate(invalid='ignore'):
+        return (gap > 0) & (gap * gap * (1 - circles[:, 3]) > circles[:, 2] + circles[:, 4])
+
+
+def triangulate_strip(name: str, num_points: int, start: int, end: int, order: int = SNAKE):
+    # Runs in a worker. Triangulates the x-sorted points [start, end) with the shared super triangle and
+    # splits the result: triangles whose circles can't reach the neighbouring strips are already globally
+    # Delaunay, the vertices of every other triangle are left for the seams.
+    memory = SharedMemory(name)
+    coords = np.ndarray((num_points + 3, 2), dtype=np.float64, buffer=memory.buf)
+    strip = np.concatenate((coords[start:end], coords[num_points:]))
+    left = float(coords[start-1, 0]) if start > 0 else -np.inf
+    right = float(coords[end, 0]) if end < num_points else np.inf
+    del coords
+    memory.close()
+
+    triangles, circles = kernel_triangles(strip, order)
+    count = end - start
+    triangles = np.where(triangles < count, triangles + start, triangles - count + num_points)
+    confirmed = clear_of(circles, circles[:, 0] - left) & clear_of(circles, right - circles[:, 0])
+    real = (triangles < num_points).all(axis=1)
+    seam = triangles[~confirmed].reshape(-1)
+    return triangles[confirmed & real], np.unique(seam[seam < num_points])
+
+
+def inside_circles(grid: PointGrid, triangles: np.ndarray, circles: np.ndarray, owners: np.ndarray,
+                   points: np.ndarray):
+    # Which (triangle, point) pairs have the point strictly inside the triangle's circle. Pairs too close to
+    # call with the cached circle are settled with the exact incircle.
+    coords = grid.coords
+    circles = circles[owners]
+    offset = circles[:, :2] - coords[points]
+    dist = (offset * offset).sum(axis=1)
+    margin = dist * circles[:, 3] + circles[:, 4]
+    with np.errstate(invalid='ignore'):
+        # Circles at infinity give nan, which settles nothing.
+        diff = circles[:, 2] - dist
+        inside = diff > margin
+        unsure = ~(inside | (diff < -margin)) & (triangles[owners] != points[:, None]).all(axis=1)
+    for pair in np.flatnonzero(unsure).tolist():
+        a, b, c = coords[triangles[owners[pair]]].tolist()
+        inside[pair] = incircle(*a, *b, *c, *coords[points[pair]].tolist()) > 0
+    return inside
+
+
+def empty_circles(grid: PointGrid, triangles: np.ndarray, circles: np.ndarray):
+    # Keeps the triangles whose circles hold none of the grid's points. Most triangles that fail do so on a
+    # point near their circle's center, so the cells around it are checked first for all of them at once.
+    keep = np.ones(len(triangles), dtype=bool)
+    centers = grid.cells_of(np.nan_to_num(circles[:, :2], posinf=0.0, neginf=0.0))
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            column, row = centers[:, 0] + dx, centers[:, 1] + dy
+            valid = np.flatnonzero(keep & (column >= 0) & (column < grid.side) & (row >= 0) & (row < grid.side))
+            owners, points = grid.entries_in(valid, grid.cell_index(column[valid], row[valid]))
+            keep[owners[inside_circles(grid, triangles, circles, owners, points)]] = False
+
+    # Then the rest of each remaining circle, cell by cell, for the cells it overlaps.
+    survivors = np.flatnonzero(keep)
+    radius = np.sqrt(circles[survivors, 2])
+    low = grid.cells_of(circles[survivors, :2] - radius[:, None])
+    high = grid.cells_of(circles[survivors, :2] + radius[:, None])
+    spans = high - low + 1
+    counts = spans[:, 0] * spans[:, 1]
+    totals = np.cumsum(counts)
+    start = 0
+    while start < len(survivors):
+        end = max(start + 1, int(np.searchsorted(totals, totals[start] - counts[start] + CHUNK_PAIRS, 'right')))
+        part = slice(start, end)
+        owners = np.repeat(survivors[part], counts[part])
+        local = np.arange(counts[part].sum()) - np.repeat(np.cumsum(counts[part]) - counts[part], counts[part])
+        width = np.repeat(spans[part, 0], counts[part])
+        column = np.repeat(low[part, 0], counts[part]) + local % width
+        row = np.repeat(low[part, 1], counts[part]) + local // width
+        # Only the cells whose rectangle reaches into the circle.
+        corner = grid.low + np.column_stack((column, row)) * grid.size
+        nearest = np.clip(circles[owners, :2], corner, corner + grid.size) - circles[owners, :2]
+        reach = (nearest * nearest).sum(axis=1) <= circles[owners, 2] * (1 + 1e-6)
+        owners, points = grid.entries_in(owners[reach], grid.cell_index(column[reach], row[reach]))
+        keep[owners[inside_circles(grid, triangles, circles, owners, points)]] = False
+        start = end
+    return keep
+
+
+def unique_rows(triangles: np.ndarray):
+    ordered = np.sort(triangles, axis=1)
+    order = np.lexsort(ordered.T[::-1])
+    ordered = ordered[order]
+    first = np.append(True, (ordered[1:] != ordered[:-1]).any(axis=1)) if len(ordered) else np.zeros(0, bool)
+    return triangles[order[first]]
+
+
+def triangulate_strips(coords: np.ndarray, workers: int, order: int = SNAKE):
+    # coords are the points followed by the super triangle. Returns the same triangles the serial kernel
+    # would, in the legacy engine's form, or None if ties between cocircular points made the strips and
+    # the seams disagree.
+    num_points = len(coords) - 3
+    by_x = np.argsort(coords[:num_points, 0], kind='stable')
+    sorted_coords = np.concatenate((coords[by_x], coords[num_points:]))
+    bounds = np.linspace(0, num_points, workers + 1).astype(np.int64).tolist()
+
+    memory = SharedMemory(create=True, size=sorted_coords.nbytes)
+    try:
+        np.ndarray(sorted_coords.shape, dtype=np.float64, buffer=memory.buf)[:] = sorted_coords
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(triangulate_strip, [memory.name] * workers, [num_points] * workers,
+                                    bounds[:-1], bounds[1:], [order] * workers))
+    finally:
+        memory.close()
+        memory.unlink()
+
+    # The seams: the Delaunay triangulation of every unconfirmed vertex, of which only triangles with
+    # empty circles are kept. Together with the confirmed triangles these cover the whole triangulation.
+    seam = np.unique(np.concatenate([vertices for _, vertices in results]))
+    triangles, circles = kernel_triangles(np.concatenate((sorted_coords[seam], sorted_coords[num_points:])), order)
+    real = (triangles < len(seam)).all(axis=1)
+    triangles, circles = seam[triangles[real]], circles[real]
+    keep = empty_circles(PointGrid(sorted_coords[:num_points]), triangles, circles)
+
+    triangles = unique_rows(np.concatenate([confirmed for confirmed, _ in results] + [triangles[keep]]))
+    triangles = canonical_triangles(by_x[triangles])
+    halfedges = triangles.astype(np.int64) * num_points + np.roll(triangles, -1, axis=1)
+    halfedges = np.sort(halfedges.reshape(-1))
+    if len(halfedges) and (halfedges[1:] == halfedges[:-1]).any():
+        return None
+    return triangles[np.lexsort(triangles.T[::-1])]
+
+
+class ParallelTriangulation(Triangulation):
+    # Builds the same triangulation over several processes. The x-sorted points are cut into one strip per
+    # worker and each strip is triangulated on its own, with the coordinates handed over in shared memory.
+    # Only the triangles along the seams between strips are triangulated again, see triangulate_strips.
+    # Edits afterwards work exactly as they do on any other Triangulation, order is the insertion order used
+    # in the strips, the seams and by any kernel built for edits.
+
+    def __init__(self, points: List[Point], workers: int = None, order: int = SNAKE):
+        self.workers = workers or os.cpu_count() or 1
+        super().__init__(points, order=order)
+
+    def calculate_triangulation(self):
+        num_points = len(self.points)
+        workers = min(self.workers, num_points // MIN_STRIP_POINTS)
+        if workers < 2:
+            return super().calculate_triangulation()
+
+        with instrument.span('triangulation.build', engine=self.engine, points=num_points, workers=workers):
+            super_points = create_super_points(self.points)
+            coords = np.array([(p.x, p.y) for p in self.points + list(super_points)], dtype=np.float64)
+            triangles = triangulate_strips(coords, workers, self.order)
+            if triangles is not None:
+                self.removed = set(np.flatnonzero(repeated_points(coords[:num_points])).tolist())
+                self.points.extend(super_points)
+                self.mesh = TriangleMesh(coords, triangles)
+        if triangles is None:
+            return super().calculate_triangulation()
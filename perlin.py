@@ -1,9 +1,17 @@
 import random
 from time import time
-from math import floor
+from itertools import product
+from typing import Union
+
+import numpy as np
+
+from streams import RandomStream, create_rng
 
 GRADIENT_CHOICES = ((0.70710678118, 0.70710678118), (0.70710678118, -0.70710678118), (1, 0), (0, 1),
                     (-0.70710678118, 0.70710678118), (-0.70710678118, -0.70710678118), (-1, 0), (0, -1))
+GRADIENT_CHOICES_3D = ((1, 1, 0), (-1, 1, 0), (1, -1, 0), (-1, -1, 0), (1, 0, 1), (-1, 0, 1), (1, 0, -1), (-1, 0, -1),
+                       (0, 1, 1), (0, -1, 1), (0, 1, -1), (0, -1, -1), (1, 1, 0), (-1, 1, 0), (0, -1, 1), (0, -1, -1))
+TABLE_SIZE = 256
 
 
 def smoother_step(shift):
@@ -14,23 +22,76 @@ def mix(s, e, f):
     return s * (1 - f) + f * e
 
 
+class PerlinNoise:
+    # Gradient noise over whole coordinate arrays. The permutation and gradient tables are drawn once per
+    # seed, so evaluating a sample is only table lookups. Passing a period makes the noise repeat every
+    # period lattice cells on each axis, scaled up with the frequency of each octave, so maps can tile.
+
+    def __init__(self, seed: Union[float, RandomStream] = None):
+        rng = create_rng(seed)
+        self.permutation: np.ndarray = rng.permutation(TABLE_SIZE)
+        self.gradients = {1: rng.uniform(-1, 1, (TABLE_SIZE, 1)),
+                          2: np.array(GRADIENT_CHOICES)[rng.integers(0, len(GRADIENT_CHOICES), TABLE_SIZE)],
+                          3: np.array(GRADIENT_CHOICES_3D, dtype=np.float64)[np.arange(TABLE_SIZE) % 16]}
+
+    def lattice_noise(self, coords, period: int = None):
+        cells = [np.floor(axis) for axis in coords]
+        shifts = [axis - cell for axis, cell in zip(coords, cells)]
+        cells = [cell.astype(np.int64) for cell in cells]
+        fades = [smoother_step(shift) for shift in shifts]
+        gradients = self.gradients[len(coords)]
+
+        result = np.zeros(np.shape(shifts[0]))
+        for corner in product((0, 1), repeat=len(coords)):
+            hashed = 0
+            weight = 1
+            for cell, offset, fade in zip(cells, corner, fades):
+                lattice = cell + offset
+                if period is not None:
+                    lattice %= period
+                hashed = self.permutation[(hashed + lattice) % TABLE_SIZE]
+                weight = weight * (fade if offset else 1 - fade)
+            gradient = gradients[hashed]
+            dot = sum(gradient[..., axis] * (shift - offset) for axis, (shift, offset) in enumerate(zip(shifts, corner)))
+            result += weight * dot
+        return result
+
+    def fractal(self, coords, octaves=1, factor=2, persistence=0.5, period: int = None):
+        coords = [np.asarray(axis, dtype=np.float64) for axis in np.broadcast_arrays(*coords)]
+        result = np.zeros(coords[0].shape)
+        for octave in range(octaves):
+            frequency = factor**octave
+            octave_period = None if period is None else int(period * frequency)
+            result += self.lattice_noise([axis * frequency for axis in coords], octave_period) * persistence**octave
+        return result
+
+    def noise1D(self, xs, octaves=1, factor=2, persistence=0.5, period: int = None) -> np.ndarray:
+        return self.fractal((xs,), octaves, factor, persistence, period)
+
+    def noise2D(self, xs, ys, octaves=1, factor=2, persistence=0.5, period: int = None) -> np.ndarray:
+        return self.fractal((xs, ys), octaves, factor, persistence, period)
+
+    def noise3D(self, xs, ys, zs, octaves=1, factor=2, persistence=0.5, period: int = None) -> np.ndarray:
+        return self.fractal((xs, ys, zs), octaves, factor, persistence, period)
+
+
 def perlin1D(x: float, octaves=1, factor=2, seed=None):
     if seed is None:
         seed = time()
-    random.seed(seed)
-    octave_seeds = [random.random() for _ in range(octaves)]
+    rng = random.Random(seed)
+    octave_seeds = [rng.random() for _ in range(octaves)]
     result = 0
 
     for octave in range(octaves):
         scaled_x = x*(factor**octave)
         base = int(scaled_x)
         shift = scaled_x - base
-        random.seed(octave_seeds[octave] * 2**base/seed)
-        grad_base = random.uniform(-1, 1) * shift
-        value_base = random.uniform(-0.5, 0.5)
-        random.seed(octave_seeds[octave] * 2**(1+base)/seed)
-        grad_step = random.uniform(-1, 1) * (shift-1)
-        value_step = random.uniform(-0.5, 0.5)
+        rng.seed(octave_seeds[octave] * 2**base/seed)
+        grad_base = rng.uniform(-1, 1) * shift
+        value_base = rng.uniform(-0.5, 0.5)
+        rng.seed(octave_seeds[octave] * 2**(1+base)/seed)
+        grad_step = rng.uniform(-1, 1) * (shift-1)
+        value_step = rng.uniform(-0.5, 0.5)
         f = smoother_step(shift)
         value = mix(grad_base, grad_step, f) + mix(value_base, value_step, f)
         result += value / (2**octave)
@@ -38,23 +99,9 @@ def perlin1D(x: float, octaves=1, factor=2, seed=None):
     return result
 
 
-def perlin2D(x: float, y: float, octaves, factor, seed=None):
-    if seed is None:
-        seed = time()
-    random.seed(seed)
-    gradients_shuffled = list(GRADIENT_CHOICES)
-    random.shuffle(gradients_shuffled)
-    octave_seeds = [(random.random(), random.random()) for _ in range(octaves)]
-    result = 0
-
-    for octave in range(octaves):
-        scaled_x, scaled_y = x*(factor**octave), y*(factor**octave)
-        bases = (int(scaled_x), int(scaled_y))
-        shifts = (scaled_x-bases[0], scaled_y-bases[1])
-        f_x, f_y = smoother_step(shifts[0]), smoother_step(shifts[1])
-
-
-def get_1D_distribution(detail=25, seed=time()):
-    return list(perlin1D(2*i/detail, octaves=4, seed=seed) for i in range(detail))
+def perlin2D(x: float, y: float, octaves=1, factor=2, seed=None):
+    return PerlinNoise(seed).noise2D(x, y, octaves, factor)[()]
 
 
+def get_1D_distribution(detail=25, seed=None):
+    return PerlinNoise(seed).noise1D(2*np.arange(detail)/detail, octaves=4).tolist()
@@ -1,11 +1,18 @@
-from typing import List
-from time import time
-import random
+from math import sqrt
+from typing import Callable, List, Sequence, Union
 
+import numpy as np
+
+import instrument
 import perlin
+from streams import RandomStream, as_stream, create_rng, create_python_random
+
+# The most active points create_poisson_coords checks candidates for at once.
+POISSON_BATCH = 64
 
 
 class Point:
+    __slots__ = ('x', 'y')
 
     def __init__(self, x: float, y: float):
         self.x = x
@@ -19,28 +26,79 @@ class Point:
         return f"x: {self.x}, y: {self.y}"
 
 
-def insert_sort_points(values: List[Point]):
-    result = []
-    for point in values:
-        for index, compare_point in enumerate(result):
-            if point.x < compare_point.x:
-                result.insert(index, point)
-                break
-        else:
-            result.append(point)
+def points_from_coords(coords: np.ndarray) -> List[Point]:
+    return [Point(x, y) for x, y in np.asarray(coords).tolist()]
+
+
+def coords_from_points(points: List[Point]) -> np.ndarray:
+    return np.array([(p.x, p.y) for p in points], dtype=np.float64).reshape(-1, 2)
+
+
+def sort_coords(coords: np.ndarray) -> np.ndarray:
+    return coords[np.argsort(coords[:, 0], kind='stable')]
+
+
+def grid_positions(coords: np.ndarray, bits: int) -> np.ndarray:
+    # Coords scaled onto a 2**bits square lattice over their bounding box.
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if not len(coords):
+        return np.zeros((0, 2), dtype=np.int64)
+    low = coords.min(axis=0)
+    size = (coords.max(axis=0) - low).max() or 1.0
+    side = (1 << bits) - 1
+    return np.minimum((coords - low) / size * side, side).astype(np.int64)
+
+
+def morton_keys(coords: np.ndarray, bits: int = 16) -> np.ndarray:
+    # Each point's position along a Z-order curve: the lattice x and y with their bits interleaved.
+    position = grid_positions(coords, bits)
+    keys = np.zeros(len(position), dtype=np.int64)
+    for bit in range(bits):
+        keys |= ((position[:, 0] >> bit) & 1) << (2 * bit)
+        keys |= ((position[:, 1] >> bit) & 1) << (2 * bit + 1)
+    return keys
+
+
+def hilbert_keys(coords: np.ndarray, bits: int = 16) -> np.ndarray:
+    # Each point's position along a Hilbert curve over the lattice. Unlike the Z-order curve it never jumps,
+    # consecutive keys are always neighbouring cells.
+    x, y = grid_positions(coords, bits).T.copy()
+    keys = np.zeros(len(x), dtype=np.int64)
+    side = 1 << bits
+    step = side >> 1
+    while step > 0:
+        right = (x & step) > 0
+        up = (y & step) > 0
+        keys += step * step * ((3 * right) ^ up)
+        # Rotate the quadrant so the curve inside it starts and ends in the right corners.
+        flip = ~up
+        mirror = flip & right
+        x = np.where(mirror, side - 1 - x, x)
+        y = np.where(mirror, side - 1 - y, y)
+        x, y = np.where(flip, y, x), np.where(flip, x, y)
+        step >>= 1
+    return keys
 
-    return result
 
+def brio_order(coords: np.ndarray, seed: Union[float, RandomStream] = None) -> np.ndarray:
+    # Biased randomized insertion order: the points are dealt into rounds, each about twice the size of the
+    # one before, and each round is walked along the Hilbert curve. The random rounds keep the triangulation
+    # well shaped as it grows, the curve keeps consecutive points close together.
+    keys = hilbert_keys(coords)
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    draws = create_rng(0 if seed is None else seed).random(len(keys))
+    rounds = np.minimum(np.floor(-np.log2(np.maximum(draws, np.finfo(np.float64).tiny))), np.log2(len(keys)))
+    return np.lexsort((keys, -rounds))
 
-def create_random_points(num_points: int, seed: float = None) -> List[Point]:
-    if seed is None:
-        seed = time()
-    random.seed(seed)
+
+def create_random_points(num_points: int, seed: Union[float, RandomStream] = None) -> List[Point]:
+    rng = create_python_random(seed)
     points: List[Point] = []
 
     for _ in range(num_points):
-        x = random.uniform(-1, 1)
-        y = random.uniform(-1, 1)
+        x = rng.uniform(-1, 1)
+        y = rng.uniform(-1, 1)
         point = Point(x, y)
         points.append(point)
 
@@ -48,18 +106,16 @@ def create_random_points(num_points: int, seed: float = None) -> List[Point]:
     return points
 
 
-def create_perlin1D_points(num_points: int, seed: float = None) -> List[Point]:
-    if seed is None:
-        seed = time()
-    random.seed(seed)
-    x_seed, y_seed = random.random(), random.random()
+def create_perlin1D_points(num_points: int, seed: Union[float, RandomStream] = None) -> List[Point]:
+    rng = create_python_random(seed)
+    x_seed, y_seed = rng.random(), rng.random()
     points: List[Point] = []
 
     for _ in range(num_points):
-        x = perlin.perlin1D(random.random()*8, seed=x_seed)
-        random.seed(x)
-        y = perlin.perlin1D(random.random()*8, seed=y_seed)
-        random.seed(y)
+        x = perlin.perlin1D(rng.random()*8, seed=x_seed)
+        rng.seed(x)
+        y = perlin.perlin1D(rng.random()*8, seed=y_seed)
+        rng.seed(y)
         point = Point(x, y)
         points.append(point)
 
@@ -67,19 +123,17 @@ def create_perlin1D_points(num_points: int, seed: float = None) -> List[Point]:
     return points
 
 
-def create_perlin1D_points_squared(num_points: int, seed: float = None) -> List[Point]:
-    if seed is None:
-        seed = time()
-    random.seed(seed)
-    x_seed, y_seed = random.random(), random.random()
+def create_perlin1D_points_squared(num_points: int, seed: Union[float, RandomStream] = None) -> List[Point]:
+    rng = create_python_random(seed)
+    x_seed, y_seed = rng.random(), rng.random()
     points: List[Point] = []
     max_coord = 0
 
     for _ in range(num_points):
-        x = perlin.perlin1D(random.random() * 40, seed=x_seed)
-        random.seed(x)
-        y = perlin.perlin1D(random.random() * 40, seed=y_seed)
-        random.seed(y)
+        x = perlin.perlin1D(rng.random() * 40, seed=x_seed)
+        rng.seed(x)
+        y = perlin.perlin1D(rng.random() * 40, seed=y_seed)
+        rng.seed(y)
         point = Point(x, y)
 
         if abs(point.x) > max_coord:
@@ -89,15 +143,12 @@ def create_perlin1D_points_squared(num_points: int, seed: float = None) -> List[
 
         points.append(point)
 
-    sorted_points = insert_sort_points(points)
-
-    return sorted_points
+    points.sort(key=lambda p: p.x)
+    return points
 
 
-def create_grid_points(grid_width: int, grid_height: int, seed: float = None) -> List[Point]:
-    if seed is None:
-        seed = time()
-    random.seed(seed)
+def create_grid_points(grid_width: int, grid_height: int, seed: Union[float, RandomStream] = None) -> List[Point]:
+    rng = create_python_random(seed)
     points = []
     x_base = []
     y_base = []
@@ -109,14 +160,14 @@ def create_grid_points(grid_width: int, grid_height: int, seed: float = None) ->
             elif y == int(grid_height/2)-1:
                 point_y = y+1
             else:
-                point_y = y + random.random()
+                point_y = y + rng.random()
 
             if x == int(-grid_width/2):
                 point_x = x
             elif x == int(grid_width/2)-1:
                 point_x = x+1
             else:
-                point_x = x + random.random()
+                point_x = x + rng.random()
 
             if y == int(-grid_height/2):
                 x_base.append(point_x)
@@ -128,13 +179,216 @@ def create_grid_points(grid_width: int, grid_height: int, seed: float = None) ->
             elif x == int(grid_height/2):
                 point_y = y_base[y+int(grid_width/2)]
 
-            point = Point(point_x/grid_width, point_y/grid_height)
-            for index, compare_point in enumerate(current_points):
-                if point.x < compare_point.x:
-                    current_points.insert(index, point)
-                    break
-            else:
-                current_points.append(point)
+            current_points.append(Point(point_x/grid_width, point_y/grid_height))
+        current_points.sort(key=lambda p: p.x)
         points.extend(current_points)
 
     return points
+
+
+@instrument.timed('point.create_random_coords', 'point.points_created')
+def create_random_coords(num_points: int, seed: Union[float, RandomStream] = None) -> np.ndarray:
+    rng = create_rng(seed)
+    return sort_coords(rng.uniform(-1, 1, (num_points, 2)))
+
+
+@instrument.timed('point.create_perlin1D_coords', 'point.points_created')
+def create_perlin1D_coords(num_points: int, seed: Union[float, RandomStream] = None, scale: float = 8) -> np.ndarray:
+    stream = as_stream(seed)
+    x_noise, y_noise = perlin.PerlinNoise(stream.substream('x_noise')), perlin.PerlinNoise(stream.substream('y_noise'))
+    samples = stream.substream('samples').generator.random((num_points, 2)) * scale
+    coords = np.column_stack((x_noise.noise1D(samples[:, 0], octaves=2), y_noise.noise1D(samples[:, 1], octaves=2)))
+    return sort_coords(coords)
+
+
+def create_perlin1D_coords_squared(num_points: int, seed: Union[float, RandomStream] = None) -> np.ndarray:
+    return create_perlin1D_coords(num_points, seed, scale=40)
+
+
+@instrument.timed('point.create_grid_coords', 'point.points_created')
+def create_grid_coords(grid_width: int, grid_height: int, seed: Union[float, RandomStream] = None) -> np.ndarray:
+    rng = create_rng(seed)
+    xs = np.arange(int(-grid_width/2), int(grid_width/2), dtype=np.float64)
+    ys = np.arange(int(-grid_height/2), int(grid_height/2), dtype=np.float64)
+    jitter = rng.random((2, len(xs), len(ys)))
+    point_x = xs[:, None] + jitter[0]
+    point_y = ys[None, :] + jitter[1]
+
+    # The outer columns and rows sit exactly on the grid so the map has straight edges.
+    if len(xs):
+        point_x[-1], point_x[0] = xs[-1]+1, xs[0]
+    if len(ys):
+        point_y[:, -1], point_y[:, 0] = ys[-1]+1, ys[0]
+
+    coords = np.column_stack((point_x.reshape(-1)/grid_width, point_y.reshape(-1)/grid_height))
+    return sort_coords(coords)
+
+
+def noise_radii(radius: float, max_radius: float, seed: Union[float, RandomStream] = None, frequency: float = 4.0,
+                octaves: int = 3, sharpness: float = 4.0, period: int = None) -> Callable[[np.ndarray], np.ndarray]:
+    # Spacing for create_poisson_coords from 2D noise: radius where the noise crosses zero, which is the
+    # coastline when the same noise is used as the height, easing out to max_radius away from it.
+    noise = perlin.PerlinNoise(seed)
+
+    def radii(coords: np.ndarray) -> np.ndarray:
+        height = noise.noise2D(coords[:, 0] * frequency, coords[:, 1] * frequency, octaves, period=period)
+        return radius + (max_radius - radius) * np.minimum(np.abs(height) * sharpness, 1.0)
+    return radii
+
+
+def poisson_radius(num_points: int, area: float = 1.0) -> float:
+    # About the spacing that gives num_points evenly spaced points over area, for a fixed radius.
+    return sqrt(0.62 * area / max(num_points, 1))
+
+
+def poisson_edge(start: np.ndarray, end: np.ndarray, radii: Callable[[np.ndarray], np.ndarray],
+                 rng: np.random.Generator) -> np.ndarray:
+    # The points strictly between two corners of the sample box, spaced along the edge line like the
+    # interior. Only the edge's own stream and the radii decide them, so two tiles sharing an edge agree.
+    length = float(np.hypot(*(end - start)))
+    direction = (end - start) / length
+    end_radius = float(radii(end[None])[0])
+    positions = []
+    position = 0.0
+    while True:
+        spacing = float(radii((start + direction * position)[None])[0])
+        step = spacing * (1.0 + 0.5 * rng.random())
+        # The step has to clear the radius where it lands as well.
+        step = max(step, float(radii((start + direction * (position + step))[None])[0]))
+        position += step
+        if length - position < max(end_radius, float(radii((start + direction * position)[None])[0])):
+            break
+        positions.append(position)
+    return start + direction * np.array(positions).reshape(-1, 1)
+
+
+@instrument.timed('point.create_poisson_coords', 'point.points_created')
+def create_poisson_coords(radius: float, seed: Union[float, RandomStream] = None, low=(-0.5, -0.5), high=(0.5, 0.5),
+                          radii: Callable[[np.ndarray], np.ndarray] = None, max_radius: float = None,
+                          wrap: bool = False, edges: Union[bool, Sequence] = False, attempts: int = 30) -> np.ndarray:
+    # Bridson's Poisson-disk sampling: no two points closer than radius, with no clusters and no gaps.
+    # Each accepted point tries attempts candidates around itself, and an acceleration grid with cells
+    # small enough to hold one point each means a candidate is only checked against the few points near
+    # it, so it runs in linear time.
+    #   radii: the spacing at each position, see noise_radii, clipped into [radius, max_radius]. It is
+    #       evaluated once for every grid cell, inside the box a candidate takes its cell's radius.
+    #   wrap: the box is treated as a torus, copies of the points tile the plane with no seam.
+    #   edges: the corners and points along the box's edges are placed first, giving the map straight
+    #       edges like create_grid_coords. Each edge draws from its own stream, or from the seeds given for
+    #       the bottom, right, top and left edges, so neighbouring tiles can share the edges they meet at.
+    if wrap and edges:
+        raise ValueError("a wrapped box has no edges to place points on.")
+    stream = as_stream(seed)
+    low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    size = high - low
+    if max_radius is None:
+        max_radius = radius if radii is None else 4.0 * radius
+    if radii is None:
+        radii_at = lambda coords: np.full(len(coords), radius)
+    else:
+        radii_at = lambda coords: np.clip(radii(coords), radius, max_radius)
+
+    # Cells no wider than radius/sqrt(2) can't hold two points. Wrapping needs a whole number of them.
+    shape = np.maximum(np.ceil(size / (radius / sqrt(2))).astype(np.int64), 1)
+    cell = size / shape
+    reach = np.ceil(max_radius / cell).astype(np.int64)
+    # The grid is flat and padded by the reach on every side, so the cells around a candidate are one add
+    # away and never need clipping. Wrapped, the padding holds copies of the cells on the far side.
+    padded = shape + 2 * reach
+    grid = np.full(int(padded.prod()), -1, dtype=np.int64)
+    window = ((np.arange(-reach[1], reach[1] + 1) * padded[0])[:, None] + np.arange(-reach[0], reach[0] + 1)).ravel()
+    repeats = [range(-(reach[axis] // shape[axis]) - 1, reach[axis] // shape[axis] + 2) if wrap else range(1)
+               for axis in range(2)]
+    centres = np.stack(np.meshgrid(*(low[axis] + (np.arange(shape[axis]) + 0.5) * cell[axis] for axis in range(2))),
+                       axis=-1)
+    field = np.full((padded[1], padded[0]), float(radius))
+    field[reach[1]:reach[1] + shape[1], reach[0]:reach[0] + shape[0]] = radii_at(centres.reshape(-1, 2)).reshape(
+        shape[1], shape[0])
+    field = field.ravel()
+
+    coords = np.zeros((int(shape.prod()), 2), dtype=np.float64)
+    point_cells = np.zeros(len(coords), dtype=np.int64)
+    num_coords = 0
+    active = []
+
+    def cells_of(positions: np.ndarray) -> np.ndarray:
+        columns, rows = (np.minimum(((positions - low) / cell).astype(np.int64), shape - 1) + reach).T
+        return rows * padded[0] + columns
+
+    def add(position: np.ndarray):
+        nonlocal num_coords
+        column, row = (np.minimum(((position - low) / cell).astype(np.int64), shape - 1) + reach).tolist()
+        point_cells[num_coords] = row * padded[0] + column
+        for y in repeats[1]:
+            for x in repeats[0]:
+                copy_column, copy_row = column + x * shape[0], row + y * shape[1]
+                if 0 <= copy_column < padded[0] and 0 <= copy_row < padded[1]:
+                    grid[copy_row * padded[0] + copy_column] = num_coords
+        coords[num_coords] = position
+        active.append(num_coords)
+        num_coords += 1
+
+    if edges:
+        corners = np.array((low, (high[0], low[1]), high, (low[0], high[1])))
+        edge_seeds = [stream.substream('edge', side) for side in range(4)] if edges is True else list(edges)
+        for corner in corners:
+            add(corner)
+        # Bottom and top run along +x, right and left along +y, the same way round on both tiles.
+        for (start, end), edge_seed in zip(((0, 1), (1, 2), (3, 2), (0, 3)), edge_seeds):
+            for position in poisson_edge(corners[start], corners[end], radii_at, create_rng(edge_seed)):
+                add(position)
+
+    rng = stream.substream('interior').generator
+    if not active:
+        add(low + rng.random(2) * size)
+
+    # Active points are taken in batches, so each numpy call checks every candidate of up to BATCH points.
+    # Each point offers its first free candidate, and those are accepted in turn unless they crowd one
+    # accepted just before them, in which case the point stays active and tries again.
+    while active:
+        slots = np.unique((rng.random(min(len(active), POISSON_BATCH)) * len(active)).astype(np.int64))
+        sources = np.array(active, dtype=np.int64)[slots]
+        draws = rng.random((len(sources), attempts, 2))
+        # Candidates spread evenly over the annulus between one and two radii.
+        angles = draws[..., 1] * 2.0 * np.pi
+        distances = np.sqrt(1.0 + 3.0 * draws[..., 0]) * field[point_cells[sources]][:, None]
+        candidates = coords[sources][:, None] + np.stack((np.cos(angles), np.sin(angles)), axis=-1) * distances[..., None]
+        if wrap:
+            candidates = low + np.mod(candidates - low, size)
+        else:
+            candidates = np.clip(candidates, low, high)
+        cells = cells_of(candidates.reshape(-1, 2)).reshape(candidates.shape[:2])
+        if wrap:
+            inside = np.ones(cells.shape, dtype=bool)
+        else:
+            # With points on the edges, the interior ones keep half their radius clear of them as well, or
+            # one squeezed into a wide gap between two edge points makes a sliver and a bent edge.
+            margin = 0.5 * field[cells][..., None] if edges else 0.0
+            inside = ((candidates > low + margin) & (candidates < high - margin)).all(axis=2)
+
+        neighbors = grid[cells[..., None] + window]
+        offsets = coords[neighbors] - candidates[..., None, :]
+        if wrap:
+            offsets -= np.round(offsets / size) * size
+        radii_squared = field[cells] ** 2
+        close = (neighbors >= 0) & ((offsets ** 2).sum(axis=3) < radii_squared[..., None])
+        free = inside & ~close.any(axis=2)
+        firsts = free.argmax(axis=1)
+        found = free[np.arange(len(sources)), firsts]
+
+        offered = np.flatnonzero(found)
+        picked = candidates[offered, firsts[offered]]
+        between = picked[:, None] - picked[None]
+        if wrap:
+            between -= np.round(between / size) * size
+        crowded = ((between ** 2).sum(axis=2) < radii_squared[offered, firsts[offered]][:, None]).tolist()
+        accepted = []
+        for row, position in enumerate(picked):
+            if not any(crowded[row][other] for other in accepted):
+                accepted.append(row)
+                add(position)
+
+        for slot in sorted(slots[~found].tolist(), reverse=True):
+            active[slot] = active[-1]
+            active.pop()
+    return sort_coords(coords[:num_coords])
@@ -0,0 +1,135 @@
+from fractions import Fraction
+from math import inf, sqrt
+
+import numpy as np
+
+# Geometric predicates with a floating point filter: the plain float determinant is used whenever it is
+# further from zero than its worst case rounding error, otherwise the sign is worked out exactly with
+# Fractions. The error bounds are Shewchuk's, for determinants laid out the same way as below, apart from
+# circumcircle's, which is worked out where it is computed.
+EPSILON = 2.0 ** -53
+ORIENT_BOUND = (3 + 16 * EPSILON) * EPSILON
+INCIRCLE_BOUND = (10 + 96 * EPSILON) * EPSILON
+CENTER_BOUND = 540 * EPSILON
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+def orient2d_exact(ax, ay, bx, by, cx, cy) -> int:
+    ax, ay, bx, by, cx, cy = map(Fraction, (ax, ay, bx, by, cx, cy))
+    return sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def orient2d(ax, ay, bx, by, cx, cy) -> float:
+    # Positive when a, b, c run counter-clockwise, negative when clockwise and 0 only when exactly collinear.
+    left = (bx - ax) * (cy - ay)
+    right = (by - ay) * (cx - ax)
+    det = left - right
+    if abs(det) > ORIENT_BOUND * (abs(left) + abs(right)):
+        return det
+    return orient2d_exact(ax, ay, bx, by, cx, cy)
+
+
+def incircle_exact(ax, ay, bx, by, cx, cy, dx, dy) -> int:
+    ax, ay, bx, by, cx, cy, dx, dy = map(Fraction, (ax, ay, bx, by, cx, cy, dx, dy))
+    adx, ady, bdx, bdy, cdx, cdy = ax - dx, ay - dy, bx - dx, by - dy, cx - dx, cy - dy
+    return sign((adx*adx + ady*ady) * (bdx*cdy - cdx*bdy) +
+                (bdx*bdx + bdy*bdy) * (cdx*ady - adx*cdy) +
+                (cdx*cdx + cdy*cdy) * (adx*bdy - bdx*ady))
+
+
+def incircle(ax, ay, bx, by, cx, cy, dx, dy) -> float:
+    # Positive when d is inside the circle through the counter-clockwise triangle a, b, c.
+    adx, ady, bdx, bdy, cdx, cdy = ax - dx, ay - dy, bx - dx, by - dy, cx - dx, cy - dy
+    bdxcdy, cdxbdy = bdx * cdy, cdx * bdy
+    cdxady, adxcdy = cdx * ady, adx * cdy
+    adxbdy, bdxady = adx * bdy, bdx * ady
+    alift, blift, clift = adx*adx + ady*ady, bdx*bdx + bdy*bdy, cdx*cdx + cdy*cdy
+    det = alift * (bdxcdy - cdxbdy) + blift * (cdxady - adxcdy) + clift * (adxbdy - bdxady)
+    permanent = ((abs(bdxcdy) + abs(cdxbdy)) * alift + (abs(cdxady) + abs(adxcdy)) * blift +
+                 (abs(adxbdy) + abs(bdxady)) * clift)
+    if abs(det) > INCIRCLE_BOUND * permanent:
+        return det
+    return incircle_exact(ax, ay, bx, by, cx, cy, dx, dy)
+
+
+def circumcircle(ax, ay, bx, by, cx, cy):
+    # The circle's center and squared radius from determinants, followed by an error bound for testing a
+    # point against it: radius - dist is only trusted when it is further from zero than
+    # dist * dist_error + error. A collinear triangle's circle is at infinity.
+    bx, by, cx, cy = bx - ax, by - ay, cx - ax, cy - ay
+    b_len, c_len = bx*bx + by*by, cx*cx + cy*cy
+    div = 2 * (bx*cy - by*cx)
+    if div == 0:
+        return inf, inf, inf, inf, inf
+    center_x = (cy*b_len - by*c_len) / div
+    center_y = (bx*c_len - cx*b_len) / div
+    radius = center_x*center_x + center_y*center_y
+    length = sqrt(radius)
+    # How far the computed center, relative to a, can be from the true one, in units of EPSILON, the most
+    # one rounding changes a value by relative to it. b and c are chords of the circle, so neither is longer
+    # than 2 * length. Each numerator is at most 7 roundings from its exact value, of size
+    # |b||c|(|b| + |c|) <= 16 * length**3. div is at most 4 roundings from its exact value, of size
+    # 2|b||c| <= 8 * length**2, which moves each coordinate by |center| / |div| times as much, and the
+    # division rounds once more. Over both coordinates that is 2*7*16 + 4*8*sqrt(2) < 270 of
+    # length**3 / |div| and 2 of length. CENTER_BOUND doubles it to allow for length being the computed
+    # rather than the true radius and for the second order terms left out, which holds while the error is
+    # under a quarter of the radius. Past that the circle is never trusted.
+    center_error = CENTER_BOUND * radius * length / abs(div) + 4 * EPSILON * length
+    if not center_error < 0.25 * length:
+        return center_x + ax, center_y + ay, radius, inf, inf
+    # Rounding center + a moves the stored center by a further ulp of each coordinate.
+    shift = center_error + EPSILON * (abs(ax) + abs(ay) + 2 * length)
+    # Testing a point p, at computed squared distance dist from the stored center, radius - dist is off from
+    # the true radius**2 - |p - center|**2 by at most
+    #   center_error * (2 * length + center_error) + 3 * EPSILON * radius   from the radius
+    #   shift * (2 * |p - center| + shift) + 5 * EPSILON * dist            from the distance
+    # counting the final subtraction. 2 * |p - center| is at most dist / length + length, which keeps the
+    # bound linear in dist. The EPSILON counts are rounded up for the second order terms.
+    return (center_x + ax, center_y + ay, radius, shift / length + 8 * EPSILON,
+            center_error * (2 * length + center_error) + shift * (length + shift) + 4 * EPSILON * radius)
+
+
+def circumcircles(coords: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    # Every triangle's circumcenter and squared radius at once, (inf, inf, inf) for collinear triangles.
+    a = coords[triangles[:, 0]]
+    b = coords[triangles[:, 1]] - a
+    c = coords[triangles[:, 2]] - a
+    b_len = (b * b).sum(axis=1)
+    c_len = (c * c).sum(axis=1)
+    div = 2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    degenerate = div == 0
+    div = np.where(degenerate, 1, div)
+    center_x = (c[:, 1] * b_len - b[:, 1] * c_len) / div
+    center_y = (b[:, 0] * c_len - c[:, 0] * b_len) / div
+    circles = np.column_stack((center_x + a[:, 0], center_y + a[:, 1], center_x**2 + center_y**2))
+    circles[degenerate] = inf
+    return circles
+
+
+def orient2d_batch(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # The sign of orient2d for rows of points, exact rows are only computed where the filter fails.
+    left = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1])
+    right = (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    det = left - right
+    signs = np.sign(det).astype(np.int8)
+    for row in np.flatnonzero(np.abs(det) <= ORIENT_BOUND * (np.abs(left) + np.abs(right))).tolist():
+        signs[row] = orient2d_exact(*a[row].tolist(), *b[row].tolist(), *c[row].tolist())
+    return signs
+
+
+def incircle_batch(a: np.ndarray, b: np.ndarray, c: np.ndarray, d: np.ndarray) -> np.ndarray:
+    ad, bd, cd = a - d, b - d, c - d
+    bdxcdy, cdxbdy = bd[:, 0] * cd[:, 1], cd[:, 0] * bd[:, 1]
+    cdxady, adxcdy = cd[:, 0] * ad[:, 1], ad[:, 0] * cd[:, 1]
+    adxbdy, bdxady = ad[:, 0] * bd[:, 1], bd[:, 0] * ad[:, 1]
+    alift, blift, clift = (ad * ad).sum(axis=1), (bd * bd).sum(axis=1), (cd * cd).sum(axis=1)
+    det = alift * (bdxcdy - cdxbdy) + blift * (cdxady - adxcdy) + clift * (adxbdy - bdxady)
+    permanent = ((np.abs(bdxcdy) + np.abs(cdxbdy)) * alift + (np.abs(cdxady) + np.abs(adxcdy)) * blift +
+                 (np.abs(adxbdy) + np.abs(bdxady)) * clift)
+    signs = np.sign(det).astype(np.int8)
+    for row in np.flatnonzero(np.abs(det) <= INCIRCLE_BOUND * permanent).tolist():
+        signs[row] = incircle_exact(*a[row].tolist(), *b[row].tolist(), *c[row].tolist(), *d[row].tolist())
+    return signs
@@ -0,0 +1,147 @@
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+import numpy as np
+
+import instrument
+from mesh import TriangleMesh
+from spatial import MeshIndex
+
+# Renders maps to arrays without a window or a gpu. Every pixel centre is located in the mesh with a
+# MeshIndex, so a block of pixels is a handful of numpy calls whatever the number of triangles, and the
+# attributes of the triangle's vertices are blended with the pixel's barycentric weights. The image is
+# cut into square blocks which can run on several threads, the heavy numpy calls release the GIL and
+# the index and the image are shared rather than copied to other processes.
+#
+#   image = raster.render_plates(plate_map, 1024, 1024)
+#   raster.write_png('plates.png', image)
+BLOCK = 256
+
+
+def pixel_centres(low: np.ndarray, high: np.ndarray, width: int, height: int, rows: slice, columns: slice):
+    # Row 0 is the top of the image, the high y edge of the box.
+    xs = low[0] + (np.arange(columns.start, columns.stop) + 0.5) * (high[0] - low[0]) / width
+    ys = high[1] - (np.arange(rows.start, rows.stop) + 0.5) * (high[1] - low[1]) / height
+    return np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+
+
+def barycentric(mesh: TriangleMesh, triangles: np.ndarray, coords: np.ndarray) -> np.ndarray:
+    # The weight of each of the triangle's vertices at each position, each row summing to one.
+    a, b, c = (mesh.coords[mesh.triangles[triangles, i]] for i in range(3))
+    v0, v1, v2 = b - a, c - a, coords - a
+    denominator = v0[:, 0] * v1[:, 1] - v1[:, 0] * v0[:, 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        second = (v2[:, 0] * v1[:, 1] - v1[:, 0] * v2[:, 1]) / denominator
+        third = (v0[:, 0] * v2[:, 1] - v2[:, 0] * v0[:, 1]) / denominator
+    weights = np.column_stack((1.0 - second - third, second, third))
+    # A pixel on an edge can land just outside, and slivers have no area to divide by.
+    weights = np.nan_to_num(np.clip(weights, 0.0, 1.0), nan=1.0 / 3.0)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+@instrument.timed('raster.rasterize')
+def rasterize(mesh: TriangleMesh, attributes: np.ndarray, width: int, height: int, low=(-0.5, -0.5),
+              high=(0.5, 0.5), index: MeshIndex = None, workers: int = 1, nearest: bool = False,
+              fill: float = np.nan) -> Tuple[np.ndarray, np.ndarray]:
+    # Samples per-vertex attributes, one row per mesh coordinate, over the box from low to high. Returns
+    # a (height, width, k) float32 image of the blended attributes, or with nearest those of the
+    # triangle's vertex nearest the pixel, so discrete values like plates stay whole, and a (height, width)
+    # image of the triangle under each pixel. Pixels off the mesh get fill and triangle -1.
+    attributes = np.asarray(attributes)
+    attributes = attributes.reshape(len(attributes), -1)
+    low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    index = index or MeshIndex(mesh)
+    values = np.full((height, width, attributes.shape[1]), fill, dtype=np.float32)
+    triangle_image = np.full((height, width), -1, dtype=np.int32)
+
+    def render_block(block: Tuple[slice, slice]):
+        rows, columns = block
+        coords = pixel_centres(low, high, width, height, rows, columns)
+        triangles = index.locate_many(coords)
+        found = np.flatnonzero(triangles >= 0)
+        weights = barycentric(mesh, triangles[found], coords[found])
+        vertices = mesh.triangles[triangles[found]]
+        if nearest:
+            block_values = attributes[vertices[np.arange(len(found)), weights.argmax(axis=1)]]
+        else:
+            block_values = (attributes[vertices] * weights[..., None]).sum(axis=1)
+        shape = (rows.stop - rows.start, columns.stop - columns.start)
+        flat_values = values[rows, columns].reshape(-1, attributes.shape[1])
+        flat_values[found] = block_values
+        values[rows, columns] = flat_values.reshape(shape + (-1,))
+        triangle_image[rows, columns] = triangles.reshape(shape)
+
+    blocks = [(slice(row, min(row + BLOCK, height)), slice(column, min(column + BLOCK, width)))
+              for row in range(0, height, BLOCK) for column in range(0, width, BLOCK)]
+    if workers == 1 or len(blocks) == 1:
+        for block in blocks:
+            render_block(block)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_block, blocks))
+    return values, triangle_image
+
+
+def plate_palette(num_plates: int) -> np.ndarray:
+    # The colours plate_test.frag gives each plate, as RGBA bytes.
+    values = np.arange(num_plates) / max(num_plates - 1, 1)
+    colours = np.column_stack((np.full(num_plates, 0.5), values, values, np.ones(num_plates)))
+    return (colours * 255).round().astype(np.uint8)
+
+
+def render_plates(plate_map, width: int, height: int, low=(-0.5, -0.5), high=(0.5, 0.5), palette: np.ndarray = None,
+                  workers: int = 1) -> np.ndarray:
+    # A (height, width, 4) RGBA image of a PlateMap, each pixel coloured by the plate of the triangle's
+    # vertex nearest to it. Off the map, and on unclaimed points, is transparent.
+    palette = plate_palette(len(plate_map.plates)) if palette is None else np.asarray(palette, dtype=np.uint8)
+    point_map = plate_map.map
+    plates, _ = rasterize(point_map.triangulation.mesh, plate_map.point_plates, width, height, low, high,
+                          point_map.index, workers, nearest=True, fill=-1)
+    plates = plates[..., 0].astype(np.int64)
+    image = palette[np.maximum(plates, 0)]
+    image[plates < 0] = 0
+    return image
+
+
+def render_heights(mesh: TriangleMesh, heights: np.ndarray, width: int, height: int, low=(-0.5, -0.5),
+                   high=(0.5, 0.5), index: MeshIndex = None, workers: int = 1) -> np.ndarray:
+    # A (height, width) float32 heightmap blended from the height of every vertex, NaN off the mesh.
+    values, _ = rasterize(mesh, heights, width, height, low, high, index, workers)
+    return values[..., 0]
+
+
+def height_image(heights: np.ndarray, low: float = None, high: float = None) -> np.ndarray:
+    # Heights scaled onto 16 bit greys for write_png, from low or the lowest height to high or the highest.
+    finite = heights[np.isfinite(heights)]
+    low = float(finite.min()) if low is None and len(finite) else (low or 0.0)
+    high = float(finite.max()) if high is None and len(finite) else (high or 1.0)
+    scaled = (np.nan_to_num(heights, nan=low) - low) / ((high - low) or 1.0)
+    return (np.clip(scaled, 0.0, 1.0) * 65535).round().astype(np.uint16)
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def write_png(path: str, image: np.ndarray, level: int = 6):
+    # Writes a (height, width) grey, or (height, width, 3 or 4) RGB or RGBA, image of 8 or 16 bit values
+    # with nothing but zlib. Rows are written unfiltered.
+    image = np.asarray(image)
+    if image.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f"can't write {image.dtype} pixels, convert them to uint8 or uint16 first.")
+    if image.ndim == 2:
+        image = image[..., None]
+    height, width, channels = image.shape
+    colour_types = {1: 0, 2: 4, 3: 2, 4: 6}
+    if channels not in colour_types:
+        raise ValueError(f"can't write an image with {channels} channels.")
+    rows = image.astype(image.dtype.newbyteorder('>')).reshape(height, -1).view(np.uint8)
+    raw = np.hstack((np.zeros((height, 1), dtype=np.uint8), rows)).tobytes()
+    header = struct.pack('>IIBBBBB', width, height, image.dtype.itemsize * 8, colour_types[channels], 0, 0, 0)
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(png_chunk(b'IHDR', header))
+        file.write(png_chunk(b'IDAT', zlib.compress(raw, level)))
+        file.write(png_chunk(b'IEND', b''))
@@ -1,12 +1,19 @@
-from array import array
-from time import time
-
-from arcade import ArcadeContext, draw_point
+from arcade import ArcadeContext
 import arcade.gl as gl
+import numpy as np
 
 from triangulation import Triangulation
+import lod
 import maps
+from background import BackgroundStepper, StepperSnapshot
+from mapcache import MapCache
 from point import *
+from streams import RandomStream
+
+# Seeded maps are only generated the first time they are asked for. The samples use the same seed unless
+# they are given another, so running them again loads the maps instead of making them.
+map_cache = MapCache('.map_cache', max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 60 * 60)
+DEFAULT_SEED = 1
 
 
 class GridTriangulationExample:
@@ -16,8 +23,8 @@ class GridTriangulationExample:
         self.ctx: ArcadeContext = ctx
         self.program = self.ctx.load_program(vertex_shader="shaders/first_test.vert",
                                              fragment_shader="shaders/first_test.frag")
-        self.data = self.ctx.buffer(data=array('f', list(self.triangles.point_data())))
-        self.indices = self.ctx.buffer(data=array('i', list(self.triangles.indices())))
+        self.data = self.ctx.buffer(data=self.triangles.vertex_buffer())
+        self.indices = self.ctx.buffer(data=self.triangles.line_buffer())
         self.renderer = self.ctx.geometry([gl.BufferDescription(self.data, '2f', ['in_pos'])],
                                           index_buffer=self.indices, mode=self.ctx.LINES)
 
@@ -26,61 +33,117 @@ class GridTriangulationExample:
 
 
 class BasicPlateExample:
+    # Every level of detail shares the vertex and plate buffers and has its own index buffer, each frame
+    # draws the coarsest one that stays within tolerance pixels of the full map at the current zoom.
+    # Scrolling zooms in and out.
 
-    def __init__(self, ctx):
+    def __init__(self, ctx, seed=DEFAULT_SEED, tolerance: float = 1.0, size: int = 128):
         self.ctx: ArcadeContext = ctx
-        self.plate_map: maps.PlateMap = maps.create_plate_map(16, 16, 12, 0.4)
-        self.program = self.ctx.load_program(vertex_shader="shaders/plate_test.vert",
-                                             fragment_shader="shaders/plate_test.frag")
-        data, indices = self.plate_map.get_buffer_data()
-        self.data = self.ctx.buffer(data=data)
-        self.indices = self.ctx.buffer(data=indices)
-
-        self.renderer = self.ctx.geometry([gl.BufferDescription(self.data, '2f 1f', ['in_pos', 'plate'])],
-                                          index_buffer=self.indices, mode=self.ctx.TRIANGLES)
+        # Big enough that zooming out far enough drops several levels.
+        self.plate_map: maps.PlateMap = map_cache.plate_map(size, size, 12, 0.4, seed)
+        self.lod: lod.LODHierarchy = lod.build_lod(self.plate_map, min_triangles=256)
+        self.tolerance = tolerance
+        self.zoom = 1.0
+        # Flat shaded, so each triangle takes the plate of the vertex its index buffer entry ends on.
+        self.program = self.ctx.load_program(vertex_shader="shaders/plate_flat.vert",
+                                             fragment_shader="shaders/plate_flat.frag")
+        buffers = self.plate_map.export_buffers()
+        self.data = self.ctx.buffer(data=buffers.positions)
+        self.plates = self.ctx.buffer(data=buffers.plates)
+        self.indices = [self.ctx.buffer(data=level.index_buffer()) for level in self.lod.levels]
+
+        self.renderers = [self.ctx.geometry([gl.BufferDescription(self.data, '2f', ['in_pos']),
+                                             gl.BufferDescription(self.plates, '1f', ['plate'])],
+                                            index_buffer=indices, mode=self.ctx.TRIANGLES)
+                          for indices in self.indices]
+
+    def zoom_by(self, factor: float):
+        self.zoom = min(max(self.zoom * factor, 1.0 / 64), 64.0)
 
     def draw(self):
-        self.renderer.render(self.program)
+        # plate_test.vert doubles positions before zooming, so at a zoom of one a map unit spans the viewport.
+        pixels_per_unit = min(self.ctx.viewport[2:]) * self.zoom
+        self.program['zoom'] = self.zoom
+        self.renderers[self.lod.select(pixels_per_unit, self.tolerance)].render(self.program)
 
 
 class StepperPlateExample:
+    # The plates grow on a background thread, the window only draws what has been handed over so far.
+    # Every point's plate lives in a vertex attribute that starts out unclaimed and is patched in place as
+    # claims come in, so a frame is the same three draws however big the map is.
 
-    def __init__(self, ctx):
+    def __init__(self, ctx, seed=DEFAULT_SEED):
         self.ctx: ArcadeContext = ctx
-        self.stepper = maps.PlateMapStepperInfo(100, 100, 24, 0.55)
-        self.last_step = time()
+        # Resolved once, so the point map and the stepper both come from the seed the stepper records.
+        seed = RandomStream(seed).seed
+        self.generator = BackgroundStepper(
+            lambda: maps.PlateMapStepperInfo(100, 100, 24, 0.55, seed, map_cache.point_map(100, 100, seed)),
+            interval=0.1).start()
+        self.snapshot: StepperSnapshot = None
 
         self.program = self.ctx.load_program(vertex_shader="shaders/first_test.vert",
                                              fragment_shader="shaders/first_test.frag")
-        self.data = self.ctx.buffer(data=array('f', list(self.stepper.point_map.triangulation.point_data())))
-        self.indices = self.ctx.buffer(data=array('i', list(self.stepper.point_map.triangulation.indices())))
-        self.renderer = self.ctx.geometry([gl.BufferDescription(self.data, '2f', ['in_pos'])],
-                                          index_buffer=self.indices, mode=self.ctx.LINES)
+        self.point_program = self.ctx.load_program(vertex_shader="shaders/plate_points.vert",
+                                                   fragment_shader="shaders/plate_points.frag")
+        self.ctx.enable(self.ctx.PROGRAM_POINT_SIZE)
+        self.renderer = None
+        self.point_renderer = None
+        self.triangle_renderer = None
+
+    @property
+    def progress(self) -> float:
+        return self.generator.progress
+
+    def plate_attributes(self, plates: np.ndarray) -> np.ndarray:
+        # (value, type) for each plate index, the value matching the colours the plates have always had.
+        num_plates = max(self.snapshot.plate_num-1, 1)
+        return np.column_stack((plates / num_plates, self.plate_types[plates])).astype(np.float32)
+
+    def update(self):
+        if self.snapshot is None:
+            self.snapshot = self.generator.snapshot()
+            if self.snapshot is None:
+                return
+            buffers = self.snapshot.buffers
+            self.plate_types = np.array(self.snapshot.plate_types, dtype=np.float32)
+            self.plates = np.column_stack((np.full(len(buffers.positions), -1), np.zeros(len(buffers.positions))))
+            self.plates = self.plates.astype(np.float32)
+
+            self.data = self.ctx.buffer(data=buffers.positions)
+            self.indices = self.ctx.buffer(data=buffers.lines)
+            self.plate_data = self.ctx.buffer(data=self.plates)
+            self.renderer = self.ctx.geometry([gl.BufferDescription(self.data, '2f', ['in_pos'])],
+                                              index_buffer=self.indices, mode=self.ctx.LINES)
+            self.point_renderer = self.ctx.geometry([gl.BufferDescription(self.data, '2f', ['in_pos']),
+                                                     gl.BufferDescription(self.plate_data, '2f', ['in_plate'])],
+                                                    mode=self.ctx.POINTS)
+
+        claimed = self.generator.claims()
+        if claimed:
+            indices, plates = np.array(claimed, dtype=np.int64).T
+            self.plates[indices] = self.plate_attributes(plates)
+            for start, end in maps.dirty_ranges(indices):
+                self.plate_data.write(self.plates[start:end].tobytes(), offset=start * self.plates.strides[0])
+
+        labelled = self.generator.labels()
+        if labelled:
+            vertices = np.array([triangle for triangle, _ in labelled], dtype=np.int64)
+            centers = self.snapshot.buffers.positions[vertices].mean(axis=1).astype(np.float32)
+            plates = self.plate_attributes(np.array([plate for _, plate in labelled], dtype=np.int64))
+            self.centers = self.ctx.buffer(data=centers)
+            self.center_plates = self.ctx.buffer(data=plates)
+            self.triangle_renderer = self.ctx.geometry([gl.BufferDescription(self.centers, '2f', ['in_pos']),
+                                                        gl.BufferDescription(self.center_plates, '2f', ['in_plate'])],
+                                                       mode=self.ctx.POINTS)
 
     def draw(self):
+        self.update()
+        if self.renderer is None:
+            return
         self.renderer.render(self.program)
 
-        for plate in self.stepper.plate_data:
-            color = 50 + int(plate.index/(self.stepper.plate_num-1)*125)
-            for point in plate.points:
-                pos = point.pos
-                draw_point((pos.x + 0.5) * 1920, (pos.y + 0.5) * 1080, (125*plate.type, color, color), 15)
-
-        for triangle, plate in self.stepper.triangles:
-            color = 50 + int(plate/(self.stepper.plate_num-1)*125)
-            pos_x = 0
-            pos_y = 0
-            for vertex in triangle.vertices:
-                pos = self.stepper.point_map.triangulation.points[vertex]
-                pos_x += pos.x
-                pos_y += pos.y
-
-            pos_x /= 3
-            pos_y /= 3
-
-            draw_point((pos_x + 0.5) * 1920, (pos_y + 0.5) * 1080,
-                       (self.stepper.plate_data[plate].type*125, color, color), 9)
-
-        if time() > self.last_step + 0.1:
-            self.stepper.step()
-            self.last_step = time()
+        self.point_program['point_size'] = 15.0
+        self.point_renderer.render(self.point_program)
+        if self.triangle_renderer is not None:
+            self.point_program['point_size'] = 9.0
+            self.triangle_renderer.render(self.point_program)
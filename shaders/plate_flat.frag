@@ -0,0 +1,7 @@
+#version 330
+
+flat in vec3 colour;
+
+void main() {
+    gl_FragColor = vec4(colour, 1.0);
+}
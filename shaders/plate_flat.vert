@@ -0,0 +1,13 @@
+#version 330
+
+in vec2 in_pos;
+in float plate;
+
+uniform float zoom = 1.0;
+
+flat out vec3 colour;
+
+void main() {
+    colour = vec3(0.5, vec2(plate));
+    gl_Position = vec4(2*zoom*in_pos, 0.0, 1.0);
+}
@@ -0,0 +1,17 @@
+#version 330
+
+in vec2 in_pos;
+// The plate's value in [0, 1], or negative before the point is claimed, and the plate's type.
+in vec2 in_plate;
+
+uniform float point_size;
+
+out vec3 colour;
+
+void main() {
+    float shade = (50.0 + 125.0 * in_plate.x) / 255.0;
+    colour = vec3(125.0 * in_plate.y / 255.0, shade, shade);
+    gl_PointSize = point_size;
+    // Unclaimed points are put outside of the clip volume so they are never drawn.
+    gl_Position = in_plate.x < 0.0 ? vec4(2.0, 2.0, 2.0, 1.0) : vec4(2*in_pos, 0.0, 1.0);
+}
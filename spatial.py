@@ -0,0 +1,158 @@
+import numpy as np
+
+from mesh import TriangleMesh
+from predicates import ORIENT_BOUND
+
+
+class Grid:
+    # A uniform grid over a bounding box with items bucketed into its cells as compressed rows: the items in
+    # cell c are items[offsets[c]:offsets[c+1]].
+
+    def __init__(self, low: np.ndarray, high: np.ndarray, side: int):
+        self.low: np.ndarray = np.asarray(low, dtype=np.float64)
+        self.high: np.ndarray = np.asarray(high, dtype=np.float64)
+        self.side: int = max(1, side)
+        self.size: np.ndarray = np.maximum((np.asarray(high) - self.low) / self.side, np.finfo(np.float64).tiny)
+        self.offsets: np.ndarray = np.zeros(self.side * self.side + 1, dtype=np.int64)
+        self.items: np.ndarray = np.zeros(0, dtype=np.int64)
+
+    def cells_of(self, coords: np.ndarray) -> np.ndarray:
+        return np.clip((np.asarray(coords) - self.low) / self.size, 0, self.side - 1).astype(np.int64)
+
+    def cell_index(self, column: np.ndarray, row: np.ndarray) -> np.ndarray:
+        return row * self.side + column
+
+    def bucket(self, cells: np.ndarray, items: np.ndarray):
+        order = np.argsort(cells, kind='stable')
+        self.items = items[order]
+        self.offsets[:] = 0
+        np.cumsum(np.bincount(cells, minlength=self.side * self.side), out=self.offsets[1:])
+
+    def entries_in(self, owners: np.ndarray, cells: np.ndarray):
+        # Every (owner, item) pair for the items in each owner's cell.
+        counts = self.offsets[cells + 1] - self.offsets[cells]
+        firsts = np.repeat(self.offsets[cells] - (np.cumsum(counts) - counts), counts)
+        return np.repeat(owners, counts), self.items[firsts + np.arange(counts.sum())]
+
+
+class PointGrid(Grid):
+    # Points bucketed into a grid of about two points a cell. Each cell also knows a point from its nearest
+    # non-empty cell, to start nearest point searches from.
+
+    def __init__(self, coords: np.ndarray, indices: np.ndarray = None):
+        self.coords: np.ndarray = coords
+        indices = np.arange(len(coords)) if indices is None else np.asarray(indices, dtype=np.int64)
+        used = coords[indices]
+        low, high = (used.min(axis=0), used.max(axis=0)) if len(used) else (np.zeros(2), np.ones(2))
+        super().__init__(low, high, int((len(used) / 2) ** 0.5))
+        self.bucket(self.cell_index(*self.cells_of(used).T), indices)
+
+        # Empty cells borrow a point from a filled neighbour until every cell has one.
+        guesses = np.full(self.side * self.side, -1, dtype=np.int64)
+        filled = np.diff(self.offsets) > 0
+        guesses[filled] = self.items[self.offsets[:-1][filled]]
+        guesses = guesses.reshape(self.side, self.side)
+        while len(self.items) and (guesses < 0).any():
+            for axis in (0, 1):
+                for shift in (-1, 1):
+                    moved = np.roll(guesses, shift, axis=axis)
+                    edge = [slice(None), slice(None)]
+                    edge[axis] = 0 if shift == 1 else -1
+                    moved[tuple(edge)] = -1
+                    guesses = np.where(guesses < 0, moved, guesses)
+        self.guesses: np.ndarray = guesses.reshape(-1)
+
+    def nearest(self, queries: np.ndarray, chunk: int = 1 << 16) -> np.ndarray:
+        # The closest point to each query. The guess from the query's cell gives a distance no answer can
+        # be further than, then every point in the cells that come within that distance is checked, going
+        # column by column so only cells actually overlapping the circle are visited.
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        best = np.full(len(queries), -1, dtype=np.int64)
+        if not len(self.items):
+            return best
+        for start in range(0, len(queries), chunk):
+            part = queries[start:start + chunk]
+            home = self.cells_of(part)
+            guess = self.guesses[self.cell_index(home[:, 0], home[:, 1])]
+            limit = ((self.coords[guess] - part) ** 2).sum(axis=1)
+            radius = np.sqrt(limit)
+
+            first = self.cells_of(part - radius[:, None])[:, 0]
+            last = self.cells_of(part + radius[:, None])[:, 0]
+            counts = last - first + 1
+            owners = np.repeat(np.arange(len(part)), counts)
+            column = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            left = self.low[0] + column * self.size[0]
+            gap = np.maximum(np.maximum(left - part[owners, 0], part[owners, 0] - left - self.size[0]), 0)
+            reach = np.sqrt(np.maximum(limit[owners] - gap * gap, 0))
+            bottom = self.cells_of(np.column_stack((left, part[owners, 1] - reach)))[:, 1]
+            top = self.cells_of(np.column_stack((left, part[owners, 1] + reach)))[:, 1]
+
+            counts = top - bottom + 1
+            row = np.repeat(bottom, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            owners, points = self.entries_in(np.repeat(owners, counts),
+                                             self.cell_index(np.repeat(column, counts), row))
+            dist = ((self.coords[points] - part[owners]) ** 2).sum(axis=1)
+            order = np.lexsort((points, dist, owners))
+            owners, points = owners[order], points[order]
+            closest = np.append(True, owners[1:] != owners[:-1])
+            best[start + owners[closest]] = points[closest]
+        return best
+
+
+class MeshIndex:
+    # A spatial index over a triangle mesh. Triangles are bucketed into every cell their bounding box
+    # touches, so finding the triangle under a point only tests the few triangles in its cell, and the
+    # mesh's vertices get a PointGrid for nearest vertex queries. Built once, then every query is about
+    # O(1) and the batched forms answer whole arrays of queries at once.
+
+    def __init__(self, mesh: TriangleMesh):
+        self.mesh = mesh
+        self.vertices: PointGrid = PointGrid(mesh.coords, np.unique(mesh.triangles))
+
+        coords, triangles = mesh.coords, mesh.triangles
+        corners = coords[triangles]
+        self.triangles: Grid = Grid(corners.min(axis=(0, 1)) if len(triangles) else np.zeros(2),
+                                    corners.max(axis=(0, 1)) if len(triangles) else np.ones(2),
+                                    int((len(triangles) / 2) ** 0.5))
+        low = self.triangles.cells_of(corners.min(axis=1))
+        high = self.triangles.cells_of(corners.max(axis=1))
+        spans = high - low + 1
+        counts = spans[:, 0] * spans[:, 1]
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        width = np.repeat(spans[:, 0], counts)
+        column = np.repeat(low[:, 0], counts) + local % width
+        row = np.repeat(low[:, 1], counts) + local // width
+        self.triangles.bucket(self.triangles.cell_index(column, row), np.repeat(np.arange(len(triangles)), counts))
+
+    def locate_many(self, queries: np.ndarray) -> np.ndarray:
+        # The triangle holding each query point, or -1 outside of the mesh. A point on an edge goes to
+        # either of the triangles sharing it.
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        found = np.full(len(queries), -1, dtype=np.int64)
+        cells = self.triangles.cells_of(queries)
+        # Against the box's own corner, low + side * size can round to just inside the last vertex.
+        inside_box = ((queries >= self.triangles.low) & (queries <= self.triangles.high)).all(axis=1)
+        owners = np.flatnonzero(inside_box)
+        owners, triangles = self.triangles.entries_in(owners, self.triangles.cell_index(*cells[owners].T))
+
+        # Triangles are clockwise, so a point inside is never to the left of any edge.
+        corners = self.mesh.coords[self.mesh.triangles[triangles]]
+        point = queries[owners]
+        inside = np.ones(len(owners), dtype=bool)
+        for i in range(3):
+            start, end = corners[:, i], corners[:, (i + 1) % 3]
+            left = (end[:, 0] - start[:, 0]) * (point[:, 1] - start[:, 1])
+            right = (end[:, 1] - start[:, 1]) * (point[:, 0] - start[:, 0])
+            inside &= left - right <= ORIENT_BOUND * (np.abs(left) + np.abs(right))
+        found[owners[inside]] = triangles[inside]
+        return found
+
+    def locate(self, x: float, y: float) -> int:
+        return int(self.locate_many(np.array([(x, y)]))[0])
+
+    def nearest_vertices(self, queries: np.ndarray) -> np.ndarray:
+        return self.vertices.nearest(queries)
+
+    def nearest_vertex(self, x: float, y: float) -> int:
+        return int(self.nearest_vertices(np.array([(x, y)]))[0])
@@ -0,0 +1,67 @@
+import random
+from time import time
+from zlib import crc32
+from typing import Tuple, Union
+
+import numpy as np
+
+
+# The last entropy word of a negative seed, after the words of its magnitude.
+NEGATIVE = 0x80000000
+
+
+def entropy(seed: Union[int, float]):
+    # Non-negative whole seeds are their own entropy. A negative one is its magnitude as at least two words
+    # with a sign word after them, so -7 and 7 are different streams. Those words only match non-negative
+    # seeds of 2**95 and over.
+    if isinstance(seed, (int, np.integer)):
+        seed = int(seed)
+        if seed >= 0:
+            return seed
+        magnitude, words = -seed, []
+        while magnitude or len(words) < 2:
+            words.append(magnitude & 0xffffffff)
+            magnitude >>= 32
+        return words + [NEGATIVE]
+    return np.frombuffer(np.float64(seed).tobytes(), dtype=np.uint32).tolist()
+
+
+class RandomStream:
+    # A seeded random stream that never touches the global random state. Substreams are derived from the
+    # seed and their names alone, not from how much of the parent has been used, so every stage of map
+    # generation gets the same values no matter what order, or which thread, the stages run in.
+
+    def __init__(self, seed: Union[int, float] = None, key: Tuple[int, ...] = ()):
+        if seed is None:
+            seed = time()
+        self.seed = seed
+        self.key = key
+        self.generator: np.random.Generator = np.random.default_rng(
+            np.random.SeedSequence(entropy(seed), spawn_key=key))
+
+    def __repr__(self):
+        return f"RandomStream({self.seed}, {self.key})"
+
+    def substream(self, *names: Union[str, int]) -> 'RandomStream':
+        key = tuple(crc32(name.encode()) if isinstance(name, str) else int(name) for name in names)
+        return RandomStream(self.seed, self.key + key)
+
+    def python_random(self) -> random.Random:
+        return random.Random(int(self.generator.integers(0, 2**63)))
+
+
+def as_stream(seed: Union[int, float, RandomStream] = None) -> RandomStream:
+    if isinstance(seed, RandomStream):
+        return seed
+    return RandomStream(seed)
+
+
+def create_rng(seed: Union[int, float, RandomStream] = None) -> np.random.Generator:
+    return as_stream(seed).generator
+
+
+def create_python_random(seed: Union[int, float, RandomStream] = None) -> random.Random:
+    # Plain seeds give the same sequence random.seed(seed) always gave the list based generators.
+    if isinstance(seed, RandomStream):
+        return seed.python_random()
+    return random.Random(time() if seed is None else seed)
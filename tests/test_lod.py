@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import lod
+import maps
+
+
+@pytest.fixture(scope='module')
+def hierarchy():
+    return lod.build_lod(maps.create_plate_map(60, 60, 6, 0.4, seed=1), min_triangles=200)
+
+
+def test_levels(hierarchy):
+    assert len(hierarchy) > 2
+    full = np.abs(hierarchy[0].mesh.areas).sum()
+    for level in hierarchy.levels:
+        assert level.mesh.is_delaunay()
+        assert np.abs(level.mesh.areas).sum() == pytest.approx(full)
+        assert (level.triangles >= 0).all()
+    errors = [level.error for level in hierarchy.levels]
+    assert errors == sorted(errors)
+
+
+def test_index_buffer(hierarchy):
+    # Every triangle is drawn with its corners turned, never reflected, to end on one of its own plate.
+    for level in hierarchy.levels:
+        buffer = level.index_buffer()
+        assert buffer.dtype == np.int32
+        assert (level.point_plates[buffer[:, 2]] == level.triangle_plates).all()
+        turns = [np.roll(level.triangles, turn, axis=1) for turn in range(3)]
+        assert np.logical_or.reduce([(buffer == turned).all(axis=1) for turned in turns]).all()
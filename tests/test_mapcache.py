@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+import maps
+from mapcache import MapCache
+from point import Point
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MapCache(str(tmp_path / 'maps'))
+
+
+def test_directory_made_on_first_save(cache):
+    assert not os.path.exists(cache.directory)
+    assert cache.entries() == []
+    cache.point_map(12, 12, seed=3)
+    assert len(cache.entries()) == 1
+
+
+def test_round_trip(cache):
+    made = cache.plate_map(20, 20, 5, 0.4, seed=3)
+    loaded = cache.plate_map(20, 20, 5, 0.4, seed=3)
+    assert len(cache.entries()) == 1
+    assert isinstance(loaded.map.triangulation.mesh.coords, np.memmap)
+    for name in ('coords', 'triangles', 'halfedges', 'circumcircles', 'areas'):
+        assert (getattr(loaded.map.triangulation.mesh, name) == getattr(made.map.triangulation.mesh, name)).all()
+    assert (loaded.point_plates == made.point_plates).all()
+    assert (loaded.triangle_plates == made.triangle_plates).all()
+    assert [plate.area for plate in loaded.plates] == pytest.approx([plate.area for plate in made.plates])
+    assert [plate.type for plate in loaded.plates] == [plate.type for plate in made.plates]
+
+
+def test_edits_stay_in_memory(cache):
+    cache.point_map(16, 16, seed=4)
+    path = cache.entries()[0][0]
+    with open(path, 'rb') as file:
+        before = file.read()
+    loaded = cache.point_map(16, 16, seed=4)
+    loaded.update(loaded.triangulation.insert(Point(0.013, 0.021)))
+    loaded.update(loaded.triangulation.remove(7))
+    assert loaded.triangulation.mesh.is_delaunay()
+    del loaded
+    with open(path, 'rb') as file:
+        assert file.read() == before
+    again = cache.point_map(16, 16, seed=4)
+    assert len(again.triangulation.mesh.coords) == 16 * 16 + 3
+
+
+@pytest.mark.parametrize('keep', (4, 40, 0.5, 0.99))
+def test_truncated_file_is_made_again(cache, keep):
+    made = cache.point_map(16, 16, seed=5)
+    path = cache.entries()[0][0]
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as file:
+        file.truncate(keep if isinstance(keep, int) else int(size * keep))
+    loaded = cache.point_map(16, 16, seed=5)
+    assert (loaded.triangulation.mesh.triangles == made.triangulation.mesh.triangles).all()
+    assert os.path.getsize(path) == size
+
+
+def test_unseeded_maps_are_not_cached(cache):
+    cache.point_map(12, 12)
+    assert cache.entries() == []
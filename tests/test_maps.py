@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import maps
+
+
+@pytest.fixture(scope='module')
+def plate_map():
+    return maps.create_plate_map(40, 40, 6, 0.4, seed=1)
+
+
+def test_plate_areas(plate_map):
+    # Straight after the build, without asking for stats first, the plates cover the unit square map.
+    assert plate_map._stats is None
+    areas = [plate.area for plate in plate_map.plates]
+    assert sum(areas) == pytest.approx(1.0)
+    assert all(area > 0 for area in areas)
+    assert areas == pytest.approx(plate_map.stats.areas.tolist())
+
+
+def test_plate_stats(plate_map):
+    stats = plate_map.stats
+    mesh = plate_map.map.triangulation.mesh
+    assert stats.point_counts.sum() == (plate_map.point_plates >= 0).sum()
+    assert (stats.perimeters > 0).all()
+    # Each plate's centroid is the area weighted mean of its triangles' centroids.
+    for plate in range(len(plate_map.plates)):
+        triangles = plate_map.triangle_plates == plate
+        weights = np.abs(mesh.areas[triangles])
+        centroid = (mesh.coords[mesh.triangles[triangles]].mean(axis=1) * weights[:, None]).sum(axis=0) / weights.sum()
+        assert stats.centroids[plate] == pytest.approx(centroid)
+    # Every boundary line runs between vertices on the two plates it separates.
+    for line, (first, second) in enumerate(stats.boundary_plates.tolist()):
+        vertices = stats.boundary_lines[line]
+        assert first < second
+        assert len(vertices) >= 2
+        neighbors = plate_map.map.neighbors
+        for vertex in vertices.tolist():
+            around = set(plate_map.point_plates[neighbors[vertex]].tolist()) | {plate_map.point_plates[vertex]}
+            assert {first, second} <= around
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import instrument
+import parallel
+import triangulation
+from point import Point
+
+
+def sorted_triangles(base: triangulation.Triangulation):
+    triangles = base.mesh.triangles
+    return triangles[np.lexsort(triangles.T[::-1])]
+
+
+@pytest.fixture(autouse=True)
+def small_strips(monkeypatch):
+    # Small enough that a few thousand points are cut into several strips.
+    monkeypatch.setattr(parallel, 'MIN_STRIP_POINTS', 500)
+
+
+@pytest.mark.parametrize('order', (triangulation.SNAKE, triangulation.HILBERT, triangulation.BRIO))
+def test_matches_serial(order):
+    coords = np.random.default_rng(6).uniform(-1, 1, (3000, 2))
+    with instrument.Recorder() as recorder:
+        built = parallel.ParallelTriangulation(coords, 3, order)
+    serial = triangulation.Triangulation(coords, order=order)
+    assert built.order == order
+    assert (built.mesh.coords == serial.mesh.coords).all()
+    assert (sorted_triangles(built) == sorted_triangles(serial)).all()
+    spans = [span['args'] for span in recorder.spans if span['name'] == 'triangulation.build']
+    assert spans == [{'engine': triangulation.NEIGHBOR_WALK, 'points': len(coords), 'workers': 3}]
+
+
+def test_lattice():
+    # Ties between cocircular points can fall either way, so only the mesh itself is checked.
+    steps = np.linspace(-0.9, 0.9, 40)
+    coords = np.array([(x, y) for x in steps for y in steps])
+    built = parallel.ParallelTriangulation(coords, 2)
+    assert built.mesh.is_delaunay()
+    assert len(built.mesh) == 2 * 39 * 39
+
+
+def test_edits():
+    coords = np.random.default_rng(7).uniform(-1, 1, (2000, 2))
+    built = parallel.ParallelTriangulation(coords, 2)
+    serial = triangulation.Triangulation(coords)
+    for base in (built, serial):
+        base.insert(Point(0.01, 0.02))
+        base.remove(17)
+    assert built.mesh.is_delaunay()
+    assert (sorted_triangles(built) == sorted_triangles(serial)).all()
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import point
+
+
+def closest(coords: np.ndarray, size: np.ndarray = None) -> float:
+    # The smallest distance between any two of the points, across the box's sides when it wraps.
+    offsets = coords[:, None] - coords[None]
+    if size is not None:
+        offsets -= np.round(offsets / size) * size
+    distances = np.hypot(offsets[..., 0], offsets[..., 1])
+    distances[np.diag_indices(len(coords))] = np.inf
+    return distances.min()
+
+
+@pytest.mark.parametrize('options', [{}, {'wrap': True}, {'edges': True},
+                                     {'radii': lambda coords: 0.02 + 0.04 * (coords[:, 0] + 0.5)}])
+def test_poisson_spacing(options):
+    coords = point.create_poisson_coords(0.02, seed=3, **options)
+    assert len(coords) > 500
+    assert ((coords >= -0.5) & (coords <= 0.5)).all()
+    assert closest(coords, np.ones(2) if options.get('wrap') else None) >= 0.02
+    assert len(np.unique(coords, axis=0)) == len(coords)
@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+import parallel
+import predicates
+import spatial
+import triangulation
+from point import Point
+
+
+def lattice():
+    steps = np.linspace(-0.9, 0.9, 12)
+    return np.array([(x, y) for x in steps for y in steps])
+
+
+def cocircular():
+    angles = np.linspace(0, 2 * np.pi, 40, endpoint=False)
+    return np.vstack((np.column_stack((0.5 * np.cos(angles), 0.5 * np.sin(angles))), [(0.0, 0.0)]))
+
+
+def collinear():
+    return np.column_stack((np.linspace(-0.8, 0.8, 30), np.linspace(-0.4, 0.4, 30)))
+
+
+def hull_area(coords: np.ndarray):
+    # Andrew's monotone chain and the shoelace formula.
+    points = sorted(map(tuple, coords.tolist()))
+
+    def chain(points):
+        hull = []
+        for p in points:
+            while len(hull) >= 2 and predicates.orient2d(*hull[-2], *hull[-1], *p) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+
+    hull = np.array(chain(points) + chain(points[::-1]))
+    following = np.roll(hull, -1, axis=0)
+    return 0.5 * abs((hull[:, 0] * following[:, 1] - following[:, 0] * hull[:, 1]).sum())
+
+
+def triangle_set(mesh):
+    return {frozenset(map(tuple, corners)) for corners in mesh.coords[mesh.triangles].tolist()}
+
+
+def check_mesh(mesh, coords):
+    assert mesh.is_delaunay()
+    assert np.isfinite(mesh.circumcircles).all()
+    assert (mesh.areas < 0).all()
+    assert -mesh.areas.sum() == pytest.approx(hull_area(coords))
+
+
+def test_exact_degeneracies():
+    # Lattice squares are exactly cocircular and lattice rows exactly collinear, whatever rounding does.
+    assert predicates.orient2d(0.0, 0.0, 0.1, 0.1, 0.3, 0.3) == predicates.orient2d_exact(0.0, 0.0, 0.1, 0.1, 0.3, 0.3)
+    assert predicates.orient2d(0.5, 0.25, 0.75, 0.25, 1e-300, 0.25) == 0
+    assert predicates.incircle(0.0, 0.0, 0.1, 0.0, 0.1, 0.1, 0.0, 0.1) == 0
+    assert predicates.circumcircle(0.0, 0.0, 0.5, 0.5, 1.0, 1.0)[2] == np.inf
+
+
+def test_batches_match_exact():
+    rng = np.random.default_rng(5)
+    # Points a whisker off the line or circle through the others, where the float filter can't decide.
+    a, b = rng.random((200, 2)), rng.random((200, 2))
+    c = a + (b - a) * rng.random((200, 1)) + rng.choice((-1, 0, 1), (200, 1)) * 1e-17
+    signs = predicates.orient2d_batch(a, b, c)
+    assert signs.tolist() == [predicates.orient2d_exact(*p, *q, *r) for p, q, r in zip(a, b, c)]
+    angles = rng.random((200, 4)) * 2 * np.pi
+    a, b, c, d = (np.column_stack((np.cos(angles[:, i]), np.sin(angles[:, i]))) for i in range(4))
+    signs = predicates.incircle_batch(a, b, c, d)
+    assert signs.tolist() == [predicates.incircle_exact(*p, *q, *r, *s) for p, q, r, s in zip(a, b, c, d)]
+
+
+@pytest.mark.parametrize('order', (triangulation.SNAKE, triangulation.HILBERT, triangulation.BRIO))
+@pytest.mark.parametrize('make_coords', (lattice, cocircular))
+def test_degenerate_builds(make_coords, order):
+    coords = make_coords()
+    base = triangulation.Triangulation(coords, order=order)
+    check_mesh(base.mesh, coords)
+    assert len(np.unique(base.mesh.triangles)) == len(coords)
+
+
+@pytest.mark.parametrize('make_coords', (lattice, cocircular))
+def test_degenerate_edits(make_coords):
+    coords = make_coords()
+    base = triangulation.Triangulation(coords)
+    base.remove(0)
+    base.remove(len(coords) // 2)
+    base.insert(Point(0.05, 0.05))
+    base.insert(Point(*coords[0].tolist()))
+    check_mesh(base.mesh, np.vstack((np.delete(coords, len(coords) // 2, axis=0), [(0.05, 0.05)])))
+
+
+def test_collinear():
+    coords = collinear()
+    base = triangulation.Triangulation(coords)
+    # Nothing but slivers of zero area is possible, so there are no triangles until a point leaves the line.
+    assert len(base.mesh) == 0
+    base.insert(Point(0.0, 0.3))
+    check_mesh(base.mesh, np.vstack((coords, [(0.0, 0.3)])))
+    assert len(base.mesh) == len(coords) - 1
+
+
+@pytest.mark.parametrize('build', ('neighbor_walk', 'bowyer_watson', 'parallel'))
+def test_repeated_points(build, monkeypatch):
+    # Repeated points are left out of every triangle, the mesh is the one the distinct points make.
+    coords = np.random.default_rng(4).uniform(-0.9, 0.9, (1500, 2))
+    coords[[10, 700, 1200]] = coords[3]
+    coords[900] = coords[450]
+    coords = coords[np.argsort(coords[:, 0], kind='stable')]
+    repeated = np.flatnonzero(triangulation.repeated_points(coords))
+    if build == 'neighbor_walk':
+        base = triangulation.Triangulation(coords)
+    elif build == 'bowyer_watson':
+        base = triangulation.Triangulation(coords, engine=triangulation.BOWYER_WATSON)
+    else:
+        monkeypatch.setattr(parallel, 'MIN_STRIP_POINTS', 300)
+        base = parallel.ParallelTriangulation(coords, 3)
+    assert len(repeated) == 4
+    assert base.removed == set(repeated.tolist())
+    assert not np.isin(base.mesh.triangles, repeated).any()
+    distinct = triangulation.Triangulation(np.delete(coords, repeated, axis=0)).mesh
+    assert triangle_set(base.mesh) == triangle_set(distinct)
+    with pytest.raises(ValueError):
+        base.remove(int(repeated[0]))
+    with pytest.raises(ValueError):
+        base.insert(Point(*coords[repeated[0]].tolist()))
+
+
+def near_degenerate(count: int, seed: int = 5):
+    # Triangles a, b, c, counter-clockwise, with a point p each: half have p within a few ulps of their
+    # circle, half are triangles within a few ulps of collinear with p anywhere around them. Sizes and
+    # offsets vary over several orders of magnitude.
+    rng = np.random.default_rng(seed)
+    scale = 10.0 ** rng.integers(-3, 4, (count, 1, 1))
+    offset = rng.uniform(-1, 1, (count, 1, 2)) * 10.0 ** rng.integers(0, 4, (count, 1, 1))
+    angles = rng.uniform(0, 2 * np.pi, (count, 4))
+    points = np.stack((np.cos(angles), np.sin(angles)), axis=2)
+    points[:, 3] += rng.normal(0, 1, (count, 2)) * 10.0 ** rng.integers(-17, -9, (count, 1))
+    thin = np.arange(count) % 2 == 1
+    steps = rng.uniform(-1, 1, (count, 3, 1)) * rng.normal(0, 1, (count, 1, 2))
+    steps += rng.normal(0, 1, (count, 3, 2)) * 10.0 ** rng.integers(-16, -5, (count, 1, 1))
+    points[thin, :3] = steps[thin]
+    points[thin, 3] = rng.normal(0, 2, (thin.sum(), 2))
+    quads = [quad for quad in (offset + scale * points).tolist()
+             if predicates.orient2d_exact(*quad[0], *quad[1], *quad[2])]
+    return [[a, c, b, p] if predicates.orient2d_exact(*a, *b, *c) < 0 else [a, b, c, p] for a, b, c, p in quads]
+
+
+def test_cached_circles():
+    # A cached circle's verdict, as the kernel, inside_circles and clear_of use it, is never against the
+    # exact incircle.
+    quads = near_degenerate(4000)
+    coords = np.array(quads).reshape(-1, 2)
+    circles = np.array([predicates.circumcircle(*a, *b, *c) for a, b, c, _ in quads])
+    exact = np.array([predicates.incircle_exact(*a, *b, *c, *p) for a, b, c, p in quads])
+    settled = 0
+    for (center_x, center_y, radius, dist_error, error), (_, _, _, p), answer in zip(circles.tolist(), quads, exact):
+        dx, dy = center_x - p[0], center_y - p[1]
+        dist = dx*dx + dy*dy
+        margin = dist * dist_error + error
+        if radius - dist > margin:
+            assert answer > 0
+        elif radius - dist < -margin:
+            assert answer < 0
+        else:
+            continue
+        settled += 1
+    assert settled > 0
+
+    triangles = np.arange(len(coords)).reshape(-1, 4)[:, :3]
+    owners, points = np.arange(len(quads)), np.arange(3, len(coords), 4)
+    inside = parallel.inside_circles(spatial.PointGrid(coords), triangles, circles, owners, points)
+    assert (inside == (exact > 0)).all()
+    clear = parallel.clear_of(circles, np.abs(circles[:, 0] - coords[points, 0]))
+    assert (exact[clear] < 0).all()
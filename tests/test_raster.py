@@ -0,0 +1,58 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+import maps
+import raster
+
+
+def read_png(path: str) -> np.ndarray:
+    # Just enough of a PNG reader for write_png's files: every chunk's CRC, one IDAT and unfiltered rows.
+    with open(path, 'rb') as file:
+        data = file.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, offset = {}, 8
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    assert list(chunks) == [b'IHDR', b'IDAT', b'IEND']
+    width, height, depth, colour_type, _, _, _ = struct.unpack('>IIBBBBB', chunks[b'IHDR'])
+    channels = {0: 1, 4: 2, 2: 3, 6: 4}[colour_type]
+    rows = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, -1)
+    assert (rows[:, 0] == 0).all()
+    return rows[:, 1:].copy().view(np.dtype(f'>u{depth // 8}')).reshape(height, width, channels)
+
+
+@pytest.mark.parametrize('shape, dtype', [((5, 7), np.uint16), ((6, 4, 2), np.uint8), ((3, 9, 3), np.uint8),
+                                          ((8, 8, 4), np.uint16)])
+def test_write_png(tmp_path, shape, dtype):
+    image = np.random.default_rng(2).integers(0, np.iinfo(dtype).max, shape, endpoint=True).astype(dtype)
+    path = str(tmp_path / 'image.png')
+    raster.write_png(path, image)
+    assert (read_png(path) == image.reshape(shape[:2] + (-1,))).all()
+
+
+def test_write_png_rejects(tmp_path):
+    with pytest.raises(ValueError):
+        raster.write_png(str(tmp_path / 'image.png'), np.zeros((4, 4), dtype=np.float32))
+    with pytest.raises(ValueError):
+        raster.write_png(str(tmp_path / 'image.png'), np.zeros((4, 4, 5), dtype=np.uint8))
+
+
+def test_render_plates():
+    plate_map = maps.create_plate_map(30, 30, 5, 0.4, seed=2)
+    image = raster.render_plates(plate_map, 48, 32, low=(-0.6, -0.6), high=(0.6, 0.6))
+    assert image.shape == (32, 48, 4) and image.dtype == np.uint8
+    # The map covers the unit square in the middle, the border around it is transparent.
+    assert (image[0, :, 3] == 0).all() and (image[:, 0, 3] == 0).all()
+    assert (image[8:24, 12:36, 3] == 255).all()
+    # Nearly every pixel on the map has the plate of the map point nearest to it.
+    centres = raster.pixel_centres(np.array((-0.6, -0.6)), np.array((0.6, 0.6)), 48, 32, slice(0, 32), slice(0, 48))
+    on_map = image[..., 3].reshape(-1) > 0
+    expected = raster.plate_palette(len(plate_map.plates))[plate_map.plates_at(centres[on_map])]
+    assert (image.reshape(-1, 4)[on_map] == expected).all(axis=1).mean() > 0.95
@@ -0,0 +1,38 @@
+import numpy as np
+
+import predicates
+import triangulation
+from spatial import MeshIndex
+
+
+def holds(corners, point, exact: bool) -> bool:
+    # Whether a clockwise triangle holds the point, edges and corners included. Without exact, points off
+    # an edge by no more than the rounding locate_many allows for count as on it.
+    for i in range(3):
+        (start_x, start_y), (end_x, end_y) = corners[i], corners[(i + 1) % 3]
+        if exact:
+            if predicates.orient2d_exact(start_x, start_y, end_x, end_y, *point) > 0:
+                return False
+        else:
+            left, right = (end_x - start_x) * (point[1] - start_y), (end_y - start_y) * (point[0] - start_x)
+            if left - right > predicates.ORIENT_BOUND * (abs(left) + abs(right)):
+                return False
+    return True
+
+
+def test_locate_many():
+    # Against every triangle tried in turn, for random points in and around the mesh, its vertices, hull
+    # corners included, and points within rounding of its edges.
+    rng = np.random.default_rng(4)
+    mesh = triangulation.Triangulation(rng.uniform(-0.9, 0.9, (300, 2))).mesh
+    edges = mesh.coords[mesh.triangles[:, :2]].mean(axis=1)
+    queries = np.vstack((rng.uniform(-1.2, 1.2, (500, 2)), mesh.coords[np.unique(mesh.triangles)], edges[:200]))
+    corners = mesh.coords[mesh.triangles]
+    found = MeshIndex(mesh).locate_many(queries)
+    for point, triangle in zip(queries.tolist(), found.tolist()):
+        if triangle >= 0:
+            assert holds(corners[triangle].tolist(), point, False)
+        else:
+            # Only triangles whose bounding box takes in the point can hold it.
+            near = ((corners.min(axis=1) <= point) & (corners.max(axis=1) >= point)).all(axis=1)
+            assert not any(holds(triangle_corners, point, True) for triangle_corners in corners[near].tolist())
@@ -0,0 +1,22 @@
+import numpy as np
+
+from streams import NEGATIVE, RandomStream, entropy
+
+
+def test_negative_seeds():
+    first = RandomStream(7).generator.random(4)
+    assert (RandomStream(7).generator.random(4) == first).all()
+    assert (np.random.default_rng(np.random.SeedSequence(7)).random(4) == first).all()
+    assert not (RandomStream(-7).generator.random(4) == first).any()
+    assert entropy(-7) != entropy(7 + 2**32)
+    assert entropy(np.int64(-7)) == entropy(-7)
+    assert entropy(-7) == [7, 0, NEGATIVE]
+    assert entropy(-2**70) == [0, 0, 64, NEGATIVE]
+
+
+def test_substreams():
+    stream = RandomStream(3)
+    assert (stream.substream('plates', 1).generator.random(4) == RandomStream(3).substream('plates', 1)
+            .generator.random(4)).all()
+    assert not (stream.substream('plates', 1).generator.random(4) == stream.substream('plates', 2)
+                .generator.random(4)).any()
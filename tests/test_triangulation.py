@@ -0,0 +1,165 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+
+import maps
+import triangulation
+from point import Point, points_from_coords
+
+
+def triangle_set(coords: np.ndarray, triangles: np.ndarray):
+    # Triangles by the positions of their corners, so triangulations with different numbering compare equal.
+    return {frozenset(map(tuple, corners)) for corners in coords[triangles].tolist()}
+
+
+def bowyer_watson(coords: np.ndarray, super_coords: np.ndarray = None):
+    # A fresh build with the legacy engine, which expects its points sorted by x. Triangles near the hull
+    # depend on the super triangle, so an edited triangulation is compared with a build around its own.
+    coords = coords[np.argsort(coords[:, 0], kind='stable')]
+    if super_coords is None:
+        base = triangulation.Triangulation(coords, engine=triangulation.BOWYER_WATSON)
+    else:
+        with mock.patch.object(triangulation, 'create_super_points', lambda points: points_from_coords(super_coords)):
+            base = triangulation.Triangulation(coords, engine=triangulation.BOWYER_WATSON)
+    return triangle_set(base.mesh.coords, base.mesh.triangles)
+
+
+def remaining_coords(base: triangulation.Triangulation):
+    skipped = base.removed.union(base.super_indices)
+    return base.mesh.coords[[index for index in range(len(base.mesh.coords)) if index not in skipped]]
+
+
+def check_mesh(base: triangulation.Triangulation):
+    mesh = base.mesh
+    super_coords = mesh.coords[list(base.super_indices)]
+    assert triangle_set(mesh.coords, mesh.triangles) == bowyer_watson(remaining_coords(base), super_coords)
+    assert mesh.is_delaunay()
+    assert (mesh.areas < 0).all()
+    assert (mesh.halfedges == triangulation.TriangleMesh(mesh.coords, mesh.triangles).halfedges).all()
+
+
+def hull_vertices(base: triangulation.Triangulation):
+    halfedges = np.flatnonzero(base.mesh.halfedges < 0)
+    return np.unique(base.mesh.triangles[halfedges // 3, halfedges % 3])
+
+
+@pytest.fixture
+def coords():
+    return np.random.default_rng(9).uniform(-0.9, 0.9, (400, 2))
+
+
+def test_matches_bowyer_watson(coords):
+    base = triangulation.Triangulation(coords)
+    assert triangle_set(base.mesh.coords, base.mesh.triangles) == bowyer_watson(coords)
+
+
+def test_insert_interior(coords):
+    base = triangulation.Triangulation(coords)
+    for x, y in np.random.default_rng(1).uniform(-0.5, 0.5, (20, 2)).tolist():
+        base.insert(Point(x, y))
+        check_mesh(base)
+
+
+def test_insert_many_outside_the_hull(coords):
+    base = triangulation.Triangulation(coords)
+    edit = base.insert_many(np.array([(0.95, 0.0), (-0.95, 0.3), (0.2, 0.97), (0.0, 0.0)]))
+    assert len(edit.created) > 0
+    check_mesh(base)
+
+
+def test_remove_interior(coords):
+    base = triangulation.Triangulation(coords)
+    interior = np.setdiff1d(np.arange(len(coords)), hull_vertices(base))
+    for index in interior[:20].tolist():
+        base.remove(index)
+        check_mesh(base)
+
+
+def test_remove_hull(coords):
+    base = triangulation.Triangulation(coords)
+    for _ in range(10):
+        base.remove(int(hull_vertices(base)[0]))
+        check_mesh(base)
+
+
+def test_edits_after_reorder(coords):
+    base = triangulation.Triangulation(coords)
+    base.remove(3)
+    base.reorder()
+    base.insert(Point(0.01, 0.02))
+    base.remove(10)
+    check_mesh(base)
+
+
+@pytest.mark.parametrize('order', (triangulation.SNAKE, triangulation.HILBERT, triangulation.BRIO))
+@pytest.mark.parametrize('curve', (triangulation.HILBERT, triangulation.MORTON))
+def test_lattice_edits_after_reorder(order, curve):
+    # Lattice squares are cocircular, so triangulating the points again could pick other diagonals than
+    # the mesh has, the kernel for the edits has to follow the mesh.
+    steps = np.linspace(-0.9, 0.9, 12)
+    base = triangulation.Triangulation(np.array([(x, y) for x in steps for y in steps]), order=order)
+    base.reorder(curve)
+    base.insert(Point(0.013, 0.021))
+    base.remove(5)
+    base.insert(Point(0.95, 0.2))
+    mesh = base.mesh
+    assert mesh.is_delaunay()
+    assert (mesh.halfedges == triangulation.TriangleMesh(mesh.coords, mesh.triangles).halfedges).all()
+    assert len(np.unique(mesh.triangles)) == 12 * 12 + 1
+
+
+@pytest.mark.parametrize('edit_first', (False, True))
+def test_reorder_keeps_triangles(edit_first):
+    # With or without a kernel from an earlier edit, reordering renames the lattice's triangles and edits
+    # go on from the same ones.
+    steps = np.linspace(-0.9, 0.9, 12)
+    base = triangulation.Triangulation(np.array([(x, y) for x in steps for y in steps]))
+    if edit_first:
+        base.insert(Point(0.013, 0.021))
+    before = triangle_set(base.mesh.coords, base.mesh.triangles)
+    point_order, _ = base.reorder()
+    assert triangle_set(base.mesh.coords, base.mesh.triangles) == before
+    assert (base.kernel is not None) == edit_first
+    base.insert(Point(-0.31, 0.47))
+    base.remove(int(np.flatnonzero(point_order == 0)[0]))
+    assert base.mesh.is_delaunay()
+    assert (base.mesh.halfedges == triangulation.TriangleMesh(base.mesh.coords, base.mesh.triangles).halfedges).all()
+
+
+def test_remove_twice(coords):
+    base = triangulation.Triangulation(coords)
+    base.remove(5)
+    with pytest.raises(ValueError):
+        base.remove(5)
+    with pytest.raises(IndexError):
+        base.remove(base.super_indices[0])
+
+
+def test_rejected_insert_changes_nothing(coords):
+    base = triangulation.Triangulation(coords)
+    base.insert(Point(0.0, 0.0))
+    num_coords, triangles = len(base.mesh.coords), base.mesh.triangles.copy()
+    for batch in ([Point(0.1, 0.1), Point(*coords[7].tolist())], [Point(0.1, 0.1), Point(0.1, 0.1)],
+                  [Point(0.1, 0.1), Point(1e9, 0.0)]):
+        with pytest.raises(ValueError):
+            base.insert_many(batch)
+        assert len(base.points) == len(base.mesh.coords) == len(base.kernel.xs) == num_coords
+        assert (base.mesh.triangles == triangles).all()
+    check_mesh(base)
+
+
+def test_point_map_update(coords):
+    base = triangulation.Triangulation(coords)
+    point_map = maps.PointMap(base)
+    rng = np.random.default_rng(3)
+    edits = [lambda: base.insert(Point(*rng.uniform(-0.8, 0.8, 2).tolist())),
+             lambda: base.insert_many(rng.uniform(-0.95, 0.95, (30, 2))),
+             lambda: base.remove(int(hull_vertices(base)[0])),
+             lambda: base.remove(int(rng.choice(np.setdiff1d(np.arange(len(coords)), list(base.removed)))))]
+    for step in range(40):
+        point_map.update(edits[step % len(edits)]())
+        for graph, expected in ((point_map.neighbors, base.mesh.vertex_neighbors()),
+                                (point_map.child_triangles, base.mesh.vertex_triangles())):
+            assert (graph.offsets == expected.offsets).all()
+            assert (graph.indices == expected.indices).all()
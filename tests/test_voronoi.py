@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import triangulation
+from mesh import clip_polygon
+
+
+def check_cells(diagram, coords, low, high):
+    # Every point in the box has a cell holding it, and the cells tile the box.
+    low, high = np.asarray(low), np.asarray(high)
+    inside = ((coords >= low) & (coords <= high)).all(axis=1)
+    assert diagram.areas.sum() == pytest.approx((high - low).prod())
+    assert (diagram.areas[:len(coords)][inside] > 0).all()
+    for index in np.flatnonzero(inside)[:50].tolist():
+        cell = diagram.cell(index)
+        assert (cell >= low - 1e-12).all() and (cell <= high + 1e-12).all()
+        # Counter-clockwise and convex, with the point on the inside of every side.
+        sides = np.roll(cell, -1, axis=0) - cell
+        to_point = coords[index] - cell
+        assert (sides[:, 0] * to_point[:, 1] - sides[:, 1] * to_point[:, 0] >= -1e-12).all()
+
+
+@pytest.mark.parametrize('box', (((-1.0, -1.0), (1.0, 1.0)), ((-0.5, -0.25), (0.5, 0.75))))
+def test_random(box):
+    coords = np.random.default_rng(8).uniform(-1, 1, (500, 2))
+    diagram = triangulation.Triangulation(coords).voronoi(*box)
+    check_cells(diagram, coords, *box)
+
+
+def test_lattice():
+    steps = np.linspace(-0.9, 0.9, 10)
+    coords = np.array([(x, y) for x in steps for y in steps])
+    diagram = triangulation.Triangulation(coords).voronoi()
+    check_cells(diagram, coords, (-1.0, -1.0), (1.0, 1.0))
+    # Inner cells are the squares between the lattice's midpoints.
+    inner = (np.abs(coords) < 0.8).all(axis=1)
+    assert diagram.areas[:len(coords)][inner] == pytest.approx(0.2 ** 2)
+
+
+def test_cocircular():
+    angles = np.linspace(0, 2 * np.pi, 24, endpoint=False)
+    coords = np.vstack((np.column_stack((0.5 * np.cos(angles), 0.5 * np.sin(angles))), [(0.0, 0.0)]))
+    diagram = triangulation.Triangulation(coords).voronoi()
+    check_cells(diagram, coords, (-1.0, -1.0), (1.0, 1.0))
+
+
+def test_clip_polygon():
+    square = np.array([(-2.0, -2.0), (2.0, -2.0), (2.0, 2.0), (-2.0, 2.0)])
+    clipped = clip_polygon(square, np.array((-1.0, -0.5)), np.array((1.0, 0.5)))
+    assert len(clipped) == 4
+    assert np.abs(clipped).max(axis=0) == pytest.approx((1.0, 0.5))
@@ -0,0 +1,247 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, Tuple
+import os
+
+import numpy as np
+
+import maps
+import mapcache
+import parallel
+import perlin
+import triangulation
+from mesh import CSRGraph
+from streams import as_stream
+
+# How far plate borders are pushed around by noise, in plate cells.
+PLATE_WARP = 0.35
+
+
+def stream_key(index: int) -> int:
+    # Substream names have to be non-negative, so tile and plate cell indices are folded 0, -1, 1, -2, ...
+    return 2 * index if index >= 0 else -2 * index - 1
+
+
+class WorldTile:
+    # One tile of a World, covering [column, column+1] x [row, row+1] in world units. Its plate map works in
+    # tile local coordinates, [0, 1] on both axes, which keeps the triangulation well conditioned however
+    # far out the tile is; origin moves them back into the world.
+    # Plates are the world's plates: plate_cells names the cell each of the tile's plates was seeded in and
+    # plate_values is the plate's colour value, the same in every tile it reaches.
+
+    def __init__(self, column: int, row: int, plate_map: maps.PlateMap, plate_cells: np.ndarray,
+                 plate_values: np.ndarray):
+        self.column = column
+        self.row = row
+        self.origin: np.ndarray = np.array((column, row), dtype=np.float64)
+        self.plate_map: maps.PlateMap = plate_map
+        self.plate_cells: np.ndarray = plate_cells
+        self.plate_values: np.ndarray = plate_values
+
+    @property
+    def coords(self) -> np.ndarray:
+        return self.plate_map.map.triangulation.mesh.coords + self.origin
+
+    def plates_at(self, coords: np.ndarray) -> np.ndarray:
+        # The world plate cell of each world position, (-1, -1) where the tile has no plate.
+        local = self.plate_map.plates_at(np.asarray(coords, dtype=np.float64).reshape(-1, 2) - self.origin)
+        return np.where(local[:, None] < 0, -1, self.plate_cells[local])
+
+    def export_buffers(self) -> maps.MapBuffers:
+        # Positions are in world units so tiles can be drawn side by side without any other transform. Points
+        # without a plate get -1 like they do in PlateMap.export_buffers.
+        point_plates = self.plate_map.point_plates
+        plates = np.where(point_plates < 0, -1.0, self.plate_values[point_plates]).astype(np.float32)
+        triangulation = self.plate_map.map.triangulation
+        return maps.MapBuffers(self.coords.astype(np.float32), plates, triangulation.triangle_buffer(),
+                               triangulation.line_buffer())
+
+
+class World:
+    # An unbounded map made one tile at a time. Nothing but the parameters is kept, every tile is a pure
+    # function of the seed and its position, so tiles can be made in any order, on demand, and only the
+    # ones in use need to be in memory.
+    #
+    # Neighbouring tiles agree on their shared edge. Each tile is a jittered grid of tile_points cells a
+    # side, like create_grid_coords, but the points on an edge are pinned to the edge line and jittered
+    # along it by a stream belonging to the edge rather than the tile, and the corners sit on the lattice.
+    # Both tiles make the same edge points bit for bit, and since the edge is part of each tile's hull,
+    # both triangulations join consecutive edge points, so the tiles' meshes meet without cracks.
+    #
+    # Plates are seeded one per plate cell, plate_size tiles a side, and a point belongs to the plate with
+    # the nearest seed after its position is warped by noise. This only depends on the point's world
+    # position, so a point on a tile edge gets the same plate from both tiles.
+
+    def __init__(self, tile_points: int, plate_size: float = 2.0, plate_dist: float = None, seed=None):
+        self.stream = as_stream(seed)
+        self.seed = self.stream.seed
+        self.tile_points = tile_points
+        self.plate_size = plate_size
+        if plate_dist is None:
+            plate_dist = self.stream.substream('plate_dist').generator.uniform(0.4, 0.65)
+        self.plate_dist = plate_dist
+        self.warp = perlin.PerlinNoise(self.stream.substream('plate_warp'))
+
+    def edge_jitter(self, name: str, column: int, row: int) -> np.ndarray:
+        stream = self.stream.substream(name, stream_key(column), stream_key(row))
+        return stream.generator.random(self.tile_points - 1)
+
+    def tile_coords(self, column: int, row: int) -> np.ndarray:
+        # Local coords of the tile's (tile_points + 1)**2 points.
+        cells = self.tile_points
+        lattice = np.arange(cells + 1, dtype=np.float64)
+        stream = self.stream.substream('tile', stream_key(column), stream_key(row))
+        jitter = stream.generator.random((2, cells + 1, cells + 1))
+        point_x = lattice[:, None] - 0.5 + jitter[0]
+        point_y = lattice[None, :] - 0.5 + jitter[1]
+
+        # Edges: x for the left and right columns, y for the bottom and top rows, pinned to the lattice. The
+        # other axis comes from the edge's own stream, the left edge of this tile is the right of the last.
+        point_x[0], point_x[-1] = 0, cells
+        point_y[:, 0], point_y[:, -1] = 0, cells
+        point_y[0, 1:-1] = lattice[1:-1] - 0.5 + self.edge_jitter('vertical_edge', column, row)
+        point_y[-1, 1:-1] = lattice[1:-1] - 0.5 + self.edge_jitter('vertical_edge', column + 1, row)
+        point_x[1:-1, 0] = lattice[1:-1] - 0.5 + self.edge_jitter('horizontal_edge', column, row)
+        point_x[1:-1, -1] = lattice[1:-1] - 0.5 + self.edge_jitter('horizontal_edge', column, row + 1)
+        point_y[[0, 0, -1, -1], [0, -1, 0, -1]] = 0, cells, 0, cells
+        point_x[[0, 0, -1, -1], [0, -1, 0, -1]] = 0, 0, cells, cells
+
+        coords = np.column_stack((point_x.reshape(-1) / cells, point_y.reshape(-1) / cells))
+        return coords[np.argsort(coords[:, 0], kind='stable')]
+
+    def plate_seed(self, cell_x: int, cell_y: int) -> Tuple[float, float, int, float]:
+        # The seed position, type and colour value of the plate grown from a plate cell.
+        rng = self.stream.substream('plate', stream_key(cell_x), stream_key(cell_y)).generator
+        x, y, type_check, value = rng.random(4).tolist()
+        return ((cell_x + x) * self.plate_size, (cell_y + y) * self.plate_size,
+                maps.LAND if type_check <= self.plate_dist else maps.SEA, value)
+
+    def plate_cells_of(self, coords: np.ndarray) -> np.ndarray:
+        # The plate cell of every world position. The seeds are jittered within their cells, so the nearest
+        # one is always within two cells.
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        scaled = coords / self.plate_size
+        shift = np.column_stack((self.warp.noise2D(scaled[:, 0], scaled[:, 1], octaves=3),
+                                 self.warp.noise2D(scaled[:, 1] + 17.5, scaled[:, 0], octaves=3)))
+        warped = scaled + PLATE_WARP * shift
+        if not len(coords):
+            return np.zeros((0, 2), dtype=np.int64)
+        home = np.floor(warped).astype(np.int64)
+
+        low, high = home.min(axis=0) - 2, home.max(axis=0) + 2
+        columns, rows = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1), indexing='ij')
+        cells = np.column_stack((columns.reshape(-1), rows.reshape(-1)))
+        seeds = np.array([self.plate_seed(x, y)[:2] for x, y in cells.tolist()]) / self.plate_size
+        span = high[1] - low[1] + 1
+
+        best_dist = np.full(len(coords), np.inf)
+        best = np.zeros(len(coords), dtype=np.int64)
+        for dx in range(-2, 3):
+            for dy in range(-2, 3):
+                candidate = (home[:, 0] + dx - low[0]) * span + home[:, 1] + dy - low[1]
+                dist = ((seeds[candidate] - warped) ** 2).sum(axis=1)
+                closer = dist < best_dist
+                best_dist[closer], best[closer] = dist[closer], candidate[closer]
+        return cells[best]
+
+    def tile(self, column: int, row: int, workers: int = 1) -> WorldTile:
+        coords = self.tile_coords(column, row)
+        if workers == 1:
+            point_map = maps.PointMap(triangulation.Triangulation(coords))
+        else:
+            point_map = maps.PointMap(parallel.ParallelTriangulation(coords, workers))
+
+        # The super triangle's points are left without a plate like they are in a PlateMap.
+        num_points = len(coords)
+        cells, point_plates = np.unique(self.plate_cells_of(coords + (column, row)), axis=0, return_inverse=True)
+        point_plates = point_plates.reshape(-1)
+        seeds = [self.plate_seed(x, y) for x, y in cells.tolist()]
+        all_plates = np.full(len(point_map.neighbors), -1, dtype=np.int32)
+        all_plates[:num_points] = point_plates
+        triangle_plates, boundary = maps.label_triangles(point_map.triangulation.mesh.triangles, all_plates)
+        members = CSRGraph.from_pairs(point_plates, np.arange(num_points), len(cells))
+        triangles = CSRGraph.from_pairs(triangle_plates, np.arange(len(triangle_plates)), len(cells))
+        plates = tuple(maps.Plate.from_indices(point_map, members[index].astype(np.int64), seed[2], triangles[index])
+                       for index, seed in enumerate(seeds))
+        plate_map = maps.PlateMap(point_map, plates, self.seed, all_plates, triangle_plates, boundary)
+        return WorldTile(column, row, plate_map, cells, np.array([seed[3] for seed in seeds], dtype=np.float32))
+
+    def tiles(self, columns: range, rows: range) -> Iterator[WorldTile]:
+        # Tiles a row at a time. Only the tile being yielded is held, so a region of any size can be
+        # streamed through as long as the consumer lets each tile go.
+        for row in rows:
+            for column in columns:
+                yield self.tile(column, row)
+
+    def tiles_near(self, x: float, y: float, radius: float) -> Iterator[WorldTile]:
+        # The tiles touching a circle around a world position, nearest first.
+        yield from (self.tile(column, row) for column, row in tiles_in_circle(x, y, radius))
+
+
+def tiles_in_circle(x: float, y: float, radius: float):
+    # The (column, row) of every tile overlapping the circle, ordered by distance to its center.
+    columns = np.arange(int(np.floor(x - radius)), int(np.floor(x + radius)) + 1)
+    rows = np.arange(int(np.floor(y - radius)), int(np.floor(y + radius)) + 1)
+    columns, rows = (axis.reshape(-1) for axis in np.meshgrid(columns, rows, indexing='ij'))
+    gap_x = np.maximum(np.maximum(columns - x, x - columns - 1), 0)
+    gap_y = np.maximum(np.maximum(rows - y, y - rows - 1), 0)
+    dist = gap_x * gap_x + gap_y * gap_y
+    order = np.lexsort((rows, columns, dist))
+    order = order[dist[order] <= radius * radius]
+    return list(zip(columns[order].tolist(), rows[order].tolist()))
+
+
+class TileCache:
+    # Tiles around the camera, made when they are first needed. At most max_tiles are kept, the least
+    # recently used go first, which bounds memory no matter how far the camera moves.
+
+    def __init__(self, world: World, max_tiles: int = 16):
+        self.world = world
+        self.max_tiles = max_tiles
+        self.tiles: Dict[Tuple[int, int], WorldTile] = OrderedDict()
+
+    def get(self, column: int, row: int) -> WorldTile:
+        key = column, row
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        tile = self.world.tile(column, row)
+        self.tiles[key] = tile
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def around(self, x: float, y: float, radius: float):
+        # Nearest first, so if there are more tiles in the circle than fit the farthest are the ones dropped.
+        return [self.get(column, row) for column, row in tiles_in_circle(x, y, radius)[:self.max_tiles]]
+
+
+def tile_path(directory: str, column: int, row: int) -> str:
+    return os.path.join(directory, f"tile_{column}_{row}{mapcache.SUFFIX}")
+
+
+def save_tile(path: str, tile: WorldTile):
+    plate_map = tile.plate_map
+    triangulation = plate_map.map.triangulation
+    arrays = mapcache.plate_map_arrays(plate_map)
+    arrays.update({'plate_cells': tile.plate_cells, 'plate_values': tile.plate_values})
+    mapcache.write_map_file(path, {'kind': 'world_tile', 'column': tile.column, 'row': tile.row,
+                                   'seed': plate_map.seed, 'super_indices': list(triangulation.super_indices),
+                                   'engine': triangulation.engine}, arrays)
+
+
+def load_tile(path: str) -> WorldTile:
+    meta, arrays = mapcache.read_map_file(path)
+    if meta['kind'] != 'world_tile':
+        raise ValueError(f"{path} holds a {meta['kind']}, not a world_tile.")
+    return WorldTile(meta['column'], meta['row'], mapcache.build_plate_map(meta, arrays), arrays['plate_cells'],
+                     arrays['plate_values'])
+
+
+def write_world(world: World, directory: str, columns: range, rows: range) -> Iterator[str]:
+    # Streams a region of the world to disk a tile at a time, yielding each file as it is written. Peak
+    # memory is one tile, whatever the size of the region.
+    os.makedirs(directory, exist_ok=True)
+    for tile in world.tiles(columns, rows):
+        path = tile_path(directory, tile.column, tile.row)
+        save_tile(path, tile)
+        yield path
@@ -1,9 +1,15 @@
-from typing import Tuple, List
+from typing import Set, Tuple, List
 
-from point import Point
+import numpy as np
+
+import instrument
+from point import Point, points_from_coords, coords_from_points, hilbert_keys, morton_keys, brio_order
+from mesh import TriangleMesh, VoronoiDiagram, voronoi_diagram
+from predicates import ORIENT_BOUND, circumcircle, incircle, orient2d, orient2d_exact
 
 
 class Edge:
+    __slots__ = ('s', 'e')
 
     def __init__(self, s: int, e: int):
         self.s = s
@@ -26,28 +32,7 @@ def calc_circumcircle(vertices, points):
     point_1 = points[vertices[0]]
     point_2 = points[vertices[1]]
     point_3 = points[vertices[2]]
-
-    if point_2.x == point_1.x:
-        c_2 = (point_2.x ** 2 - point_3.x ** 2) + (point_2.y ** 2 - point_3.y ** 2)
-        c_3 = (point_3.x ** 2 - point_1.x ** 2) + (point_3.y ** 2 - point_1.y ** 2)
-        c_t = (c_2 * (point_1.x - point_3.x) / (point_3.x - point_2.x)) - c_3
-
-        div = 2 * ((point_1.y - point_3.y) - ((point_3.y - point_2.y) / (point_3.x - point_2.x)) * (
-                    point_1.x - point_3.x))
-        center_y = c_t / div
-        center_x = (c_2 + 2 * center_y * (point_3.y - point_2.y)) / (2 * (point_2.x - point_3.x))
-    else:
-        c_1 = (point_1.x ** 2 - point_2.x ** 2) + (point_1.y ** 2 - point_2.y ** 2)
-        c_2 = (point_2.x ** 2 - point_3.x ** 2) + (point_2.y ** 2 - point_3.y ** 2)
-        c_t = (c_1 * (point_3.x - point_2.x) / (point_2.x - point_1.x)) - c_2
-
-        div = 2 * ((point_3.y - point_2.y) - ((point_2.y - point_1.y) / (point_2.x - point_1.x)) * (point_3.x - point_2.x))
-        center_y = c_t / div
-        center_x = (c_1 + 2 * center_y * (point_2.y - point_1.y)) / (2 * (point_1.x - point_2.x))
-
-    center_radius = (center_x - point_1.x) ** 2 + (center_y - point_1.y) ** 2
-
-    return center_x, center_y, center_radius
+    return circumcircle(point_1.x, point_1.y, point_2.x, point_2.y, point_3.x, point_3.y)[:3]
 
 
 def calc_area(vertices, points):
@@ -58,12 +43,13 @@ def calc_area(vertices, points):
 
 
 class Triangle:
+    __slots__ = ('vertices', 'area', 'edges', 'circumcircle')
 
-    def __init__(self, vertices: Tuple[int, int, int], points):
+    def __init__(self, vertices: Tuple[int, int, int], points, area: float = None, circumcircle=None):
         self.vertices = vertices
-        self.area = calc_area(vertices, points)
+        self.area = calc_area(vertices, points) if area is None else area
         self.edges = (Edge(vertices[0], vertices[1]), Edge(vertices[1], vertices[2]), Edge(vertices[2], vertices[0]))
-        self.circumcircle = calc_circumcircle(vertices, points)
+        self.circumcircle = calc_circumcircle(vertices, points) if circumcircle is None else circumcircle
 
     def __eq__(self, other):
         return self.vertices == other.vertices
@@ -99,19 +85,367 @@ def in_circumcircle(triangle: Triangle, target: Point):
     return False
 
 
+BOWYER_WATSON, NEIGHBOR_WALK = 0, 1
+# Orders the neighbor walk engine can insert points in, the curves can also be used to renumber a finished
+# triangulation, see Triangulation.reorder.
+SNAKE, HILBERT, MORTON, BRIO = 0, 1, 2, 3
+
+SUPER_TRIANGLE = ((-2.5, -2.5), (0, 2.5), (2.5, 0))
+SUPER_TRIANGLE_REACH = 0.8  # the largest square [-r, r] the unscaled super triangle fully contains.
+
+
+def create_super_points(points: List[Point]):
+    reach = max((max(abs(p.x), abs(p.y)) for p in points), default=0)
+    scale = max(1.0, reach / SUPER_TRIANGLE_REACH)
+    return tuple(Point(x*scale, y*scale) for x, y in SUPER_TRIANGLE)
+
+
+def canonical_triangles(triangles: np.ndarray):
+    # Counter-clockwise kernel triangles to the legacy engine's form: clockwise, starting from the most
+    # recently inserted vertex.
+    triangles = triangles[:, ::-1]
+    rotation = (triangles.argmax(axis=1)[:, None] + np.arange(3)) % 3
+    return np.take_along_axis(triangles, rotation, axis=1)
+
+
+def snake_order(points: List[Point]):
+    # Sweeps vertical strips alternately up and down, so consecutive points stay close together and the
+    # point location walk between them only takes a few steps.
+    if not points:
+        return []
+    strips = max(1, int((len(points) / 2) ** 0.5))
+    min_x = min(p.x for p in points)
+    width = (max(p.x for p in points) - min_x) / strips or 1.0
+
+    def key(index):
+        p = points[index]
+        strip = min(int((p.x - min_x) / width), strips - 1)
+        return strip, p.y if strip % 2 == 0 else -p.y
+
+    return sorted(range(len(points)), key=key)
+
+
+def curve_keys(coords: np.ndarray, curve: int = HILBERT) -> np.ndarray:
+    if curve == HILBERT:
+        return hilbert_keys(coords)
+    if curve == MORTON:
+        return morton_keys(coords)
+    raise ValueError(f"{curve} is not a space filling curve.")
+
+
+def insertion_order(points: List[Point], order: int = SNAKE) -> List[int]:
+    # BRIO makes the fewest, shortest walks: on 100k random points it inserts about 30% faster than SNAKE.
+    if order == SNAKE:
+        return snake_order(points)
+    if order == BRIO:
+        return brio_order(coords_from_points(points)).tolist()
+    return np.argsort(curve_keys(coords_from_points(points), order), kind='stable').tolist()
+
+
+def repeated_points(coords: np.ndarray) -> np.ndarray:
+    # Whether each position already came up earlier in coords.
+    order = np.lexsort((coords[:, 1], coords[:, 0]))
+    ordered = coords[order]
+    repeated = np.zeros(len(coords), dtype=bool)
+    repeated[order[1:]] = (ordered[1:] == ordered[:-1]).all(axis=1)
+    return repeated
+
+
+def insert_points(kernel: 'DelaunayKernel', indices: List[int]):
+    # Inserts the points one at a time. When recording, the cavity of every insert is counted in a loop of
+    # its own so the usual one carries no hooks.
+    recorder = instrument.active()
+    if recorder is None:
+        for index in indices:
+            kernel.insert(index)
+        return
+    destroyed = created = 0
+    for index in indices:
+        cavity, new_triangles = kernel.insert(index)
+        destroyed += len(cavity)
+        created += len(new_triangles)
+        recorder.observe('triangulation.cavity_size', len(cavity))
+    recorder.count('triangulation.points_inserted', len(indices))
+    recorder.count('triangulation.triangles_destroyed', destroyed)
+    recorder.count('triangulation.triangles_created', created)
+
+
+class DelaunayKernel:
+    # Incremental Bowyer-Watson with triangle adjacency. Each point is located by walking across neighbors
+    # from the last created triangle and its cavity is flooded out from there, so an insertion only touches
+    # its own neighborhood. Triangles are stored flat and counter-clockwise: triangle t is vertices[3t:3t+3]
+    # and neighbors[3t+i] is the triangle across the edge (vertices[3t+i], vertices[3t+(i+1)%3]) or -1.
+    # circles[5t:5t+5] caches each circumcircle along with its error bounds, see predicates.circumcircle.
+
+    def __init__(self, xs: List[float], ys: List[float]):
+        self.xs = xs
+        self.ys = ys
+        self.vertices: List[int] = []
+        self.neighbors: List[int] = []
+        self.circles: List[float] = []
+        self.alive: List[bool] = []
+        self.free: List[int] = []
+        self.last = 0
+
+    def add_triangle(self, a: int, b: int, c: int):
+        xs, ys = self.xs, self.ys
+        circle = circumcircle(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c])
+        if self.free:
+            t = self.free.pop()
+            self.vertices[3*t:3*t+3] = a, b, c
+            self.circles[5*t:5*t+5] = circle
+            self.alive[t] = True
+        else:
+            t = len(self.alive)
+            self.vertices.extend((a, b, c))
+            self.neighbors.extend((-1, -1, -1))
+            self.circles.extend(circle)
+            self.alive.append(True)
+        return t
+
+    def locate(self, x: float, y: float):
+        xs, ys, vertices, neighbors = self.xs, self.ys, self.vertices, self.neighbors
+        t = self.last
+        start = 0
+        while True:
+            base = 3*t
+            start = (start + 1) % 3
+            for i in (start, (start + 1) % 3, (start + 2) % 3):
+                s, e = vertices[base+i], vertices[base+(i+1) % 3]
+                left = (xs[e] - xs[s]) * (y - ys[s])
+                right = (ys[e] - ys[s]) * (x - xs[s])
+                bound = ORIENT_BOUND * (abs(left) + abs(right))
+                if left - right < bound and (left - right < -bound or
+                                             orient2d_exact(xs[s], ys[s], xs[e], ys[e], x, y) < 0):
+                    t = neighbors[base+i]
+                    if t < 0:
+                        raise ValueError(f"{x, y} lies outside of the triangulation.")
+                    break
+            else:
+                return t
+
+    def insert(self, index: int):
+        xs, ys = self.xs, self.ys
+        x, y = xs[index], ys[index]
+        vertices, neighbors, circles, alive = self.vertices, self.neighbors, self.circles, self.alive
+
+        start = self.locate(x, y)
+        for vertex in vertices[3*start:3*start+3]:
+            if self.xs[vertex] == x and self.ys[vertex] == y:
+                raise ValueError(f"{x, y} is already a vertex of the triangulation.")
+        cavity = {start}
+        stack = [start]
+        boundary = []
+        while stack:
+            t = stack.pop()
+            base = 3*t
+            for i in range(3):
+                other = neighbors[base+i]
+                if other in cavity:
+                    continue
+                if other >= 0:
+                    # The cached circle settles almost every test without a division, only points too close
+                    # to call against it, or circles at infinity, fall through to the exact incircle.
+                    center_x, center_y, radius, dist_error, error = circles[5*other:5*other+5]
+                    dx, dy = center_x - x, center_y - y
+                    dist = dx*dx + dy*dy
+                    margin = dist * dist_error + error
+                    if radius - dist < -margin:
+                        inside = False
+                    elif radius - dist > margin:
+                        inside = True
+                    else:
+                        a, b, c = vertices[3*other:3*other+3]
+                        inside = incircle(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c], x, y) > 0
+                    if inside:
+                        cavity.add(other)
+                        stack.append(other)
+                        continue
+                boundary.append((vertices[base+i], vertices[base+(i+1) % 3], other))
+
+        for t in cavity:
+            alive[t] = False
+            self.free.append(t)
+
+        by_start = {}
+        by_end = {}
+        for s, e, other in boundary:
+            t = self.add_triangle(s, e, index)
+            neighbors[3*t] = other
+            if other >= 0:
+                base = 3*other
+                for i in range(3):
+                    if vertices[base+i] == e and vertices[base+(i+1) % 3] == s:
+                        neighbors[base+i] = t
+                        break
+            by_start[s] = t
+            by_end[e] = t
+
+        for s, t in by_start.items():
+            e = vertices[3*t+1]
+            neighbors[3*t+1] = by_start[e]
+            neighbors[3*t+2] = by_end[s]
+
+        self.last = t
+        return cavity, by_start.values()
+
+    def star(self, index: int):
+        # The triangles around a vertex and the outer edges of its star, in counter-clockwise order.
+        vertices, neighbors = self.vertices, self.neighbors
+        start = t = self.locate(self.xs[index], self.ys[index])
+        star = []
+        boundary = []
+        while True:
+            base = 3*t
+            i = vertices[base:base+3].index(index)
+            star.append(t)
+            boundary.append((vertices[base+(i+1) % 3], vertices[base+(i+2) % 3], neighbors[base+(i+1) % 3]))
+            t = neighbors[base+(i+2) % 3]
+            if t == start:
+                return star, boundary
+
+    def remove(self, index: int):
+        # Deletes a vertex and fills the hole it leaves by clipping Delaunay ears off its link polygon: an
+        # ear is only cut once no other link vertex falls inside its circumcircle.
+        xs, ys, vertices, neighbors = self.xs, self.ys, self.vertices, self.neighbors
+        star, boundary = self.star(index)
+        outside = {(s, e): other for s, e, other in boundary}
+        polygon = [s for s, _, _ in boundary]
+
+        ears = []
+        while len(polygon) > 3:
+            candidate = None
+            for k in range(len(polygon)):
+                a, b, c = polygon[k-1], polygon[k], polygon[(k+1) % len(polygon)]
+                if orient2d(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c]) <= 0:
+                    continue
+                if candidate is None:
+                    candidate = k
+                if all(incircle(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c], xs[other], ys[other]) <= 0
+                       for other in polygon if other not in (a, b, c)):
+                    candidate = k
+                    break
+            ears.append((polygon[candidate-1], polygon[candidate], polygon[(candidate+1) % len(polygon)]))
+            del polygon[candidate]
+        ears.append(tuple(polygon))
+
+        for t in star:
+            self.alive[t] = False
+            self.free.append(t)
+
+        half_edges = {}
+        created = []
+        for a, b, c in ears:
+            t = self.add_triangle(a, b, c)
+            created.append(t)
+            for i, (s, e) in enumerate(((a, b), (b, c), (c, a))):
+                if (e, s) in half_edges:
+                    other, j = half_edges.pop((e, s))
+                    neighbors[3*t+i] = other
+                    neighbors[3*other+j] = t
+                elif (s, e) in outside:
+                    other = outside[s, e]
+                    neighbors[3*t+i] = other
+                    if other >= 0:
+                        base = 3*other
+                        neighbors[base + [vertices[base+j] == e and vertices[base+(j+1) % 3] == s
+                                          for j in range(3)].index(True)] = t
+                else:
+                    half_edges[s, e] = t, i
+
+        self.last = created[-1]
+        return star, created
+
+
+class TriangulationEdit:
+    # What an edit did to the mesh: the rows now holding new triangles, the vertices of the triangles that
+    # are gone, and the (from, to) rows that were moved down to fill holes left in the mesh.
+
+    def __init__(self, created: np.ndarray, destroyed: np.ndarray, moved: np.ndarray):
+        self.created: np.ndarray = created
+        self.destroyed: np.ndarray = destroyed
+        self.moved: np.ndarray = moved
+
+    def __repr__(self):
+        return f"created: {len(self.created)}, destroyed: {len(self.destroyed)}, moved: {len(self.moved)}"
+
+
 class Triangulation:
 
-    def __init__(self, points: List[Point]):
-        self.points = points
-        self.triangles: List[Triangle] = []
+    def __init__(self, points: List[Point], engine: int = NEIGHBOR_WALK, order: int = SNAKE):
+        # The points are copied since the super triangle's points are added to the end of them.
+        self._points: List[Point] = points_from_coords(points) if isinstance(points, np.ndarray) else list(points)
+        self.engine = engine
+        self.order = order
+        # Set by reorder, the index each point had before the triangulation renumbered them.
+        self.original_indices: np.ndarray = None
+        self.mesh: TriangleMesh = None
+        self._triangles: List[Triangle] = None
+
+        self.super_indices: Tuple[int, int, int] = (len(self.points), len(self.points)+1, len(self.points)+2)
+        # Built for incremental edits, along with which mesh row each of its triangle slots is stored in.
+        self.kernel: DelaunayKernel = None
+        self.slot_rows: List[int] = []
+        self.row_slots: List[int] = []
+        # Points in no triangle, though they keep their index and coordinates: ones taken out by remove and
+        # ones a build skipped for repeating an earlier point.
+        self.removed: Set[int] = set()
 
         self.calculate_triangulation()
 
+    @classmethod
+    def from_mesh(cls, mesh: TriangleMesh, super_indices: Tuple[int, int, int], engine: int = NEIGHBOR_WALK):
+        # A finished triangulation around an existing mesh. Nothing is recalculated and the Point objects
+        # are only made if something asks for them.
+        triangulation = cls.__new__(cls)
+        triangulation._points = None
+        triangulation.engine = engine
+        triangulation.order = SNAKE
+        triangulation.original_indices = None
+        triangulation.mesh = mesh
+        triangulation._triangles = None
+        triangulation.super_indices = tuple(super_indices)
+        triangulation.kernel = None
+        triangulation.slot_rows = []
+        triangulation.row_slots = []
+        triangulation.removed = set()
+        return triangulation
+
+    @property
+    def points(self) -> List[Point]:
+        if self._points is None:
+            self._points = points_from_coords(self.mesh.coords)
+        return self._points
+
+    @property
+    def triangles(self) -> List[Triangle]:
+        # Triangle objects are only built when something asks for them, everything else reads self.mesh.
+        if self._triangles is None:
+            mesh = self.mesh
+            self._triangles = [Triangle(tuple(vertices), self.points, area, tuple(circumcircle))
+                               for vertices, area, circumcircle in zip(mesh.triangles.tolist(),
+                                                                       mesh.areas.tolist(),
+                                                                       mesh.circumcircles.tolist())]
+        return self._triangles
+
     def calculate_triangulation(self):
-        self.points.extend((Point(-2.5, -2.5), Point(0, 2.5), Point(2.5, 0)))
+        with instrument.span('triangulation.build', engine=self.engine, points=len(self.points)):
+            self.removed = set(np.flatnonzero(repeated_points(coords_from_points(self.points))).tolist())
+            if self.engine == BOWYER_WATSON:
+                triangles = self.calculate_bowyer_watson()
+            elif self.engine == NEIGHBOR_WALK:
+                triangles = self.calculate_neighbor_walk()
+            else:
+                raise ValueError(f"{self.engine} is not a valid triangulation engine.")
+            self.mesh = TriangleMesh(np.array([(p.x, p.y) for p in self.points], dtype=np.float64), triangles)
+
+    def calculate_bowyer_watson(self):
+        self.points.extend(create_super_points(self.points))
         calculation_triangles = [Triangle((-3, -2, -1), self.points)]
         valid_triangles = []
         for index, point in enumerate(self.points[:-3]):
+            if index in self.removed:
+                continue
             check_edges = []
             for triangle in calculation_triangles.copy():
                 if triangle.circumcircle[2] < (point.x - triangle.circumcircle[0])**2:
@@ -127,12 +461,280 @@ class Triangulation:
 
         valid_triangles.extend((triangle for triangle in calculation_triangles if
                                 not (triangle.vertices[0] < 0 or triangle.vertices[1] < 0 or triangle.vertices[2] < 0)))
-        self.triangles = valid_triangles
+        self._triangles = valid_triangles
+        return np.array([triangle.vertices for triangle in valid_triangles], dtype=np.int32).reshape(-1, 3)
+
+    def calculate_neighbor_walk(self):
+        num_points = len(self.points)
+        self.points.extend(create_super_points(self.points))
+        kernel = DelaunayKernel([p.x for p in self.points], [p.y for p in self.points])
+        kernel.add_triangle(num_points, num_points+2, num_points+1)
+        indices = [index for index in range(num_points) if index not in self.removed]
+        insert_points(kernel, [indices[i] for i in insertion_order([self.points[i] for i in indices], self.order)])
+
+        # The kernel's lists take several times the memory of the mesh and most triangulations are never
+        # edited, so it is dropped here and build_kernel makes it again for the first edit.
+        triangles = np.array(kernel.vertices, dtype=np.int32).reshape(-1, 3)
+        slots = np.flatnonzero(np.array(kernel.alive, dtype=bool) & (triangles < num_points).all(axis=1))
+        return canonical_triangles(triangles[slots])
+
+    def build_kernel(self):
+        # Triangulations get a kernel the first time they are edited. The mesh's own triangles go into it
+        # as they are, triangle t in slot t, so ties between cocircular points keep whichever diagonals the
+        # mesh has, however it was built or renumbered. Only the triangles out to the super triangle are
+        # worked out again, from the points on the mesh's boundary and those in no triangle: every
+        # triangle of the full triangulation touching the super triangle has a circle empty of all the
+        # points, so it is a triangle of theirs as well.
+        instrument.count('triangulation.kernels_rebuilt')
+        mesh = self.mesh
+        num_rows = len(mesh)
+        first, second, third = self.super_indices
+        kernel = DelaunayKernel(mesh.coords[:, 0].tolist(), mesh.coords[:, 1].tolist())
+        # Kernel triangles run counter-clockwise, so mesh triangle (a, b, c) is (c, b, a) and its edges
+        # (c, b), (b, a) and (a, c) are the twins of the mesh's half-edges 1, 0 and 2.
+        kernel.vertices = mesh.triangles[:, ::-1].reshape(-1).tolist()
+        twins = mesh.halfedges.reshape(-1, 3)[:, [1, 0, 2]].reshape(-1)
+        kernel.neighbors = np.where(twins < 0, -1, twins // 3).tolist()
+        xs, ys = kernel.xs, kernel.ys
+        for a, b, c in mesh.triangles[:, ::-1].tolist():
+            kernel.circles.extend(circumcircle(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c]))
+        kernel.alive = [True] * num_rows
+
+        boundary = np.flatnonzero(mesh.halfedges < 0)
+        used = np.zeros(len(mesh.coords), dtype=bool)
+        used[mesh.triangles.reshape(-1)] = True
+        used[list(self.removed.union(self.super_indices))] = True
+        # Points on the boundary come first, so they are the ones kept where a mesh from elsewhere, like a map
+        # cache, still has repeated points in no triangle.
+        outer_points = np.concatenate((np.unique(mesh.triangles.reshape(-1)[boundary]), np.flatnonzero(~used)))
+        outer_points = outer_points[~repeated_points(mesh.coords[outer_points])].tolist()
+        outer = DelaunayKernel([xs[index] for index in outer_points] + [xs[first], xs[second], xs[third]],
+                               [ys[index] for index in outer_points] + [ys[first], ys[second], ys[third]])
+        count = len(outer_points)
+        outer.add_triangle(count, count+2, count+1)
+        insert_points(outer, insertion_order(points_from_coords(mesh.coords[outer_points]), self.order))
+
+        # The outer triangles are linked to each other and to the mesh's boundary through their edges.
+        names = outer_points + [first, second, third]
+        edges = {}
+        for row, edge in zip((boundary // 3).tolist(), (boundary % 3).tolist()):
+            # Mesh half-edge i is kernel edge (1, 0, 2)[i] of the same triangle.
+            k = (1, 0, 2)[edge]
+            edges[kernel.vertices[3*row+k], kernel.vertices[3*row+(k+1) % 3]] = row, k
+        for slot in range(len(outer.alive)):
+            vertices = outer.vertices[3*slot:3*slot+3]
+            if not outer.alive[slot] or all(vertex < count for vertex in vertices):
+                continue
+            a, b, c = (names[vertex] for vertex in vertices)
+            t = kernel.add_triangle(a, b, c)
+            for i, (s, e) in enumerate(((a, b), (b, c), (c, a))):
+                other = edges.pop((e, s), None)
+                if other is None:
+                    edges[s, e] = t, i
+                else:
+                    kernel.neighbors[3*t+i] = other[0]
+                    kernel.neighbors[3*other[0]+other[1]] = t
+        if any(t < num_rows for t, _ in edges.values()):
+            raise ValueError("the mesh's boundary doesn't match the triangulation of its points.")
+        kernel.last = len(kernel.alive) - 1
+        self.kernel = kernel
+        self.row_slots = list(range(num_rows))
+        self.slot_rows = self.row_slots + [-1] * (len(kernel.alive) - num_rows)
+
+    @instrument.timed('triangulation.reorder')
+    def reorder(self, curve: int = HILBERT) -> Tuple[np.ndarray, np.ndarray]:
+        # Renumbers the points along a space filling curve, with the super triangle's points moved to the
+        # end, and sorts the triangles by where their centroids fall on it, so whatever walks the mesh goes
+        # through memory mostly in order. Returns the old index of each new point and of each new triangle.
+        # Anything built on the old numbering, like a PointMap, has to be made again. The triangles
+        # themselves don't change, so ties between cocircular points keep the diagonals they had, and edits
+        # work afterwards whether or not there is a kernel yet: one that was built is renamed below, and
+        # otherwise build_kernel makes one from the reordered mesh on the first edit.
+        mesh = self.mesh
+        num_coords = len(mesh.coords)
+        supers = np.array(self.super_indices, dtype=np.int64)
+        real = np.setdiff1d(np.arange(num_coords), supers)
+        point_order = np.concatenate((real[np.argsort(curve_keys(mesh.coords[real], curve), kind='stable')], supers))
+        point_inverse = np.empty(num_coords, dtype=np.int64)
+        point_inverse[point_order] = np.arange(num_coords)
+
+        coords = mesh.coords[point_order]
+        centroids = mesh.coords[mesh.triangles].mean(axis=1) if len(mesh) else np.zeros((0, 2))
+        triangle_order = np.argsort(curve_keys(centroids, curve), kind='stable')
+        triangle_inverse = np.empty(len(mesh), dtype=np.int64)
+        triangle_inverse[triangle_order] = np.arange(len(mesh))
+        triangles = point_inverse[mesh.triangles[triangle_order]]
+        self.mesh = TriangleMesh(coords, canonical_triangles(triangles[:, ::-1]))
+
+        if self._points is not None:
+            self._points = [self._points[index] for index in point_order.tolist()]
+        self._triangles = None
+        self.super_indices = tuple(point_inverse[supers].tolist())
+        self.removed = set(point_inverse[list(self.removed)].tolist())
+        self.original_indices = point_order if self.original_indices is None else self.original_indices[point_order]
+
+        # The kernel's triangles keep their slots, only their vertices and rows are renamed.
+        if self.kernel is not None:
+            kernel = self.kernel
+            kernel.xs = coords[:, 0].tolist()
+            kernel.ys = coords[:, 1].tolist()
+            kernel.vertices = point_inverse[np.array(kernel.vertices, dtype=np.int64)].tolist()
+            self.row_slots = [self.row_slots[row] for row in triangle_order.tolist()]
+            self.slot_rows = [-1] * len(self.slot_rows)
+            for row, slot in enumerate(self.row_slots):
+                self.slot_rows[slot] = row
+        return point_order, triangle_order
+
+    def in_super_triangle(self, p: Point):
+        a, b, c = (self.points[index] for index in self.super_indices)
+        return all((e.x - s.x) * (p.y - s.y) - (e.y - s.y) * (p.x - s.x) > 0 for s, e in ((a, c), (c, b), (b, a)))
+
+    def is_valid_slot(self, slot: int):
+        return self.kernel.alive[slot] and not any(vertex in self.super_indices
+                                                   for vertex in self.kernel.vertices[3*slot:3*slot+3])
+
+    def insert(self, new_point: Point) -> 'TriangulationEdit':
+        return self.insert_many([new_point])
+
+    def insert_many(self, new_points: List[Point]) -> 'TriangulationEdit':
+        if isinstance(new_points, np.ndarray):
+            new_points = points_from_coords(new_points)
+        if self.kernel is None:
+            self.build_kernel()
+        kernel = self.kernel
+        # Everything is checked before anything changes, so a rejected batch leaves no stray points behind.
+        seen = set()
+        for p in new_points:
+            if not self.in_super_triangle(p):
+                raise ValueError(f"{p.x, p.y} lies outside of the triangulation.")
+            start = kernel.locate(p.x, p.y)
+            if (p.x, p.y) in seen or any(kernel.xs[vertex] == p.x and kernel.ys[vertex] == p.y
+                                         for vertex in kernel.vertices[3*start:3*start+3]):
+                raise ValueError(f"{p.x, p.y} is already a vertex of the triangulation.")
+            seen.add((p.x, p.y))
+        first = len(self.points)
+        self.points.extend(new_points)
+        kernel.xs.extend(p.x for p in new_points)
+        kernel.ys.extend(p.y for p in new_points)
+        self.mesh.add_coords(np.array([(p.x, p.y) for p in new_points], dtype=np.float64).reshape(-1, 2))
+
+        recorder = instrument.active()
+        destroyed, created = set(), set()
+        with instrument.span('triangulation.insert_many', points=len(new_points)):
+            try:
+                for index in insertion_order(new_points, self.order):
+                    cavity, new_triangles = kernel.insert(first + index)
+                    destroyed.update(cavity - created)
+                    created.difference_update(cavity)
+                    created.update(new_triangles)
+                    if recorder is not None:
+                        recorder.observe('triangulation.cavity_size', len(cavity))
+                        recorder.count('triangulation.points_inserted')
+                        recorder.count('triangulation.triangles_destroyed', len(cavity))
+                        recorder.count('triangulation.triangles_created', len(new_triangles))
+            finally:
+                edit = self.apply_kernel_changes(destroyed, created)
+        return edit
+
+    def remove(self, index: int) -> 'TriangulationEdit':
+        # The point keeps its index but is left out of every triangle.
+        if index in self.super_indices or not 0 <= index < len(self.mesh.coords):
+            raise IndexError(f"{index} is not a point of the triangulation that can be removed.")
+        if index in self.removed:
+            raise ValueError(f"{index} is in no triangle, it was removed or repeats an earlier point.")
+        if self.kernel is None:
+            self.build_kernel()
+        with instrument.span('triangulation.remove'):
+            star, created = self.kernel.remove(index)
+            self.removed.add(index)
+            instrument.count('triangulation.points_removed')
+            instrument.count('triangulation.triangles_destroyed', len(star))
+            instrument.count('triangulation.triangles_created', len(created))
+            return self.apply_kernel_changes(set(star), set(created))
+
+    def apply_kernel_changes(self, destroyed_slots, created_slots) -> 'TriangulationEdit':
+        # Patches the mesh after the kernel has changed. Rows of destroyed triangles are reused for created
+        # ones first, then the mesh grows, or the last rows move down into any holes that are left.
+        kernel, mesh, slot_rows, row_slots = self.kernel, self.mesh, self.slot_rows, self.row_slots
+        slot_rows.extend([-1] * (len(kernel.alive) - len(slot_rows)))
+        holes = sorted(slot_rows[slot] for slot in destroyed_slots if slot_rows[slot] >= 0)
+        destroyed = mesh.triangles[holes].copy()
+        for slot in destroyed_slots:
+            slot_rows[slot] = -1
+        mesh.unlink_rows(holes)
+
+        created_slots = sorted(slot for slot in created_slots if self.is_valid_slot(slot))
+        appended = max(0, len(created_slots) - len(holes))
+        rows = holes[:len(created_slots)] + list(range(len(mesh), len(mesh) + appended))
+        holes = holes[len(created_slots):]
+        mesh.resize(len(mesh) + appended)
+        row_slots.extend([-1] * appended)
+
+        for slot, row in zip(created_slots, rows):
+            slot_rows[slot] = row
+            row_slots[row] = slot
+        if created_slots:
+            triangles = np.array([kernel.vertices[3*slot:3*slot+3] for slot in created_slots], dtype=np.int32)
+            mesh.set_rows(rows, canonical_triangles(triangles))
+        for slot, row in zip(created_slots, rows):
+            self.link_row(slot, row)
+
+        moved = []
+        hole_set = set(holes)
+        end = len(mesh)
+        for hole in holes:
+            while end > hole and end - 1 in hole_set:
+                end -= 1
+            if hole >= end:
+                break
+            end -= 1
+            mesh.move_row(end, hole)
+            row_slots[hole] = row_slots[end]
+            slot_rows[row_slots[hole]] = hole
+            moved.append((end, hole))
+        mesh.resize(end)
+        del row_slots[end:]
+
+        self._triangles = None
+        return TriangulationEdit(np.array(rows, dtype=np.int32), destroyed,
+                                 np.array(moved, dtype=np.int32).reshape(-1, 2))
+
+    def link_row(self, slot: int, row: int):
+        # Points the row's half-edges at their twins using the kernel's adjacency, kernel triangles run
+        # counter-clockwise so each mesh edge (s, e) is the kernel edge (e, s).
+        kernel, mesh = self.kernel, self.mesh
+        kernel_vertices = kernel.vertices[3*slot:3*slot+3]
+        triangle = mesh.triangles[row].tolist()
+        for i in range(3):
+            s, e = triangle[i], triangle[(i+1) % 3]
+            k = [kernel_vertices[k] == e and kernel_vertices[(k+1) % 3] == s for k in range(3)].index(True)
+            other_slot = kernel.neighbors[3*slot+k]
+            other_row = self.slot_rows[other_slot] if other_slot >= 0 else -1
+            if other_row < 0:
+                mesh.halfedges[3*row+i] = -1
+                continue
+            other = mesh.triangles[other_row].tolist()
+            j = [other[j] == e and other[(j+1) % 3] == s for j in range(3)].index(True)
+            mesh.halfedges[3*row+i] = 3*other_row+j
+            mesh.halfedges[3*other_row+j] = 3*row+i
 
     def point_data(self):
         for point in self.points:
             yield from point.data()
 
     def indices(self):
-        for tri in self.triangles:
-            yield from tri.edge_data()
+        yield from self.mesh.edges().reshape(-1).tolist()
+
+    def voronoi(self, low=(-1.0, -1.0), high=(1.0, 1.0)) -> VoronoiDiagram:
+        # The Voronoi cells of the triangulated points, clipped to the box from low to high.
+        return voronoi_diagram(self.mesh, low, high)
+
+    # The buffer methods return contiguous numpy arrays which can go straight to ctx.buffer.
+    def vertex_buffer(self) -> np.ndarray:
+        return self.mesh.coords.astype(np.float32)
+
+    def triangle_buffer(self) -> np.ndarray:
+        return self.mesh.triangles
+
+    def line_buffer(self) -> np.ndarray:
+        return self.mesh.lines()